@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+
+# ==========================================
+# НАГРУЗОЧНЫЙ ПРОГОН AI-ОБРАБОТЧИКОВ БЕЗ НАСТОЯЩЕГО API
+# ==========================================
+# Гоняет N клиентов одновременно через AIManager (программа тренировок, меню, анализ прогресса)
+# на локальной заглушке services/fake_llm_server.py или на записанной кассете (services/ai_cassette.py).
+#   python ai_bench.py --clients 20 --delay 0.8 --jitter 0.4 --error-rate 0.05
+#   python ai_bench.py --clients 20 --record     # заодно записать ответы в кассету
+#   python ai_bench.py --clients 20 --replay     # повторить прогон по кассете, без сети (сравнение промптов)
+
+WORKOUT_REPLY = "===PAGE_BREAK===".join(
+    [
+        f"📅 <b>День {n} — {'Верх тела' if n % 2 else 'Низ тела'}</b>\n"
+        f"<b>1.</b> <code>Жим гантелей лежа</code> — 3x12\n<b>2.</b> <code>Приседания с гантелями</code> — 3x15\n"
+        f"<b>3.</b> <code>Планка</code> — 3x40 сек"
+        if n in (1, 3, 5) else f"📅 <b>День {n} — ВОССТАНОВЛЕНИЕ</b>\nПрогулка 30-40 минут, растяжка."
+        for n in range(1, 8)
+    ] + ["💡 <b>Советы тренера</b>\nСпи 7-8 часов, пей воду, прибавляй вес постепенно."]
+)
+NUTRITION_REPLY = "===PAGE_BREAK===".join([
+    "🍳 <b>Завтрак</b>\nОвсянка на молоке 60 г, банан, 2 яйца.\nКБЖУ: 520 ккал, Б 28, Ж 18, У 62",
+    "🍲 <b>Обед</b>\nКуриная грудка 150 г, гречка 70 г, овощной салат.\nКБЖУ: 610 ккал, Б 45, Ж 15, У 70",
+    "🥗 <b>Ужин</b>\nЗапеченная рыба 180 г, овощи на пару.\nКБЖУ: 430 ккал, Б 38, Ж 16, У 25",
+    "🥪 <b>Перекус</b>\nТворог 5% 150 г, горсть орехов.\nКБЖУ: 300 ккал, Б 27, Ж 16, У 9",
+    "🛒 <b>Список покупок</b>\n- Овсянка\n- Бананы\n- Яйца\n- Куриная грудка\n- Гречка\n- Рыба\n- Творог",
+])
+ANALYSIS_REPLY = (
+    "📉 Вес уверенно снижается\n\n<b>Анализ:</b> Минус 1.2 кг при трех тренировках в неделю — хороший темп.\n"
+    "<b>Рекомендация:</b> Добавь 2000 шагов в день, чтобы не упереться в плато."
+)
+# Маркеры ищутся в тексте запроса: по ним заглушка понимает, какую задачу ей прислали
+SCRIPTED_REPLIES = [
+    ("Проанализируй прогресс", ANALYSIS_REPLY),
+    ("ДАННЫЕ КЛИЕНТА", NUTRITION_REPLY),
+    ("АНКЕТА КЛИЕНТА", WORKOUT_REPLY),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон AIManager на заглушке или кассете")
+    parser.add_argument("--clients", type=int, default=10, help="Сколько клиентов одновременно")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.5, help="Задержка заглушки перед ответом, сек")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cassette", default="cassettes/bench.jsonl")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", action="store_true", help="Писать ответы заглушки в кассету")
+    mode.add_argument("--replay", action="store_true", help="Отвечать из кассеты, заглушка не запускается")
+    parser.add_argument("--realtime", action="store_true", help="В replay выдерживать записанные задержки")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+
+# Config читает окружение при импорте — направляем AI на заглушку до импорта сервисов
+os.environ.update({
+    "DEEPSEEK_BASE_URL": f"http://127.0.0.1:{ARGS.port}/v1",
+    "DEEPSEEK_API_KEY": "fake",
+    "AI_PROVIDERS": "deepseek",
+    "AI_FAST_ROUTE": "deepseek",
+    "AI_SMART_ROUTE": "deepseek",
+    "AI_HTTP2": "0",
+    "AI_WARMUP_CONNECTIONS": "0",
+    "AI_CASSETTE": "record" if ARGS.record else "replay" if ARGS.replay else "",
+    "AI_CASSETTE_PATH": ARGS.cassette,
+    "AI_CASSETTE_REALTIME": "1" if ARGS.realtime else "0",
+})
+
+from services.fake_llm_server import FakeLLMServer  # noqa: E402
+from services.ai_manager import AIManager, task_telemetry  # noqa: E402
+
+
+def client_profile(i: int) -> dict:
+    """Разные анкеты, чтобы запросы не склеивались и не брались из кэша ответов"""
+    return {
+        "name": f"Клиент {i}", "gender": "male" if i % 2 else "female", "age": 20 + i % 30,
+        "weight": 60 + i, "height": 160 + i % 30, "goal": ["weight_loss", "muscle_gain", "maintenance"][i % 3],
+        "workout_level": "beginner", "workout_days": 3, "activity_level": "medium",
+        "wishes": "Нет особых пожеланий.",
+    }
+
+
+async def timed(results: dict, name: str, coro):
+    started = time.perf_counter()
+    try:
+        pages = await coro
+        failed = any("❌" in str(p) for p in (pages if isinstance(pages, list) else [pages]))
+    except Exception as e:
+        logging.error(f"{name}: {e}")
+        failed = True
+    results.setdefault(name, []).append((time.perf_counter() - started, failed))
+
+
+async def one_client(i: int, results: dict):
+    ai = AIManager()
+    user = client_profile(i)
+    await asyncio.gather(
+        timed(results, "workout", ai.generate_workout_pages(user)),
+        timed(results, "nutrition", ai.generate_nutrition_pages(user)),
+        timed(results, "analysis", ai.analyze_progress(user, user["weight"] - 1.2, workouts_count=3)),
+    )
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))] if values else 0.0
+
+
+async def main():
+    logging.basicConfig(level=logging.WARNING)
+    server = None
+    if not ARGS.replay:
+        server = FakeLLMServer(
+            delay=ARGS.delay, jitter=ARGS.jitter, chunk_delay=ARGS.chunk_delay, error_rate=ARGS.error_rate,
+            rate_limit_rate=ARGS.rate_limit_rate, drop_rate=ARGS.drop_rate, seed=ARGS.seed,
+            replies=SCRIPTED_REPLIES,
+        )
+        await server.start(port=ARGS.port)
+
+    results = {}
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(one_client(i, results) for i in range(ARGS.clients)))
+    finally:
+        if server:
+            await server.stop()
+    took = time.perf_counter() - started
+
+    mode = "replay" if ARGS.replay else "record" if ARGS.record else "заглушка"
+    print(f"--- ПРОГОН AI: {ARGS.clients} клиентов, режим {mode}, {took:.2f}с ---")
+    total = 0
+    for name, rows in results.items():
+        latencies = [t for t, _ in rows]
+        errors = sum(1 for _, failed in rows if failed)
+        total += len(rows)
+        print(f"  {name:<10} p50 {percentile(latencies, 0.5):.2f}с  p95 {percentile(latencies, 0.95):.2f}с  "
+              f"ошибок {errors}/{len(rows)}")
+    print(f"  Пропускная способность: {total / took:.1f} запросов/с")
+    if server:
+        print(f"  Заглушка: {server.requests} запросов, внесено сбоев {server.injected}")
+    for task, row in task_telemetry.stats().items():
+        print(f"  [{task}] {row}")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+
+from config import Config
+from services.fake_llm_server import FakeLLMServer
+from services.llm_providers import LLMProvider, LLMRouter, AllProvidersDown
+
+# Проверка роутера провайдеров на локальных заглушках (без настоящих ключей):
+# фейловер, предохранитель после таймаутов подряд и хеджирование чата.
+# Запуск: python ai_failover_test.py
+
+MESSAGES = [{"role": "user", "content": "Дай совет по тренировке"}]
+
+
+async def test():
+    logging.basicConfig(level=logging.INFO)
+    print("--- ПРОВЕРКА РОУТЕРА AI-ПРОВАЙДЕРОВ ---")
+
+    dead = FakeLLMServer(model="dead", hang=True)
+    slow = FakeLLMServer(model="slow", delay=8.0)
+    fast = FakeLLMServer(model="fast", delay=0.2)
+    urls = [await dead.start(port=8101), await slow.start(port=8102), await fast.start(port=8103)]
+
+    try:
+        # 1. Фейловер + предохранитель: первый провайдер висит, запросы уходят на второй
+        router = LLMRouter([
+            LLMProvider("dead", urls[0], "fake", "dead"),
+            LLMProvider("fast", urls[2], "fake", "fast"),
+        ])
+        for i in range(Config.AI_BREAKER_THRESHOLD + 1):
+            started = time.perf_counter()
+            r = await router.complete(MESSAGES, temperature=0.7, timeout=1.0)
+            print(f"  Запрос {i + 1}: ответил {r.model} за {time.perf_counter() - started:.2f}с "
+                  f"(dead: {router.providers[0].state})")
+        assert router.providers[0].state == "open", "Предохранитель не сработал"
+        print("✅ Предохранитель выключил зависшего провайдера, запросы идут сразу на резерв")
+
+        # 2. Хеджирование: основной отвечает 8с, резерв — 0.2с (хедж стартует через AI_HEDGE_DEFAULT_DELAY)
+        router = LLMRouter([
+            LLMProvider("slow", urls[1], "fake", "slow"),
+            LLMProvider("fast", urls[2], "fake", "fast"),
+        ])
+        started = time.perf_counter()
+        r = await router.complete(MESSAGES, temperature=0.7, timeout=10.0, hedge=True)
+        took = time.perf_counter() - started
+        print(f"  Хедж (обычный): ответил {r.model} за {took:.2f}с")
+        assert r.model == "fast" and took < 8.0, "Хедж не сработал"
+
+        started = time.perf_counter()
+        first_at = None
+        text = ""
+        async for delta in router.stream(MESSAGES, temperature=0.7, timeout=10.0, hedge=True):
+            first_at = first_at or time.perf_counter() - started
+            text += delta
+        print(f"  Хедж (стрим): первый кусок через {first_at:.2f}с, {len(text)} символов")
+        assert first_at < 8.0
+        print(f"✅ Хеджирование: {router.stats()['hedges']} запуска резерва, {router.stats()['hedge_wins']} побед")
+
+        # 3. Все выключены — быстрый отказ вместо ожидания
+        router = LLMRouter([LLMProvider("dead", urls[0], "fake", "dead")])
+        for _ in range(Config.AI_BREAKER_THRESHOLD):
+            try:
+                await router.complete(MESSAGES, temperature=0.7, timeout=0.5)
+            except Exception:
+                pass
+        try:
+            await router.complete(MESSAGES, temperature=0.7, timeout=0.5)
+            raise AssertionError("Ожидался AllProvidersDown")
+        except AllProvidersDown:
+            print("✅ Все провайдеры выключены — отказ без ожидания")
+
+        for provider in router.providers:
+            print(f"  {provider.name}: {provider.stats()}")
+        print("🚀 Роутер работает как задумано.")
+    finally:
+        for server in (dead, slow, fast):
+            await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(test())
@@ -0,0 +1,30 @@
+"""add_program_digests
+
+Revision ID: 5b7d2c9e4a13
+Revises: 02eb9461d00f
+Create Date: 2026-10-18 12:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7d2c9e4a13'
+down_revision: Union[str, None] = '02eb9461d00f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('workout_program_history', sa.Column('digest', sa.String(), nullable=True))
+    op.add_column('nutrition_program_history', sa.Column('digest', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('nutrition_program_history') as batch_op:
+        batch_op.drop_column('digest')
+    with op.batch_alter_table('workout_program_history') as batch_op:
+        batch_op.drop_column('digest')
@@ -0,0 +1,29 @@
+"""add_structured_programs
+
+Revision ID: 8e1f3a6c2b57
+Revises: 5b7d2c9e4a13
+Create Date: 2026-10-18 13:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e1f3a6c2b57'
+down_revision: Union[str, None] = '5b7d2c9e4a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('current_workout_structured', sa.String(), nullable=True))
+    op.add_column('users', sa.Column('current_nutrition_structured', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('current_nutrition_structured')
+        batch_op.drop_column('current_workout_structured')
@@ -0,0 +1,37 @@
+"""add_voice_transcripts
+
+Revision ID: b3f8d26e91c4
+Revises: e7a2c95b1d38
+Create Date: 2026-10-18 23:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f8d26e91c4'
+down_revision: Union[str, None] = 'e7a2c95b1d38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('voice_transcripts',
+    sa.Column('file_unique_id', sa.String(), nullable=False),
+    sa.Column('text', sa.String(), nullable=False),
+    sa.Column('duration', sa.Float(), nullable=True),
+    sa.Column('model', sa.String(), nullable=True),
+    sa.Column('hits', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_used_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('file_unique_id')
+    )
+    op.create_index('ix_voice_transcripts_last_used_at', 'voice_transcripts', ['last_used_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_voice_transcripts_last_used_at', table_name='voice_transcripts')
+    op.drop_table('voice_transcripts')
@@ -0,0 +1,39 @@
+"""add_pregenerated_content
+
+Revision ID: c41d7e9a0f23
+Revises: 8e1f3a6c2b57
+Create Date: 2026-10-18 19:50:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41d7e9a0f23'
+down_revision: Union[str, None] = '8e1f3a6c2b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('pregenerated_content',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('text', sa.String(), nullable=False),
+    sa.Column('text_hash', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('used_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_pregenerated_content_kind', 'pregenerated_content', ['kind'])
+    op.create_index('ix_pregenerated_content_text_hash', 'pregenerated_content', ['text_hash'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_pregenerated_content_text_hash', table_name='pregenerated_content')
+    op.drop_index('ix_pregenerated_content_kind', table_name='pregenerated_content')
+    op.drop_table('pregenerated_content')
@@ -0,0 +1,46 @@
+"""add_ai_jobs
+
+Revision ID: e7a2c95b1d38
+Revises: c41d7e9a0f23
+Create Date: 2026-10-18 21:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a2c95b1d38'
+down_revision: Union[str, None] = 'c41d7e9a0f23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ai_jobs',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=True),
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('status_message_id', sa.BigInteger(), nullable=True),
+    sa.Column('payload', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('run_after', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.telegram_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ai_jobs_user_id', 'ai_jobs', ['user_id'])
+    op.create_index('ix_ai_jobs_status', 'ai_jobs', ['status'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ai_jobs_status', table_name='ai_jobs')
+    op.drop_index('ix_ai_jobs_user_id', table_name='ai_jobs')
+    op.drop_table('ai_jobs')
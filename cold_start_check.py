@@ -0,0 +1,35 @@
+import sys
+import subprocess
+
+# Замер холодного старта: сколько занимает импорт хендлеров бота и отдельно загрузка Whisper.
+# Каждый замер — в свежем процессе, чтобы не мешал кэш уже импортированных модулей.
+# Запуск: python cold_start_check.py
+
+IMPORT_HANDLERS = """
+import time
+t = time.perf_counter()
+from handlers import start, help, profile, nutrition, ai_workout, ai_chat, analysis, admin, common, payments
+from services.transcription import speech
+print(f"{time.perf_counter() - t:.2f} {speech.state}")
+"""
+
+LOAD_WHISPER = """
+import time, asyncio
+from services.transcription import speech
+t = time.perf_counter()
+asyncio.run(speech.ensure_ready())
+print(f"{time.perf_counter() - t:.2f} {speech.state}")
+"""
+
+
+def measure(code: str) -> str:
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return "ошибка: " + (result.stderr.strip().splitlines() or ["?"])[-1]
+    return result.stdout.strip().splitlines()[-1]
+
+
+if __name__ == "__main__":
+    print("--- ХОЛОДНЫЙ СТАРТ ---")
+    print(f"Импорт хендлеров (Whisper не грузится): {measure(IMPORT_HANDLERS)}")
+    print(f"Загрузка Whisper в фоне после старта:   {measure(LOAD_WHISPER)}")
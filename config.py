@@ -12,6 +12,89 @@ class Config:
     # Ключи AI
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
     DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
+
+    # Провайдеры AI: адреса можно переопределить (например, на локальный services/fake_llm_server.py)
+    DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+    DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+    GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+    GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+    # Порядок опроса: первый — основной, остальные — резерв
+    AI_PROVIDERS = [p.strip() for p in os.getenv("AI_PROVIDERS", "deepseek,groq").split(",") if p.strip()]
+    # Маршруты задач (см. TASK_ROUTES в services/ai_manager.py): "провайдер:модель" через запятую, первый — основной.
+    # fast — разбор дневников и короткая мотивация, smart — программы, меню, чат. Пустой smart — порядок AI_PROVIDERS.
+    AI_FAST_ROUTE = os.getenv("AI_FAST_ROUTE", "groq:llama-3.1-8b-instant,deepseek")
+    AI_SMART_ROUTE = os.getenv("AI_SMART_ROUTE", "")
+    # Кассеты (services/ai_cassette.py): "record" — писать ответы API в файл, "replay" — отвечать из файла без сети
+    AI_CASSETTE = os.getenv("AI_CASSETTE", "").lower()
+    AI_CASSETTE_PATH = os.getenv("AI_CASSETTE_PATH", "cassettes/ai_calls.jsonl")
+    AI_CASSETTE_REALTIME = os.getenv("AI_CASSETTE_REALTIME", "0") == "1"  # В replay выдерживать записанные задержки
+
+    # Предохранитель: после N таймаутов подряд провайдер отключается на AI_BREAKER_COOLDOWN секунд
+    AI_BREAKER_THRESHOLD = int(os.getenv("AI_BREAKER_THRESHOLD", "3"))
+    AI_BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN", "60"))
+    # Хеджирование чата: через p95 задержки основного провайдера параллельно спрашиваем резервного
+    AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "1") == "1"
+    AI_HEDGE_MIN_DELAY = float(os.getenv("AI_HEDGE_MIN_DELAY", "1.5"))
+    AI_HEDGE_DEFAULT_DELAY = float(os.getenv("AI_HEDGE_DEFAULT_DELAY", "4"))
+
+    # Пул соединений с AI (общий на весь процесс)
+    AI_MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", "20"))
+    AI_MAX_KEEPALIVE = int(os.getenv("AI_MAX_KEEPALIVE", "10"))
+    AI_KEEPALIVE_EXPIRY = float(os.getenv("AI_KEEPALIVE_EXPIRY", "60"))
+    AI_HTTP2 = os.getenv("AI_HTTP2", "1") == "1"
+    AI_WARMUP_CONNECTIONS = int(os.getenv("AI_WARMUP_CONNECTIONS", "2"))
+
+    # Очередь запросов к AI: сколько запросов одновременно и сколько максимум ждать в очереди (сек)
+    AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+    AI_QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", "180"))
+    
+    # JSON-режим генерации программ: модель отдает структуру (дни/упражнения, приемы пищи/КБЖУ),
+    # страницы рисуются из нее. При сбое разбора автоматически используется обычный текстовый режим.
+    AI_STRUCTURED_OUTPUT = os.getenv("AI_STRUCTURED_OUTPUT", "1") == "1"
+
+    # Пакетная мотивация: контексты нескольких клиентов уходят в один запрос, ответ — JSON-массив.
+    # Размер пакета ограничен длиной ответа модели; если пакет не разобрался, он делится пополам.
+    MOTIVATION_BATCH_SIZE = max(1, int(os.getenv("MOTIVATION_BATCH_SIZE", "20")))
+
+    # Пул заранее сгенерированного контента (посты в канал, мотивация для Free/Lite).
+    # Пополняется в тихие часы (по МСК), в часы пик задачи только забирают готовые тексты.
+    CONTENT_POOL_HOURS = os.getenv("CONTENT_POOL_HOURS", "3,4")
+    CONTENT_POOL_POSTS = int(os.getenv("CONTENT_POOL_POSTS", "8"))
+    CONTENT_POOL_MOTIVATIONS = int(os.getenv("CONTENT_POOL_MOTIVATIONS", "60"))
+    CONTENT_TTL_DAYS = int(os.getenv("CONTENT_TTL_DAYS", "7"))
+    CONTENT_DEDUP_DAYS = int(os.getenv("CONTENT_DEDUP_DAYS", "30"))
+
+    # Фоновая очередь долгих генераций (недельная программа, меню). Задачи лежат в таблице ai_jobs,
+    # после перезапуска бота недоделанные задачи подхватываются заново.
+    JOB_WORKERS = max(1, int(os.getenv("JOB_WORKERS", "3")))
+    JOB_MAX_ATTEMPTS = max(1, int(os.getenv("JOB_MAX_ATTEMPTS", "3")))
+    JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "20"))   # Пауза перед повтором (сек), растет с каждой попыткой
+    JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+    JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "600"))          # Зависшая попытка обрывается и уходит на повтор
+    JOB_KEEP_DAYS = int(os.getenv("JOB_KEEP_DAYS", "7"))
+    
+    # Распознавание голоса (faster-whisper). Модель грузится в фоне после старта бота, а не при импорте.
+    WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+    WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
+    WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")  # int8 сильно снижает нагрузку на CPU и память VDS
+    WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "1") == "1"         # 0 — грузить только при первом голосовом
+    # Распознавание идет в отдельных процессах (у каждого своя модель в памяти)
+    WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", "1"))
+    WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "2"))  # Потоков CTranslate2 на один процесс
+    WHISPER_QUEUE_LIMIT = int(os.getenv("WHISPER_QUEUE_LIMIT", "8"))  # Сверх этого голосовые сразу отклоняются
+    WHISPER_TIMEOUT = float(os.getenv("WHISPER_TIMEOUT", "120"))
+    WHISPER_RETRY_SECONDS = float(os.getenv("WHISPER_RETRY_SECONDS", "60"))  # Пауза перед повторной загрузкой после ошибки
+    # Параметры под нагрузку (см. choose_decode_plan): в простое — луч WHISPER_BEAM_SIZE, короткие голосовые
+    # и голосовые при очереди от WHISPER_BUSY_DEPTH — жадный поиск; при очереди — еще и WHISPER_FAST_MODEL, если задана
+    WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "5"))
+    WHISPER_SHORT_CLIP = float(os.getenv("WHISPER_SHORT_CLIP", "8"))   # сек
+    WHISPER_BUSY_DEPTH = int(os.getenv("WHISPER_BUSY_DEPTH", "2"))
+    WHISPER_FAST_MODEL = os.getenv("WHISPER_FAST_MODEL", "")           # Например "tiny"; пусто — та же модель
+    # Пакетное распознавание: короткие голосовые (до 30 с), ждущие в очереди, распознаются одним проходом модели.
+    # WHISPER_BATCH_SIZE=1 — выключено; WHISPER_BATCH_WINDOW — сколько подождать одновременно отправленные, если все процессы заняты (сек)
+    WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "4"))
+    WHISPER_BATCH_WINDOW = float(os.getenv("WHISPER_BATCH_WINDOW", "0.2"))
+    WHISPER_CACHE_SIZE = int(os.getenv("WHISPER_CACHE_SIZE", "5000"))  # Сколько распознанных голосовых хранить в БД
     
     # База данных
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./database.db")
@@ -0,0 +1,178 @@
+# data/food_db.py
+
+# Локальная таблица КБЖУ на 100 г для дневника питания.
+# Крупы, макароны и мясо по умолчанию считаются ГОТОВЫМИ (как в промпте калькулятора),
+# сухой/сырой вес — отдельные строки в RAW_VARIANTS.
+# Формат: "название": (ккал, белки, жиры, углеводы)
+
+FOOD_DB = {
+    # --- КРУПЫ И ГАРНИРЫ (ГОТОВЫЕ) ---
+    "гречка вареная": (110, 4.2, 1.1, 21.3),
+    "рис вареный": (116, 2.2, 0.5, 24.9),
+    "овсянка на воде": (88, 3.0, 1.7, 15.0),
+    "овсянка на молоке": (102, 3.2, 4.1, 14.2),
+    "макароны вареные": (112, 3.5, 0.4, 23.2),
+    "булгур вареный": (83, 3.1, 0.2, 18.6),
+    "перловка вареная": (109, 3.1, 0.4, 22.2),
+    "пшенка вареная": (90, 3.0, 0.7, 17.0),
+    "киноа вареная": (120, 4.4, 1.9, 21.3),
+    "картофель вареный": (82, 2.0, 0.4, 16.7),
+    "картофельное пюре": (106, 2.5, 4.2, 14.7),
+    "картофель жареный": (192, 2.8, 9.5, 23.4),
+
+    # --- КРУПЫ (СУХИЕ) ---
+    "гречка сухая": (313, 12.6, 3.3, 62.1),
+    "рис сухой": (344, 6.7, 0.7, 78.9),
+    "овсяные хлопья": (352, 12.3, 6.2, 61.8),
+    "макароны сухие": (344, 10.4, 1.1, 71.5),
+    "булгур сухой": (342, 12.3, 1.3, 75.9),
+    "перловка сухая": (320, 9.3, 1.1, 73.7),
+    "пшено сухое": (342, 11.5, 3.3, 69.3),
+    "киноа сухая": (368, 14.1, 6.1, 64.2),
+
+    # --- МЯСО, ПТИЦА (ГОТОВЫЕ) ---
+    "куриная грудка отварная": (137, 29.8, 1.8, 0.5),
+    "куриное бедро отварное": (195, 23.0, 11.0, 0.0),
+    "индейка отварная": (130, 25.3, 3.1, 0.0),
+    "говядина отварная": (254, 25.8, 16.8, 0.0),
+    "свинина отварная": (375, 22.6, 31.6, 0.0),
+    "котлета куриная": (190, 18.0, 10.5, 6.0),
+
+    # --- МЯСО, ПТИЦА (СЫРЫЕ) ---
+    "куриная грудка сырая": (113, 23.6, 1.9, 0.4),
+    "куриное бедро сырое": (185, 18.5, 12.0, 0.0),
+    "индейка сырая": (114, 24.0, 1.5, 0.0),
+    "говядина сырая": (187, 18.9, 12.4, 0.0),
+    "свинина сырая": (259, 16.0, 21.6, 0.0),
+    "фарш говяжий": (254, 17.2, 20.0, 0.0),
+
+    # --- РЫБА, ЯЙЦА ---
+    "лосось": (208, 20.0, 13.4, 0.0),
+    "минтай": (72, 15.9, 0.9, 0.0),
+    "треска": (69, 16.0, 0.6, 0.0),
+    "тунец консервированный": (96, 21.0, 1.0, 0.0),
+    "креветки": (95, 18.9, 2.2, 0.0),
+    "яйцо куриное": (157, 12.7, 10.9, 0.7),
+    "сосиски": (266, 10.4, 24.0, 1.6),
+    "колбаса вареная": (257, 12.0, 22.8, 0.0),
+
+    # --- МОЛОЧНОЕ ---
+    "творог 5%": (121, 17.2, 5.0, 1.8),
+    "творог 0%": (71, 16.5, 0.0, 1.3),
+    "творог 9%": (159, 16.7, 9.0, 2.0),
+    "молоко 2.5%": (52, 2.8, 2.5, 4.7),
+    "кефир 2.5%": (53, 2.9, 2.5, 4.0),
+    "кефир 1%": (40, 3.0, 1.0, 4.0),
+    "йогурт греческий": (66, 5.0, 2.0, 3.6),
+    "йогурт натуральный": (68, 5.0, 3.2, 3.5),
+    "сметана 15%": (162, 2.6, 15.0, 3.0),
+    "сыр твердый": (356, 26.0, 26.5, 0.0),
+    "сыр моцарелла": (280, 22.0, 22.0, 2.0),
+    "сырники": (220, 12.0, 11.0, 17.0),
+    "масло сливочное": (748, 0.5, 82.5, 0.8),
+    "масло растительное": (899, 0.0, 99.9, 0.0),
+
+    # --- ХЛЕБ ---
+    "хлеб белый": (265, 8.1, 3.2, 48.8),
+    "хлеб ржаной": (210, 6.7, 1.2, 40.0),
+    "хлебцы": (310, 11.0, 3.0, 60.0),
+    "лаваш": (277, 9.1, 1.2, 56.0),
+
+    # --- ФРУКТЫ, ОВОЩИ ---
+    "банан": (96, 1.5, 0.2, 21.8),
+    "яблоко": (47, 0.4, 0.4, 9.8),
+    "апельсин": (43, 0.9, 0.2, 8.1),
+    "груша": (47, 0.4, 0.3, 10.3),
+    "мандарин": (38, 0.8, 0.2, 7.5),
+    "киви": (47, 0.8, 0.4, 8.1),
+    "огурец": (15, 0.8, 0.1, 2.8),
+    "помидор": (20, 0.6, 0.2, 4.2),
+    "капуста": (27, 1.8, 0.1, 4.7),
+    "морковь": (35, 1.3, 0.1, 6.9),
+    "брокколи": (34, 2.8, 0.4, 6.6),
+    "авокадо": (160, 2.0, 14.7, 1.8),
+
+    # --- ОРЕХИ, СЛАДКОЕ, ПРОЧЕЕ ---
+    "грецкие орехи": (654, 15.2, 65.2, 7.0),
+    "миндаль": (609, 18.6, 57.7, 16.2),
+    "арахис": (552, 26.3, 45.2, 9.9),
+    "арахисовая паста": (588, 25.0, 50.0, 20.0),
+    "мед": (329, 0.8, 0.0, 81.5),
+    "сахар": (399, 0.0, 0.0, 99.8),
+    "шоколад молочный": (535, 7.6, 29.7, 59.4),
+    "шоколад темный": (539, 6.2, 35.4, 48.2),
+    "протеин": (380, 75.0, 5.0, 8.0),
+    "борщ": (49, 1.1, 2.2, 6.7),
+    "суп куриный": (36, 2.5, 1.2, 3.6),
+    "кофе черный": (2, 0.2, 0.0, 0.3),
+}
+
+# Как пишут пользователи -> строка таблицы
+FOOD_ALIASES = {
+    "гречка": "гречка вареная", "гречневая каша": "гречка вареная",
+    "рис": "рис вареный",
+    "овсянка": "овсянка на воде", "овсяная каша": "овсянка на воде", "геркулес": "овсяные хлопья",
+    "овсянка на молоке": "овсянка на молоке", "овсяная каша на молоке": "овсянка на молоке",
+    "макароны": "макароны вареные", "паста": "макароны вареные", "спагетти": "макароны вареные",
+    "булгур": "булгур вареный", "перловка": "перловка вареная", "пшенка": "пшенка вареная",
+    "пшенная каша": "пшенка вареная", "киноа": "киноа вареная",
+    "картошка": "картофель вареный", "картофель": "картофель вареный",
+    "пюре": "картофельное пюре", "картошка фри": "картофель жареный", "жареная картошка": "картофель жареный",
+    "курица": "куриная грудка отварная", "куриная грудка": "куриная грудка отварная",
+    "грудка": "куриная грудка отварная", "куриное филе": "куриная грудка отварная",
+    "филе курицы": "куриная грудка отварная", "филе куриное": "куриная грудка отварная",
+    "куриное бедро": "куриное бедро отварное", "бедро": "куриное бедро отварное", "бедра": "куриное бедро отварное",
+    "индейка": "индейка отварная", "филе индейки": "индейка отварная",
+    "говядина": "говядина отварная", "свинина": "свинина отварная",
+    "котлета": "котлета куриная", "фарш": "фарш говяжий",
+    "семга": "лосось", "красная рыба": "лосось", "форель": "лосось",
+    "тунец": "тунец консервированный",
+    "яйцо": "яйцо куриное", "яйца": "яйцо куриное", "яиц": "яйцо куриное",
+    "сосиска": "сосиски", "колбаса": "колбаса вареная",
+    "творог": "творог 5%", "обезжиренный творог": "творог 0%",
+    "молоко": "молоко 2.5%", "кефир": "кефир 2.5%",
+    "греческий йогурт": "йогурт греческий", "йогурт": "йогурт натуральный",
+    "сметана": "сметана 15%", "сыр": "сыр твердый", "моцарелла": "сыр моцарелла",
+    "сливочное масло": "масло сливочное", "оливковое масло": "масло растительное",
+    "растительное масло": "масло растительное", "подсолнечное масло": "масло растительное",
+    "хлеб": "хлеб белый", "батон": "хлеб белый", "черный хлеб": "хлеб ржаной", "ржаной хлеб": "хлеб ржаной",
+    "помидоры": "помидор", "томат": "помидор", "огурцы": "огурец", "морковка": "морковь",
+    "орехи": "грецкие орехи", "грецкий орех": "грецкие орехи",
+    "арахисовое масло": "арахисовая паста", "мед": "мед", "шоколад": "шоколад молочный",
+    "черный шоколад": "шоколад темный", "горький шоколад": "шоколад темный",
+    "протеиновый коктейль": "протеин", "сывороточный протеин": "протеин",
+    "суп": "суп куриный", "кофе": "кофе черный",
+}
+
+# Готовое -> сухое/сырое (если пользователь написал "сухой", "сырой", "до варки")
+RAW_VARIANTS = {
+    "гречка вареная": "гречка сухая",
+    "рис вареный": "рис сухой",
+    "овсянка на воде": "овсяные хлопья",
+    "макароны вареные": "макароны сухие",
+    "булгур вареный": "булгур сухой",
+    "перловка вареная": "перловка сухая",
+    "пшенка вареная": "пшено сухое",
+    "киноа вареная": "киноа сухая",
+    "куриная грудка отварная": "куриная грудка сырая",
+    "куриное бедро отварное": "куриное бедро сырое",
+    "индейка отварная": "индейка сырая",
+    "говядина отварная": "говядина сырая",
+    "свинина отварная": "свинина сырая",
+}
+
+# Вес одной штуки / порции (г) — для "2 яйца", "банан", "тарелка борща"
+PIECE_WEIGHTS = {
+    "яйцо куриное": 55, "банан": 120, "яблоко": 180, "апельсин": 150, "груша": 170,
+    "мандарин": 80, "киви": 75, "огурец": 100, "помидор": 120, "морковь": 80, "авокадо": 150,
+    "сосиски": 50, "хлеб белый": 30, "хлеб ржаной": 30, "хлебцы": 10, "лаваш": 60,
+    "сыр твердый": 20, "котлета куриная": 80, "сырники": 50, "протеин": 30,
+    "борщ": 300, "суп куриный": 300, "кофе черный": 200,
+}
+
+# Бытовые меры (г/мл)
+UNIT_WEIGHTS = {
+    "стакан": 250, "кружк": 300, "чашк": 250, "тарелк": 300,
+    "столов": 15, "ст.л": 15, "ложк": 15, "чайн": 5, "ч.л": 5,
+    "скуп": 30, "мерн": 30,
+}
@@ -1,8 +1,11 @@
+import re
+import hashlib
 from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc
+from sqlalchemy import select, func, desc, delete, update
 from database.models import User
 from database.database import async_session as AsyncSessionLocal 
+from services.program_digest import build_digest, format_digest, estimate_tokens
 
 class UserCRUD:
     
@@ -250,17 +253,23 @@ class UserCRUD:
         return True
     
     @staticmethod
-    async def save_program_history(session: AsyncSession, telegram_id: int, program_type: str, program_text: str):
-        """Сохраняет сгенерированную программу в историю"""
+    async def save_program_history(session: AsyncSession, telegram_id: int, program_type: str, program_text: str, structured: str = None):
+        """Сохраняет сгенерированную программу в историю (structured — JSON-версия, если есть)"""
         from database.models import WorkoutProgramHistory, NutritionProgramHistory
         
         try:
             if program_type == 'workout':
-                history_entry = WorkoutProgramHistory(user_id=telegram_id, program_text=program_text)
+                model = WorkoutProgramHistory
             elif program_type == 'nutrition':
-                history_entry = NutritionProgramHistory(user_id=telegram_id, program_text=program_text)
+                model = NutritionProgramHistory
             else:
                 return False
+
+            # Выжимку считаем один раз при сохранении, а не при каждой новой генерации
+            history_entry = model(
+                user_id=telegram_id, program_text=program_text,
+                digest=build_digest(program_type, program_text, structured)
+            )
                 
             session.add(history_entry)
             await session.commit()
@@ -302,6 +311,50 @@ class UserCRUD:
         except Exception as e:
             print(f"❌ Ошибка при получении истории {program_type}: {e}")
             return [] 
+
+    @staticmethod
+    async def get_program_digests(session: AsyncSession, telegram_id: int, program_type: str, limit: int = 3):
+        """Последние N программ в виде компактных выжимок (для блока периодизации в промпте)"""
+        from database.models import WorkoutProgramHistory, NutritionProgramHistory
+
+        try:
+            if program_type == 'workout':
+                model = WorkoutProgramHistory
+            elif program_type == 'nutrition':
+                model = NutritionProgramHistory
+            else:
+                return []
+
+            subq = (
+                select(func.max(model.id))
+                .where(model.user_id == telegram_id)
+                .group_by(func.date(model.created_at))
+            )
+
+            result = await session.execute(
+                select(model)
+                .where(model.id.in_(subq))
+                .order_by(desc(model.created_at))
+                .limit(limit)
+            )
+
+            digests = []
+            full_tokens = digest_tokens = 0
+            for record in reversed(result.scalars().all()):
+                # Старые записи без выжимки: считаем на лету, если не разобралось — берем полный текст
+                digest = record.digest or build_digest(program_type, record.program_text)
+                text = format_digest(program_type, digest) if digest else record.program_text
+                digests.append(f"{record.created_at:%d.%m.%Y}:\n{text}")
+                full_tokens += estimate_tokens(record.program_text)
+                digest_tokens += estimate_tokens(text)
+
+            if digests:
+                print(f"📉 История {program_type} для {telegram_id}: ~{full_tokens} → ~{digest_tokens} токенов ({len(digests)} программ)")
+            return digests
+
+        except Exception as e:
+            print(f"❌ Ошибка при получении выжимок {program_type}: {e}")
+            return []
         
     @staticmethod
     async def activate_promo(session: AsyncSession, telegram_id: int, promo_text: str):
@@ -415,3 +468,220 @@ class UserCRUD:
         return False
     
     
+
+
+class ContentPoolCRUD:
+    """Пул заранее сгенерированных текстов: ночью наполняем, днем забираем без обращения к ИИ"""
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        # Повтором считаем тот же текст с точностью до регистра, эмодзи и знаков препинания
+        normalized = " ".join(re.sub(r"[^\w\s]", " ", text.lower().replace("ё", "е")).split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    async def count_available(session: AsyncSession, kind: str) -> int:
+        from database.models import PregeneratedContent
+        now = datetime.now()
+        return await session.scalar(
+            select(func.count(PregeneratedContent.id)).where(
+                PregeneratedContent.kind == kind,
+                PregeneratedContent.used_at.is_(None),
+                PregeneratedContent.expires_at > now
+            )
+        ) or 0
+
+    @staticmethod
+    async def add_items(session: AsyncSession, kind: str, texts: list[str], ttl_days: int, dedup_days: int) -> int:
+        """Добавляет новые тексты, отбрасывая повторы за последние dedup_days дней. Возвращает число добавленных."""
+        from database.models import PregeneratedContent
+        now = datetime.now()
+        result = await session.execute(
+            select(PregeneratedContent.text_hash).where(
+                PregeneratedContent.kind == kind,
+                PregeneratedContent.created_at >= now - timedelta(days=dedup_days)
+            )
+        )
+        seen = set(result.scalars().all())
+
+        added = 0
+        for text in texts:
+            text = (text or "").strip()
+            digest = ContentPoolCRUD.text_hash(text)
+            if not text or digest in seen:
+                continue
+            seen.add(digest)
+            session.add(PregeneratedContent(
+                kind=kind, text=text, text_hash=digest,
+                created_at=now, expires_at=now + timedelta(days=ttl_days)
+            ))
+            added += 1
+        await session.commit()
+        return added
+
+    @staticmethod
+    async def take(session: AsyncSession, kind: str, limit: int = 1) -> list[str]:
+        """Забирает самые старые из непросроченных текстов и помечает их выданными"""
+        from database.models import PregeneratedContent
+        now = datetime.now()
+        result = await session.execute(
+            select(PregeneratedContent).where(
+                PregeneratedContent.kind == kind,
+                PregeneratedContent.used_at.is_(None),
+                PregeneratedContent.expires_at > now
+            ).order_by(PregeneratedContent.created_at).limit(limit)
+        )
+        items = result.scalars().all()
+        for item in items:
+            item.used_at = now
+        await session.commit()
+        return [item.text for item in items]
+
+    @staticmethod
+    async def purge(session: AsyncSession, dedup_days: int) -> int:
+        """Удаляет просроченные невыданные тексты и выданные старше окна дедупликации"""
+        from database.models import PregeneratedContent
+        now = datetime.now()
+        result = await session.execute(
+            delete(PregeneratedContent).where(
+                ((PregeneratedContent.used_at.is_(None)) & (PregeneratedContent.expires_at <= now)) |
+                (PregeneratedContent.created_at < now - timedelta(days=dedup_days))
+            )
+        )
+        await session.commit()
+        return result.rowcount or 0
+
+
+class AIJobCRUD:
+    """Очередь долгих генераций в БД: хендлер ставит задачу, воркер забирает и выполняет"""
+
+    @staticmethod
+    async def enqueue(session: AsyncSession, kind: str, user_id: int, chat_id: int, status_message_id: int = None, payload: str = None):
+        from database.models import AIJob
+        job = AIJob(
+            kind=kind, user_id=user_id, chat_id=chat_id, status_message_id=status_message_id,
+            payload=payload, status="queued", attempts=0, created_at=datetime.now(), run_after=datetime.now()
+        )
+        session.add(job)
+        await session.commit()
+        return job
+
+    @staticmethod
+    async def get_active(session: AsyncSession, user_id: int, kind: str):
+        """Незавершенная задача того же типа (чтобы не ставить вторую такую же генерацию)"""
+        from database.models import AIJob
+        result = await session.execute(
+            select(AIJob).where(
+                AIJob.user_id == user_id, AIJob.kind == kind,
+                AIJob.status.in_(["queued", "running"])
+            ).limit(1)
+        )
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def requeue_running(session: AsyncSession) -> int:
+        """При старте: задачи, прерванные перезапуском, возвращаются в очередь"""
+        from database.models import AIJob
+        result = await session.execute(
+            update(AIJob).where(AIJob.status == "running").values(status="queued", run_after=datetime.now())
+        )
+        await session.commit()
+        return result.rowcount or 0
+
+    @staticmethod
+    async def claim_next(session: AsyncSession):
+        """Забирает самую старую готовую к запуску задачу. None — очередь пуста."""
+        from database.models import AIJob
+        now = datetime.now()
+        while True:
+            job_id = await session.scalar(
+                select(AIJob.id).where(AIJob.status == "queued", AIJob.run_after <= now)
+                .order_by(AIJob.run_after, AIJob.id).limit(1)
+            )
+            if job_id is None:
+                return None
+            # Условный UPDATE: если задачу успел забрать другой воркер, rowcount будет 0
+            result = await session.execute(
+                update(AIJob).where(AIJob.id == job_id, AIJob.status == "queued")
+                .values(status="running", attempts=AIJob.attempts + 1, started_at=now)
+            )
+            await session.commit()
+            if result.rowcount:
+                return await session.get(AIJob, job_id, populate_existing=True)
+
+    @staticmethod
+    async def finish(session: AsyncSession, job_id: int, status: str = "done", error: str = None):
+        from database.models import AIJob
+        await session.execute(
+            update(AIJob).where(AIJob.id == job_id).values(status=status, error=error, finished_at=datetime.now())
+        )
+        await session.commit()
+
+    @staticmethod
+    async def retry_later(session: AsyncSession, job_id: int, delay_seconds: float, error: str = None):
+        from database.models import AIJob
+        await session.execute(
+            update(AIJob).where(AIJob.id == job_id).values(
+                status="queued", error=error, run_after=datetime.now() + timedelta(seconds=delay_seconds)
+            )
+        )
+        await session.commit()
+
+    @staticmethod
+    async def stats(session: AsyncSession) -> dict:
+        from database.models import AIJob
+        result = await session.execute(select(AIJob.status, func.count(AIJob.id)).group_by(AIJob.status))
+        return {status: count for status, count in result.all()}
+
+    @staticmethod
+    async def purge(session: AsyncSession, keep_days: int) -> int:
+        """Удаляет завершенные задачи старше keep_days дней"""
+        from database.models import AIJob
+        result = await session.execute(
+            delete(AIJob).where(
+                AIJob.status.in_(["done", "failed"]),
+                AIJob.finished_at < datetime.now() - timedelta(days=keep_days)
+            )
+        )
+        await session.commit()
+        return result.rowcount or 0
+
+
+class VoiceTranscriptCRUD:
+    """Кэш распознанных голосовых по file_unique_id с вытеснением давно не использованных (LRU)"""
+
+    @staticmethod
+    async def get(session: AsyncSession, file_unique_id: str):
+        """Запись из кэша (и отметка, что она снова понадобилась) или None"""
+        from database.models import VoiceTranscript
+        item = await session.get(VoiceTranscript, file_unique_id)
+        if item is None:
+            return None
+        item.hits = (item.hits or 0) + 1
+        item.last_used_at = datetime.now()
+        await session.commit()
+        return item
+
+    @staticmethod
+    async def save(session: AsyncSession, file_unique_id: str, text: str, duration: float = None, model: str = None):
+        from database.models import VoiceTranscript
+        now = datetime.now()
+        await session.merge(VoiceTranscript(
+            file_unique_id=file_unique_id, text=text, duration=duration, model=model,
+            hits=0, created_at=now, last_used_at=now
+        ))
+        await session.commit()
+
+    @staticmethod
+    async def evict(session: AsyncSession, keep: int) -> int:
+        """Оставляет keep самых недавно использованных записей, остальные удаляет"""
+        from database.models import VoiceTranscript
+        total = await session.scalar(select(func.count(VoiceTranscript.file_unique_id))) or 0
+        if total <= keep:
+            return 0
+        newest = select(VoiceTranscript.file_unique_id).order_by(desc(VoiceTranscript.last_used_at)).limit(keep)
+        result = await session.execute(
+            delete(VoiceTranscript).where(VoiceTranscript.file_unique_id.not_in(newest))
+        )
+        await session.commit()
+        return result.rowcount or 0
@@ -53,6 +53,9 @@ class User(Base):
     current_workout_program = Column(String, nullable=True)
     current_workout_program_id = Column(String, nullable=True)
     current_nutrition_program = Column(String, nullable=True)
+    # Те же программы в виде JSON по схеме (services/program_schema.py), если генерация шла в JSON-режиме
+    current_workout_structured = Column(String, nullable=True)
+    current_nutrition_structured = Column(String, nullable=True)
     
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -126,6 +129,7 @@ class WorkoutProgramHistory(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey('users.telegram_id', ondelete="CASCADE"))
     program_text = Column(String, nullable=False)
+    digest = Column(String, nullable=True) # Компактная выжимка (JSON) для промпта периодизации
     created_at = Column(DateTime, default=datetime.datetime.now)
 
 class NutritionProgramHistory(Base):
@@ -134,6 +138,7 @@ class NutritionProgramHistory(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey('users.telegram_id', ondelete="CASCADE"))
     program_text = Column(String, nullable=False)
+    digest = Column(String, nullable=True) # Компактная выжимка (JSON) для промпта периодизации
     created_at = Column(DateTime, default=datetime.datetime.now)   
 
 class PromoCode(Base):
@@ -144,3 +149,45 @@ class PromoCode(Base):
     target_level = Column(String, default='ultra') # Какой уровень дает (lite, standard, ultra)
     uses_left = Column(Integer, default=1) # Сколько раз можно активировать
     expiry_date = Column(DateTime, nullable=True) # До какого числа работает     
+
+class PregeneratedContent(Base):
+    """Заранее сгенерированные тексты (посты в канал, мотивация). Наполняется ночью, в пик только забирается."""
+    __tablename__ = 'pregenerated_content'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False, index=True) # 'marketing_post' / 'motivation'
+    text = Column(String, nullable=False)
+    text_hash = Column(String, nullable=False, index=True) # Для отсева повторов
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    expires_at = Column(DateTime, nullable=False)
+    used_at = Column(DateTime, nullable=True) # NULL — еще не выдавался
+
+class AIJob(Base):
+    """Долгая генерация ИИ (недельная программа, меню). Переживает перезапуск бота: воркер подхватит задачу заново."""
+    __tablename__ = 'ai_jobs'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False) # 'workout_program' / 'nutrition_program'
+    user_id = Column(BigInteger, ForeignKey('users.telegram_id', ondelete="CASCADE"), index=True)
+    chat_id = Column(BigInteger, nullable=False)
+    status_message_id = Column(BigInteger, nullable=True) # Сообщение "Тренер составляет...", в нем показываем прогресс
+    payload = Column(String, nullable=True) # JSON с параметрами (пожелания и т.п.)
+    status = Column(String, default="queued", index=True) # queued / running / done / failed
+    attempts = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    run_after = Column(DateTime, default=datetime.datetime.now) # Повторная попытка — не раньше этого времени
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class VoiceTranscript(Base):
+    """Распознанные голосовые: пересланное или повторно отправленное голосовое не гоняем через Whisper заново"""
+    __tablename__ = 'voice_transcripts'
+
+    file_unique_id = Column(String, primary_key=True) # Telegram file_unique_id — одинаков у пересланных копий
+    text = Column(String, nullable=False)
+    duration = Column(Float, nullable=True) # Длина аудио, сек
+    model = Column(String, nullable=True) # Какой моделью Whisper распознано
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    last_used_at = Column(DateTime, default=datetime.datetime.now, index=True) # Для вытеснения давно не нужных (LRU)
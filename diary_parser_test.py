@@ -0,0 +1,81 @@
+import time
+
+from services.diary_parser import parse_diary_text, canonicalize_exercise
+
+# Проверка локального разбора дневника на типичных записях пользователей.
+# Показывает, какая доля сообщений обходится без ИИ, и сколько стоит разбор.
+# Запуск: python diary_parser_test.py
+
+# (текст, ожидаемые записи [(каноничное, нюанс, вес, повторы, подходы)]); None — должно уйти в ИИ
+FIXTURES = [
+    ("Жим штанги лежа 80 10", [("Жим штанги лежа", "", 80.0, 10, 1)]),
+    ("Жим штанги лежа 80кг 10", [("Жим штанги лежа", "", 80.0, 10, 1)]),
+    ("жим лежа 80 кг на 10", [("Жим лежа", "", 80.0, 10, 1)]),
+    ("Жим лежа 80х10", [("Жим лежа", "", 80.0, 10, 1)]),
+    ("Жим лежа 80 x 10 повторений", [("Жим лежа", "", 80.0, 10, 1)]),
+    ("Присед 100 5х5", [("Присед", "", 100.0, 5, 5)]),
+    ("Присед 100кг 3 подхода по 8", [("Присед", "", 100.0, 8, 3)]),
+    ("Подтягивания 12 раз", [("Подтягивания", "", 0.0, 12, 1)]),
+    ("Подтягивания 0 12", [("Подтягивания", "", 0.0, 12, 1)]),
+    ("Отжимания на брусьях свой вес 15", [("Отжимания на брусьях", "", 0.0, 15, 1)]),
+    ("Жим гантелей 22,5 12", [("Жим гантелей", "", 22.5, 12, 1)]),
+    ("Жим гантелей на наклонной скамье 30 градусов 24 10", [("Жим гантелей на наклонной 30", "", 24.0, 10, 1)]),
+    ("Тяга верхнего блока узким хватом 50 12", [("Тяга верхнего блока", "узким хватом", 50.0, 12, 1)]),
+    ("Присед в Смите 80 10", [("Присед в тренажере", "", 80.0, 10, 1)]),
+    ("Сгибания на бицепс поочередно 14 12", [("Сгибания на бицепс", "", 14.0, 12, 1)]),
+    ("Жим 80 10, 85 8, 90 6", [("Жим", "", 80.0, 10, 1), ("Жим", "", 85.0, 8, 1), ("Жим", "", 90.0, 6, 1)]),
+    ("- Жим лежа 80 10\n- Тяга штанги в наклоне 60 12", [("Жим лежа", "", 80.0, 10, 1), ("Тяга штанги в наклоне", "", 60.0, 12, 1)]),
+    ("Становая 140 5; Гиперэкстензия 20 15", [("Становая", "", 140.0, 5, 1), ("Гиперэкстензия", "", 20.0, 15, 1)]),
+    # Пара без кг с маленьким первым числом — подходы х повторы без веса
+    ("Подтягивания 3х10", [("Подтягивания", "", 0.0, 10, 3)]),
+    ("Отжимания 4x20", [("Отжимания", "", 0.0, 20, 4)]),
+    ("Присед 3 по 10", [("Присед", "", 0.0, 10, 3)]),
+    ("Жим лежа 80 по 10", [("Жим лежа", "", 80.0, 10, 1)]),
+    ("Жим 80кг x 10 x 3", [("Жим", "", 80.0, 10, 3)]),
+    ("Жим 80х10х3", [("Жим", "", 80.0, 10, 3)]),
+    ("Выпады с гантелями по 20 кг 12", [("Выпады с гантелями", "", 20.0, 12, 1)]),
+    # Неоднозначно — пусть разбирает ИИ
+    ("Жим 15х10", None),
+    ("Присед 15 по 10", None),
+    ("Жим 100 на 10 на 3", None),
+    ("Гантели 2х16 кг 10 раз", None),
+    ("Жим гантелей 2х20 12", None),
+    ("Жим 80", None),
+    ("Сделал жим как в прошлый раз только тяжелее", None),
+    ("Жим лежа 80 10 8 6", None),
+    ("Жим 80 10 но последний повтор с помощью", None),
+    ("Подтягивания 12", None),
+]
+
+
+def check():
+    print("--- ЛОКАЛЬНЫЙ РАЗБОР ДНЕВНИКА ---")
+    failed = 0
+    local = 0
+    for text, expected in FIXTURES:
+        result = parse_diary_text(text)
+        got = [(e.canonical, e.comment, e.weight, e.reps, e.sets) for e in result.entries] if result.complete else None
+        if got is not None:
+            local += 1
+        if got != expected:
+            failed += 1
+            print(f"❌ {text!r}\n   ждали: {expected}\n   вышло: {got} (в ИИ: {result.leftovers})")
+
+    # Скорость: разбор должен быть мгновенным по сравнению с походом в ИИ (секунды)
+    rounds = 2000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text, _ in FIXTURES:
+            parse_diary_text(text)
+    per_message = (time.perf_counter() - started) / (rounds * len(FIXTURES)) * 1_000_000
+
+    print(f"Разобрано локально: {local}/{len(FIXTURES)} ({local / len(FIXTURES):.0%}), ошибок: {failed}")
+    print(f"Время разбора: ~{per_message:.0f} мкс на сообщение")
+    print(f"Пример канона: {canonicalize_exercise('Жим гантелей на скамье 45° широким хватом')}")
+    if failed:
+        raise SystemExit(1)
+    print("✅ Разбор дневника совпадает с ожиданиями.")
+
+
+if __name__ == "__main__":
+    check()
@@ -0,0 +1,73 @@
+import time
+import datetime
+
+from services.food_matcher import parse_meal_text, match_food
+
+# Проверка локального расчета КБЖУ на типичных записях дневника питания.
+# Показывает, какая доля сообщений считается без ИИ, и сколько стоит разбор.
+# Запуск: python food_matcher_test.py
+
+NOON = datetime.datetime(2026, 1, 1, 13, 0)
+
+# (текст, ожидаемые записи [(название, вес)]) или None — все должно уйти в ИИ
+FIXTURES = [
+    ("200г гречки", [("Гречка вареная", 200)]),
+    ("гречка 200 гр", [("Гречка вареная", 200)]),
+    ("80 г сухой гречки", [("Гречка сухая", 80)]),
+    ("рис 150г, куриная грудка 200г", [("Рис вареный", 150), ("Куриная грудка отварная", 200)]),
+    ("2 яйца и банан", [("Яйцо куриное", 110), ("Банан", 120)]),
+    ("три яйца", [("Яйцо куриное", 165)]),
+    ("стакан кефира", [("Кефир 2.5%", 250)]),
+    ("0,5 л молока", [("Молоко 2.5%", 500)]),
+    ("на завтрак овсянка 250г + чайная ложка меда", [("Овсянка на воде", 250), ("Мед", 5)]),
+    ("съел творог 180 грамм", [("Творог 5%", 180)]),
+    ("2 куска хлеба", [("Хлеб белый", 60)]),
+    ("филе куриное 150г", [("Куриная грудка отварная", 150)]),
+    ("тарелка борща", [("Борщ", 300)]),
+    ("макарошки 200г", None),
+    ("плов 300г", None),
+    ("шаурма", None),
+    ("гречка с курицей", None),
+    # "и" внутри названия блюда — не делим, количество не должно уйти к помидорам
+    ("салат из огурцов и помидоров 200г", None),
+    ("2 яйца и 200г творога", [("Яйцо куриное", 110), ("Творог 5%", 200)]),
+]
+
+
+def check():
+    print("--- ЛОКАЛЬНЫЙ РАСЧЕТ КБЖУ ---")
+    failed = 0
+    local = 0
+    for text, expected in FIXTURES:
+        result = parse_meal_text(text, now=NOON)
+        got = [(i.name, i.weight) for i in result.items] if result.items and not result.leftovers else None
+        if got is not None:
+            local += 1
+        if got != expected:
+            failed += 1
+            print(f"❌ {text!r}\n   ждали: {expected}\n   вышло: {got} (в ИИ: {result.leftovers})")
+
+    breakfast = parse_meal_text("на завтрак 2 яйца", now=NOON)
+    if breakfast.meal != "Завтрак" or breakfast.items[0].meal != "Завтрак":
+        failed += 1
+        print("❌ Явно названный прием пищи не перекрыл время")
+
+    rounds = 2000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text, _ in FIXTURES:
+            parse_meal_text(text, now=NOON)
+    per_message = (time.perf_counter() - started) / (rounds * len(FIXTURES)) * 1_000_000
+
+    sample = parse_meal_text("200г гречки, 2 яйца", now=NOON).items
+    print(f"Посчитано локально: {local}/{len(FIXTURES)} ({local / len(FIXTURES):.0%}), ошибок: {failed}")
+    print(f"Время разбора: ~{per_message:.0f} мкс на сообщение")
+    print(f"Пример: {[(i.name, i.weight, i.calories, i.protein) for i in sample]}")
+    print(f"Нечеткий поиск: 'курин грудку' -> {match_food('курин грудку')}")
+    if failed:
+        raise SystemExit(1)
+    print("✅ Расчет КБЖУ совпадает с ожиданиями.")
+
+
+if __name__ == "__main__":
+    check()
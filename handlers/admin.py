@@ -13,6 +13,11 @@ from sqlalchemy import select
 from database.models import PromoCode, User
 from database.crud import UserCRUD
 from config import Config
+from services.ai_manager import ai_scheduler, ai_coalescer, prompt_cache, task_telemetry
+from services.exercise_index import exercise_index
+from services.job_queue import job_queue
+from services.transcription import speech
+from services.llm_providers import get_router
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -45,6 +50,7 @@ async def admin_panel_start(message: Message):
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📊 Живая статистика", callback_data="admin_stats")],
+        [InlineKeyboardButton(text="🤖 AI нагрузка", callback_data="admin_ai_stats")],
         [InlineKeyboardButton(text="📢 Глобальная рассылка", callback_data="admin_broadcast")],
         [InlineKeyboardButton(text="🔑 Управление юзером", callback_data="admin_users")],
         [InlineKeyboardButton(text="🎟 Управление промокодами", callback_data="admin_list_promos")] 
@@ -92,6 +98,166 @@ async def show_admin_stats(callback: CallbackQuery, session: AsyncSession):
     
     await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
 
+# ==========================================
+# 2.1 КНОПКА: НАГРУЗКА НА AI (ОЧЕРЕДЬ ЗАПРОСОВ)
+# ==========================================
+@router.callback_query(F.data == "admin_ai_stats")
+async def show_admin_ai_stats(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id): return
+
+    stats = ai_scheduler.stats()
+    flight = ai_coalescer.stats()
+    names = exercise_index.stats()
+    jobs = job_queue.stats()
+    voice = speech.stats()
+    voice_state = {
+        "idle": "не загружен", "loading": "загружается...", "failed": f"ошибка ({voice['error']})",
+        "ready": f"готов (загрузка {voice['load_seconds'] or 0:.1f}с)",
+    }[voice["state"]]
+    voice_timing = ""
+    if voice["run_avg"] is not None:
+        voice_timing = (
+            f"    ожидание p95 {voice['wait_p95']:.1f}с, распознавание ср. {voice['run_avg']:.1f}с / "
+            f"p95 {voice['run_p95']:.1f}с, x{voice['realtime_factor'] or 0:.1f} к реальному времени\n"
+        )
+    tier_names = {
+        "ultra": "💎 Ultra", "standard": "🥈 Standard", "lite": "🥉 Lite",
+        "free": "🌱 Free", "background": "⏰ Фон"
+    }
+
+    lines = []
+    for tier, title in tier_names.items():
+        depth = stats["depth_by_tier"].get(tier, 0)
+        wait = stats["wait_by_tier"].get(tier)
+        if wait:
+            lines.append(
+                f"{title}: в очереди <b>{depth}</b> | ожидание "
+                f"ср. {wait['avg']:.1f}с / p95 {wait['p95']:.1f}с / макс {wait['max']:.1f}с"
+            )
+        else:
+            lines.append(f"{title}: в очереди <b>{depth}</b> | запросов не было")
+
+    text = (
+        f"🤖 <b>Нагрузка на AI</b>\n"
+        f"━━━━━━━━━━━━━━━━━━\n"
+        f"⚙️ Активных запросов: <b>{stats['active']}/{stats['limit']}</b>\n"
+        f"🚦 Сейчас в очереди: <b>{stats['depth']}</b> (пик: {stats['max_depth']})\n"
+        f"✅ Пропущено к API: <b>{stats['admitted']}</b>\n"
+        f"⏳ Ждали в очереди: <b>{stats['queued']}</b>\n"
+        f"❌ Не дождались: <b>{stats['timed_out']}</b>\n"
+        f"🔗 Склеено одинаковых: <b>{flight['hits']}</b> из {flight['hits'] + flight['misses']} "
+        f"({flight['hit_rate'] * 100:.0f}%)\n"
+        f"📚 Словарь упражнений: <b>{names['aliases']}</b> названий, узнано {names['hits']} "
+        f"({names['hit_rate'] * 100:.0f}%)\n"
+        f"🧵 Фоновые генерации: готово <b>{jobs['done']}</b>, повторов {jobs['retried']}, "
+        f"провалено {jobs['failed']}, подхвачено после рестарта {jobs['resumed']}\n"
+        f"🎙 Whisper ({voice['model']}, {voice['workers']} проц.): {voice_state}\n"
+        f"    распознано {voice['jobs']}, в очереди {voice['depth']} (пик {voice['max_depth']}), "
+        f"отклонено {voice['rejected']}, таймаутов {voice['timed_out']}, ошибок {voice['errors']}\n"
+        f"    из кэша {voice['cache_hits']} из {voice['cache_hits'] + voice['cache_misses']}, "
+        f"луч/жадно/под нагрузкой: {voice['plans'].get('full', 0)}/{voice['plans'].get('short', 0)}/"
+        f"{voice['plans'].get('busy', 0)}, пакетов {voice['batches']} ({voice['batched_clips']} голосовых)\n"
+        f"{voice_timing}"
+        f"━━━━━━━━━━━━━━━━━━\n"
+        f"<b>По тарифам:</b>\n" + "\n".join(lines)
+    )
+    if flight["hits_by_task"]:
+        text += "\n\n<b>Склейки по задачам:</b>\n" + "\n".join(
+            f"• {task}: {count}" for task, count in sorted(flight["hits_by_task"].items(), key=lambda x: -x[1])
+        )
+
+    router = get_router()
+    if router:
+        state_icons = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}
+        routing = router.stats()
+        text += "\n\n<b>Провайдеры:</b>\n"
+        for name, p in routing["providers"].items():
+            latency = f"p50 {p['p50']:.1f}с / p95 {p['p95']:.1f}с" if p["p50"] is not None else "нет данных"
+            text += (
+                f"{state_icons[p['state']]} {name} ({p['model']}): {latency}\n"
+                f"    запросов {p['requests']}, ошибок {p['errors']}, таймаутов {p['timeouts']}, отключений {p['trips']}\n"
+            )
+        text += f"🏁 Хеджей: {routing['hedges']} (резерв быстрее: {routing['hedge_wins']}), фейловеров: {routing['failovers']}"
+
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_ai_stats")],
+        [InlineKeyboardButton(text="🧊 Кэш промптов", callback_data="admin_cache_stats")],
+        [InlineKeyboardButton(text="🧭 Задачи и расходы", callback_data="admin_task_stats")],
+        [InlineKeyboardButton(text="🔙 Назад в меню", callback_data="admin_back_main")]
+    ])
+
+    try:
+        await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+    except Exception:
+        # Нажали "Обновить", а цифры не изменились
+        await callback.answer("Данные не изменились")
+
+# ==========================================
+# 2.2 КНОПКА: КЭШ ПРОМПТОВ У ПРОВАЙДЕРА
+# ==========================================
+@router.callback_query(F.data == "admin_cache_stats")
+async def show_admin_cache_stats(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id): return
+
+    features = prompt_cache.stats()
+    text = "🧊 <b>Кэш промптов у провайдера</b>\n━━━━━━━━━━━━━━━━━━\n"
+    if not features:
+        text += "Запросов с данными о кэше пока не было."
+    for feature, f in sorted(features.items(), key=lambda x: -x[1]["requests"]):
+        hit = f"{f['hit_latency']:.1f}с" if f["hit_latency"] is not None else "—"
+        miss = f"{f['miss_latency']:.1f}с" if f["miss_latency"] is not None else "—"
+        saved = f"~{f['saved_seconds']:.0f}с" if f["saved_seconds"] is not None else "нет данных"
+        text += (
+            f"<b>{feature}</b>: запросов {f['requests']}, с кэшем {f['hits']}\n"
+            f"    токены из кэша: {f['cached_tokens']}/{f['prompt_tokens']} ({f['token_hit_ratio'] * 100:.0f}%)\n"
+            f"    задержка: с кэшем {hit} / без {miss}, сэкономлено {saved}\n"
+        )
+
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_cache_stats")],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data="admin_ai_stats")]
+    ])
+
+    try:
+        await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+    except Exception:
+        await callback.answer("Данные не изменились")
+
+# ==========================================
+# 2.3 КНОПКА: ЗАДАЧИ, МОДЕЛИ И РАСХОДЫ
+# ==========================================
+@router.callback_query(F.data == "admin_task_stats")
+async def show_admin_task_stats(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id): return
+
+    tasks = task_telemetry.stats()
+    backend_icons = {"fast": "⚡️", "smart": "🧠"}
+    text = "🧭 <b>Задачи и расходы на AI</b>\n━━━━━━━━━━━━━━━━━━\n"
+    if not tasks:
+        text += "Запросов к AI пока не было."
+    total_cost = 0.0
+    for task, t in sorted(tasks.items(), key=lambda x: -x[1]["cost"]):
+        total_cost += t["cost"]
+        latency = f"p50 {t['p50']:.1f}с / p95 {t['p95']:.1f}с" if t["p50"] is not None else "нет данных"
+        models = ", ".join(f"{m} ×{n}" for m, n in t["models"].items()) or "—"
+        text += (
+            f"{backend_icons.get(t['backend'], '🧠')} <b>{task}</b>: запросов {t['requests']}, ошибок {t['errors']}, {latency}\n"
+            f"    токены: {t['prompt_tokens']} вход / {t['completion_tokens']} выход, ~${t['cost']:.4f}\n"
+            f"    модели: {models}\n"
+        )
+    if tasks:
+        text += f"━━━━━━━━━━━━━━━━━━\n💰 Всего с запуска: <b>~${total_cost:.4f}</b>"
+
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_task_stats")],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data="admin_ai_stats")]
+    ])
+
+    try:
+        await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+    except Exception:
+        await callback.answer("Данные не изменились")
+
 # ==========================================
 # 3. ВОЗВРАТ В ГЛАВНОЕ МЕНЮ
 # ==========================================
@@ -103,6 +269,7 @@ async def back_to_admin_main(callback: CallbackQuery, state: FSMContext):
     
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📊 Живая статистика", callback_data="admin_stats")],
+        [InlineKeyboardButton(text="🤖 AI нагрузка", callback_data="admin_ai_stats")],
         [InlineKeyboardButton(text="📢 Глобальная рассылка", callback_data="admin_broadcast")],
         [InlineKeyboardButton(text="🔑 Управление юзером", callback_data="admin_users")],
         [InlineKeyboardButton(text="🎟 Управление промокодами", callback_data="admin_list_promos")] # Добавили сюда!
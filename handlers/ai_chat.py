@@ -1,4 +1,3 @@
-import os
 import asyncio
 import logging
 from aiogram import Bot, Router, F
@@ -9,7 +8,9 @@ from aiogram.enums import ParseMode
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.crud import UserCRUD
-from services.ai_manager import AIManager 
+from services.ai_manager import AIManager, queue_notifier
+from services.stream_renderer import StreamRenderer
+from services.transcription import speech, SpeechBusy, BUSY_TEXT, voice_queue_notifier
 from states.chat_states import AIChatState
 from keyboards.main_menu import get_main_menu
 from handlers.admin import is_admin
@@ -94,16 +95,10 @@ async def process_voice_message(message: Message, session: AsyncSession, state:
 
     status_msg = await message.answer("🎧 <i>Слушаю...</i>", parse_mode="HTML")
     
-    # 3. СКАЧИВАЕМ АУДИО
-    temp_filename = f"voice_chat_{message.from_user.id}.ogg"
-    voice_file_info = await bot.get_file(message.voice.file_id)
-    await bot.download_file(voice_file_info.file_path, temp_filename)
-    await asyncio.sleep(0.1)
-
     try:
-        manager = AIManager()
-        # 4. ПЕРЕВОДИМ ГОЛОС В ТЕКСТ
-        recognized_text = await manager.transcribe_voice(temp_filename)
+        manager = AIManager(tier=user_sub)
+        # 3-4. СКАЧИВАЕМ АУДИО В ПАМЯТЬ И ПЕРЕВОДИМ ГОЛОС В ТЕКСТ (повторное голосовое — из кэша)
+        recognized_text = await speech.transcribe_voice(bot, message.voice, on_queued=voice_queue_notifier(status_msg))
 
         if not recognized_text:
             await status_msg.edit_text("❌ Не удалось разобрать слова. Попробуй сказать четче.")
@@ -121,27 +116,26 @@ async def process_voice_message(message: Message, session: AsyncSession, state:
         current_history.append({"role": "user", "content": recognized_text})
         
         u_ctx = {"name": user.name, "goal": user.goal, "weight": user.weight}
-        ai_answer = await manager.get_chat_response(current_history, u_ctx)
+
+        # Ответ печатается прямо в сообщении, по мере генерации
+        reply_msg = await message.answer("💬 <b>Тренер думает...</b>", parse_mode="HTML")
+        manager.on_queued = queue_notifier(reply_msg, "💬 <b>Тренер думает...</b>")
+        ai_answer = await StreamRenderer(reply_msg).render(
+            manager.stream_chat_response(current_history, u_ctx)
+        )
 
         # СТАЛО:
         current_history.append({"role": "assistant", "content": ai_answer})
         await state.update_data(chat_history=current_history[-6:])
-
-        try:
-            await message.answer(ai_answer, parse_mode="HTML")
-        except:
-            await message.answer(ai_answer) # Отправляем чистый текст, если HTML сломался
             
         await status_msg.delete()
 
+    except SpeechBusy:
+        await status_msg.edit_text(BUSY_TEXT)
+
     except Exception as e:
         logger.error(f"Ошибка голоса в чате: {e}")
         await status_msg.edit_text("🔧 Произошла системная ошибка при обработке аудио.")
-    
-    finally:
-        # 7. ЧИСТОТА: Удаляем аудиофайл с диска
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
 
 # ==========================================
 # ОБРАБОТКА ТЕКСТА В ЧАТЕ
@@ -185,11 +179,17 @@ async def process_chat_message(message: Message, state: FSMContext, session: Asy
         current_history = state_data.get("chat_history", [])
         current_history.append({"role": "user", "content": user_text})
 
-        # ЗАПРОС К ИИ
-        manager = AIManager()
+        # ЗАПРОС К ИИ: ответ печатается поверх "Тренер думает..." по мере генерации
+        manager = AIManager(
+            tier=user.subscription_level,
+            on_queued=queue_notifier(loading_msg, "💬 <b>Тренер думает...</b>")
+        )
         u_ctx = {"name": user.name, "goal": user.goal, "weight": user.weight}
         
-        ai_answer = await manager.get_chat_response(current_history, u_ctx)
+        ai_answer = await StreamRenderer(loading_msg).render(
+            manager.stream_chat_response(current_history, u_ctx)
+        )
+        loading_msg = None # Сообщение стало ответом, удалять его больше нельзя
 
         # СПИСАНИЕ ЛИМИТА ЧЕРЕЗ НОВЫЙ МЕТОД
         if not is_admin_user:
@@ -199,17 +199,6 @@ async def process_chat_message(message: Message, state: FSMContext, session: Asy
         current_history.append({"role": "assistant", "content": ai_answer})
         await state.update_data(chat_history=current_history[-6:])
 
-        if loading_msg:
-            try:
-                await loading_msg.delete()
-            except:
-                pass
-        
-        try:
-            await message.answer(ai_answer, parse_mode="HTML")
-        except:
-            await message.answer(ai_answer)
-
     except Exception as e:
         logger.error(f"Final Chat Error: {e}")
         if loading_msg:
@@ -1,9 +1,9 @@
 import uuid
 import re
+import html
 import json
 import datetime
 import time
-import os
 import asyncio
 from aiogram import Router, F, Bot
 from aiogram.filters import Command, StateFilter
@@ -17,8 +17,14 @@ from aiogram.utils.keyboard import ReplyKeyboardBuilder
 
 from handlers.admin import is_admin
 from utils.text_tools import clean_text
-from database.crud import UserCRUD
-from services.ai_manager import AIManager
+from database.crud import UserCRUD, AIJobCRUD
+from services.ai_manager import AIManager, queue_notifier
+from services.program_schema import WorkoutProgram
+from services.diary_parser import parse_diary_text
+from services.exercise_index import exercise_index
+from services.job_queue import job_queue, JobContext
+from services.transcription import speech, SpeechBusy, BUSY_TEXT, voice_queue_notifier
+from config import Config
 from states.workout_states import WorkoutPagination, WorkoutRequest
 from keyboards.pagination import get_pagination_kb
 from database.models import WorkoutLog, ExerciseLog, User
@@ -29,9 +35,32 @@ router = Router()
 # ==========================================
 # 1. ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 # ==========================================
-async def show_workout_pages(message: Message, state: FSMContext, pages: list, from_db: bool = False, completed_days_direct: list = None):
+def is_training_page(pages: list, page_index: int, layout: dict | None = None) -> bool:
+    """Нужна ли на странице кнопка 'Тренировка выполнена' (не отдых и не советы)"""
+    if layout:
+        # Структурированная программа: знаем точно, без разбора текста
+        return page_index < layout["days"] and page_index not in layout["rest"]
+
+    first_line = pages[page_index].split('\n')[0].upper()
+    rest_keywords = ["ВОССТАНОВЛЕНИЕ", "ОТДЫХ", "ВЫХОДНОЙ"]
+    is_rest_day = any(word in first_line for word in rest_keywords)
+    is_advice_page = page_index == len(pages) - 1
+    return not is_rest_day and not is_advice_page
+
+def load_workout_layout(user) -> dict | None:
+    if not user.current_workout_structured:
+        return None
+    try:
+        return WorkoutProgram.from_json(user.current_workout_structured).layout()
+    except Exception:
+        return None
+
+async def show_workout_pages(message: Message, state: FSMContext, pages: list, from_db: bool = False, completed_days_direct: list = None, edit_message: Message = None, pending: bool = False, layout: dict = None):
+    # pending=True: программа еще догружается (стрим) — показываем День 1 без кнопок.
+    # edit_message: уже отправленное превью, которое нужно обновить, а не слать новое.
+    # layout: разметка структурированной программы (WorkoutProgram.layout()), None — текстовая программа.
     # 1. Сохраняем страницы и сбрасываем текущую на 0
-    await state.update_data(workout_pages=pages, current_page=0)
+    await state.update_data(workout_pages=pages, current_page=0, workout_layout=layout)
     
     # Если передали список выполненных дней напрямую (при загрузке из БД)
     if completed_days_direct is not None:
@@ -51,15 +80,9 @@ async def show_workout_pages(message: Message, state: FSMContext, pages: list, f
     base_kb = get_pagination_kb(current_page, len(pages), page_type="workout")
     
     # 3. Логика кнопки "Выполнено"
-    # Проверяем, не день отдыха ли это
-    first_line = page_text.split('\n')[0].upper()
-    rest_keywords = ["ВОССТАНОВЛЕНИЕ", "ОТДЫХ", "ВЫХОДНОЙ"]
-    is_rest_day = any(word in first_line for word in rest_keywords)
-    is_advice_page = current_page == len(pages) - 1
-
     rows = []
     # Добавляем кнопку выполнения ПЕРВЫМ рядом, если это не отдых и не советы
-    if not is_rest_day and not is_advice_page:
+    if is_training_page(pages, current_page, layout):
         if current_page in check_list:
             btn_text, btn_cb = "🔄 Отменить выполнение", f"workout_undo_{current_page}"
         else:
@@ -79,16 +102,26 @@ async def show_workout_pages(message: Message, state: FSMContext, pages: list, f
     if current_page in check_list:
          display_text += "\n\n🌟 <b>Эта тренировка выполнена!</b>"
 
+    if pending:
+        # Пока остальные дни генерируются, кнопки не показываем: листать еще нечего
+        display_text += f"\n\n⏳ <i>Тренер дописывает остальные дни... Готово страниц: {len(pages)}</i>"
+        final_keyboard = None
+
     # 5. Отправка (с защитой от дублей)
     try:
+        if edit_message is not None:
+            return await edit_message.edit_text(display_text, reply_markup=final_keyboard, parse_mode="HTML")
         if isinstance(message, Message):
-            await message.answer(display_text, reply_markup=final_keyboard, parse_mode="HTML")
+            return await message.answer(display_text, reply_markup=final_keyboard, parse_mode="HTML")
         else:
             # Если это редактирование старого сообщения
-            await message.edit_text(display_text, reply_markup=final_keyboard, parse_mode="HTML")
+            return await message.edit_text(display_text, reply_markup=final_keyboard, parse_mode="HTML")
     except Exception:
+        if pending and edit_message is not None:
+            # Промежуточная правка не прошла (flood control) — не страшно, догоним следующей
+            return edit_message
         # Если редактирование не прошло (например, текст тот же), шлем новое
-        await message.answer(display_text, reply_markup=final_keyboard, parse_mode="HTML")
+        return await message.answer(display_text, reply_markup=final_keyboard, parse_mode="HTML")
 
 async def start_wishes_step(message: Message, state: FSMContext):
     kb = ReplyKeyboardBuilder()
@@ -136,7 +169,7 @@ async def show_saved_program(message: Message, session: AsyncSession, state: FSM
                 except: continue
             
             # Сохраняем и показываем
-            await show_workout_pages(message, state, saved_pages, from_db=True, completed_days_direct=completed_days)
+            await show_workout_pages(message, state, saved_pages, from_db=True, completed_days_direct=completed_days, layout=load_workout_layout(user))
         except Exception as e:
             await message.answer("⚠️ Ошибка загрузки программы. Попробуйте создать новую.")
     else:
@@ -256,6 +289,8 @@ async def force_regen_workout(callback: CallbackQuery, state: FSMContext):
 # ==========================================
 # 3. ГЕНЕРАЦИЯ ПРОГРАММЫ (CORE)
 # ==========================================
+WORKOUT_LOADING_TEXT = "🗓 <b>Тренер изучает историю и составляет программу...</b>"
+
 async def generate_workout_process(message: Message, session: AsyncSession, user, state: FSMContext, wishes: str = None):
     # --- 1. ЗАЩИТА ОТ СПАМА (Раз в 5 минут) ---
     state_data = await state.get_data()
@@ -278,70 +313,117 @@ async def generate_workout_process(message: Message, session: AsyncSession, user
             parse_mode="HTML"
         )
         return
+
+    # Программа уже составляется (например, задача ждет повтора после сбоя) — вторую не ставим
+    if await AIJobCRUD.get_active(session, user.telegram_id, "workout_program"):
+        await message.answer("⏳ <b>Тренер уже составляет твою программу.</b>\nПришлю ее, как только будет готова.", parse_mode=ParseMode.HTML)
+        return
     
     await state.update_data(last_workout_gen_time=current_time)
-    loading_msg = await message.answer("🗓 <b>Тренер изучает историю и составляет программу...</b>", parse_mode=ParseMode.HTML)
-    
-    try:
-        # --- НОВОЕ: ОПРЕДЕЛЯЕМ ГЛУБИНУ ИСТОРИИ ПО ТАРИФУ ---
-        history_limit = 0
-        sub_level = user.subscription_level.lower() if user.subscription_level else "free"
-        
-        if sub_level == "ultra":
-            history_limit = 5
-        elif sub_level in ["standart", "standard"]:
-            history_limit = 3
-        elif sub_level == "lite":
-            history_limit = 1
-            
-        # --- НОВОЕ: ДОСТАЕМ ИСТОРИЮ ИЗ АРХИВА ---
-        past_programs = []
-        if history_limit > 0:
-            past_programs = await UserCRUD.get_program_history(session, user.telegram_id, 'workout', history_limit)
-        
-        # Склеиваем прошлые программы в один текст, чтобы ИИ мог их прочитать
-        history_text = "\n\n=== ПРОШЛАЯ ПРОГРАММА ===\n\n".join(past_programs) if past_programs else ""
-
-        user_data = {
-            "workout_days": user.workout_days, "goal": user.goal, "gender": user.gender,
-            "weight": user.weight, "age": user.age, "workout_level": user.workout_level,
-            "name": user.name, "height": user.height, "wishes": wishes, 
-            "current_workout_program": user.current_workout_program,
-            "past_programs": history_text # <-- Передаем историю ИИ
-        }
-        
-        # ГЕНЕРАЦИЯ
-        ai_service = AIManager()
-        raw_pages = await ai_service.generate_workout_pages(user_data)
-        
-        if not raw_pages or (len(raw_pages) == 1 and "Ошибка" in raw_pages[0]):
-            await loading_msg.edit_text("❌ Ошибка генерации. Попробуйте позже.")
-            return
-
-        cleaned_pages = [clean_text(p) for p in raw_pages]
+    loading_msg = await message.answer(WORKOUT_LOADING_TEXT, parse_mode=ParseMode.HTML)
 
-        # --- 3. СОХРАНЕНИЕ В БД И АРХИВ ---
-        pages_json = json.dumps(cleaned_pages, ensure_ascii=False)
-        user.current_workout_program = pages_json
-        user.current_workout_program_id = str(uuid.uuid4()) # Генерируем уникальный ID
-        # Безопасное списание лимита
-        if not is_admin_user:
-            await UserCRUD.decrement_workout_limit(session, user.telegram_id)
-        
-        # --- НОВОЕ: СОХРАНЯЕМ В АРХИВ ---
-        await UserCRUD.save_program_history(session, user.telegram_id, 'workout', pages_json)
+    # --- 3. ГЕНЕРАЦИЯ В ФОНОВОЙ ОЧЕРЕДИ ---
+    # Задача лежит в БД: если бот перезапустится посреди генерации, воркер начнет ее заново
+    await job_queue.enqueue(
+        session, "workout_program", user.telegram_id, message.chat.id,
+        status_message_id=loading_msg.message_id, payload={"wishes": wishes}
+    )
 
-        await session.commit()
-        await UserCRUD.update_user(session, user.telegram_id, current_workout_program=pages_json)
+@job_queue.handler("workout_program")
+async def run_workout_job(ctx: JobContext):
+    """Воркер очереди: генерирует недельную программу, показывает ее по мере готовности и сохраняет"""
+    session = ctx.session
+    user = await UserCRUD.get_user(session, ctx.job.user_id)
+    if not user:
+        return
+    is_admin_user = is_admin(user.telegram_id)
+    loading_msg = ctx.status_message()
+    state = ctx.state()
+    if ctx.attempt > 1:
+        await ctx.progress(WORKOUT_LOADING_TEXT)
+
+    # --- НОВОЕ: ОПРЕДЕЛЯЕМ ГЛУБИНУ ИСТОРИИ ПО ТАРИФУ ---
+    history_limit = 0
+    sub_level = user.subscription_level.lower() if user.subscription_level else "free"
+    
+    if sub_level == "ultra":
+        history_limit = 5
+    elif sub_level in ["standart", "standard"]:
+        history_limit = 3
+    elif sub_level == "lite":
+        history_limit = 1
+        
+    # --- НОВОЕ: ДОСТАЕМ ИСТОРИЮ ИЗ АРХИВА ---
+    past_programs = []
+    if history_limit > 0:
+        past_programs = await UserCRUD.get_program_digests(session, user.telegram_id, 'workout', history_limit)
+    
+    # Склеиваем выжимки прошлых программ (упражнения по дням, сплит, повторы) в один текст
+    history_text = "\n\n=== ПРОШЛАЯ ПРОГРАММА ===\n".join(past_programs) if past_programs else ""
+
+    user_data = {
+        "workout_days": user.workout_days, "goal": user.goal, "gender": user.gender,
+        "weight": user.weight, "age": user.age, "workout_level": user.workout_level,
+        "name": user.name, "height": user.height, "wishes": ctx.payload.get("wishes"), 
+        "current_workout_program": user.current_workout_program,
+        "past_programs": history_text # <-- Передаем историю ИИ
+    }
+    
+    # ГЕНЕРАЦИЯ (ПОТОКОМ): День 1 показываем сразу в статусном сообщении, остальные страницы догружаются
+    ai_service = AIManager(
+        tier=user.subscription_level,
+        on_queued=queue_notifier(loading_msg, WORKOUT_LOADING_TEXT) if loading_msg else None
+    )
+    cleaned_pages = []
+    preview_msg = None
+    # JSON-режим: дни и упражнения придут структурой, страницы рисуются из нее
+    program = WorkoutProgram() if Config.AI_STRUCTURED_OUTPUT else None
+
+    async for page in ai_service.stream_workout_pages(user_data, program=program):
+        cleaned_pages.append(clean_text(page))
+
+        if len(cleaned_pages) == 1:
+            if not cleaned_pages[0] or "Ошибка" in cleaned_pages[0]:
+                break
+            await state.update_data(completed_days=[])
+            if loading_msg:
+                preview_msg = await show_workout_pages(loading_msg, state, cleaned_pages, from_db=False, completed_days_direct=[], edit_message=loading_msg, pending=True)
+        elif preview_msg is not None:
+            await show_workout_pages(preview_msg, state, cleaned_pages, from_db=False, completed_days_direct=[], edit_message=preview_msg, pending=True)
+
+    if not cleaned_pages or not cleaned_pages[0] or "Ошибка" in cleaned_pages[0]:
+        # Очередь повторит попытку, а после последней покажет ошибку
+        raise RuntimeError("Модель не вернула программу")
+
+    # Проверка комплектности: недостающие и пустые дни досоставляются коротким запросом, а не всей программой заново
+    cleaned_pages = await ai_service.complete_workout_pages(user_data, cleaned_pages, program)
+    if len(cleaned_pages) < 2:
+        raise RuntimeError("Программа не собралась даже после досоставления")
+
+    # --- СОХРАНЕНИЕ В БД И АРХИВ ---
+    pages_json = json.dumps(cleaned_pages, ensure_ascii=False)
+    structured_json = program.to_json() if program and program.days else None
+    layout = program.layout() if structured_json else None
+    user.current_workout_program = pages_json
+    user.current_workout_structured = structured_json
+    user.current_workout_program_id = str(uuid.uuid4()) # Генерируем уникальный ID
+    # Безопасное списание лимита (только за готовую программу)
+    if not is_admin_user:
+        await UserCRUD.decrement_workout_limit(session, user.telegram_id)
+    
+    # --- НОВОЕ: СОХРАНЯЕМ В АРХИВ ---
+    await UserCRUD.save_program_history(session, user.telegram_id, 'workout', pages_json, structured=structured_json)
 
-        await loading_msg.delete()
-        
-        # 🔥 ВАЖНО: Очищаем список выполненных дней для НОВОЙ программы
-        await state.update_data(completed_days=[])
-        await show_workout_pages(message, state, cleaned_pages, from_db=False, completed_days_direct=[])
-        
-    except Exception as e:
-        await loading_msg.edit_text(f"Ошибка: {e}")
+    await session.commit()
+    await UserCRUD.update_user(session, user.telegram_id, current_workout_program=pages_json, current_workout_structured=structured_json)
+    
+    # 🔥 ВАЖНО: Очищаем список выполненных дней для НОВОЙ программы
+    await state.update_data(completed_days=[])
+    # Превращаем превью в полноценную программу с листалкой
+    if preview_msg is not None:
+        await show_workout_pages(preview_msg, state, cleaned_pages, from_db=False, completed_days_direct=[], edit_message=preview_msg, layout=layout)
+    else:
+        await ctx.bot.send_message(ctx.job.chat_id, "✅ <b>Программа готова!</b> Открой ее кнопкой «📅 Моя программа».", parse_mode=ParseMode.HTML)
 
 # --- ЛОГИКА ГЕНЕРАЦИИ РАЗОВОЙ ТРЕНИРОВКИ ---
 @router.message(WorkoutRequest.waiting_for_quick_workout_wishes)
@@ -392,7 +474,10 @@ async def process_quick_workout_wishes(message: Message, session: AsyncSession,
             "wishes": user_wishes 
         }
         
-        ai_service = AIManager()
+        ai_service = AIManager(
+            tier=user.subscription_level,
+            on_queued=queue_notifier(loading_msg, "⚡️ <b>Тренер составляет быструю тренировку...</b>")
+        )
         # Создадим новый метод в AIManager для разовой тренировки
         workout_text = await ai_service.generate_single_workout(user_data) 
         
@@ -453,13 +538,9 @@ async def change_page(callback: CallbackQuery, state: FSMContext):
         
         # Логика кнопок
         base_kb = get_pagination_kb(target_page, len(pages), page_type="workout")
-        first_line = page_text.split('\n')[0].upper()
-        rest_keywords = ["ВОССТАНОВЛЕНИЕ", "ОТДЫХ", "ВЫХОДНОЙ"]
-        is_rest_day = any(word in first_line for word in rest_keywords)
-        is_advice_page = target_page == len(pages) - 1
 
         rows = []
-        if not is_rest_day and not is_advice_page:
+        if is_training_page(pages, target_page, data.get("workout_layout")):
             if target_page in completed_days:
                 btn_text, btn_cb = "🔄 Отменить выполнение", f"workout_undo_{target_page}"
             else:
@@ -716,7 +797,7 @@ async def exit_log_exercise(message: Message, state: FSMContext):
     data = await state.get_data()
     pages = data.get("workout_pages")
     if pages:
-        await show_workout_pages(message, state, pages, from_db=True)
+        await show_workout_pages(message, state, pages, from_db=True, layout=data.get("workout_layout"))
 
 # Ловим и ТЕКСТ, и ГОЛОС одной функцией
 # ИСПРАВЛЕНА ОШИБКА ЗДЕСЬ: заменено waiting_for_wishes на waiting_for_weights
@@ -730,10 +811,10 @@ async def process_workout_weights(message: Message, session: AsyncSession, state
     # ==========================================
     # 1. ПРОВЕРКА ЛИМИТОВ (ДЛЯ ДНЕВНИКА - ЭТО ЧАТ ЛИМИТ)
     # ==========================================
-    if not is_admin_user and (user.chat_limit or 0) <= 0:
-        kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="🚀 Апгрейд / Подписка", callback_data="buy_premium")]])
-        await message.answer("❌ <b>Лимит вопросов исчерпан!</b>\n\nОформите подписку или приобретите <b>Апгрейд</b>, чтобы продолжить вести дневник.", reply_markup=kb, parse_mode="HTML")
-        return
+    # Лимит тратится только на разбор через ИИ: аккуратные записи разбираются локально бесплатно
+    limit_exhausted = not is_admin_user and (user.chat_limit or 0) <= 0
+    limit_kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="🚀 Апгрейд / Подписка", callback_data="buy_premium")]])
+    limit_text = "❌ <b>Лимит вопросов исчерпан!</b>\n\nОформите подписку или приобретите <b>Апгрейд</b>, чтобы продолжить вести дневник."
 
     # ==========================================
     # 2. БЛОКИРОВКА ГОЛОСОВЫХ ПО ТАРИФАМ
@@ -768,25 +849,20 @@ async def process_workout_weights(message: Message, session: AsyncSession, state
             await message.answer("⚠️ Голосовое слишком длинное! Пожалуйста, уложись в 1 минуту.")
             return
 
-        file_id = message.voice.file_id
-        file = await bot.get_file(file_id)
-        temp_filename = f"voice_workout_{message.from_user.id}.ogg"
-        
         # 🔥 НОВОЕ: Включаем статус "печатает...", пока идет загрузка и обработка
         from aiogram.enums import ChatAction
         await bot.send_chat_action(chat_id=message.chat.id, action=ChatAction.TYPING)
-        
-        await bot.download_file(file.file_path, temp_filename)
-        await asyncio.sleep(0.1) 
 
         try:
-            manager = AIManager()
-            input_text = await manager.transcribe_voice(temp_filename)
+            # Голосовое скачивается в память и декодируется там же; повторное берется из кэша
+            input_text = await speech.transcribe_voice(
+                bot, message.voice, on_queued=voice_queue_notifier(status_msg, "⏳ <i>Обрабатываю данные...</i>")
+            )
+        except SpeechBusy:
+            await status_msg.edit_text(BUSY_TEXT)
+            return
         except Exception as e:
             print(f"Ошибка транскрибации: {e}")
-        finally:
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
         
         if not input_text:
             await status_msg.edit_text("📝 Не удалось разобрать слова. Пожалуйста, скажите чуть четче.")
@@ -801,88 +877,115 @@ async def process_workout_weights(message: Message, session: AsyncSession, state
         input_text = message.text
 
     # ==========================================
-    # 4. ОБЩАЯ ЧАСТЬ: ОТПРАВКА В ИИ И СОХРАНЕНИЕ
+    # 4. ОБЩАЯ ЧАСТЬ: ЛОКАЛЬНЫЙ РАЗБОР, ИИ — ТОЛЬКО ДЛЯ НЕПОНЯТНОГО
     # ==========================================
     try:
         state_data = await state.get_data()
         workout_type = state_data.get("workout_type", "Тренировка")
 
-        # 🔥 1. В промпте просим только 5 колонок (БЕЗ ПОДХОДОВ)
-        parse_prompt = (
-            "Ты — строгий фитнес-аналитик. Твоя задача: привести упражнение к ЕДИНОМУ СТАНДАРТУ для базы данных.\n\n"
-            "ПРАВИЛА КАНОНИЧНОГО НАЗВАНИЯ:\n"
-            "1. ФОРМУЛА: [Упражнение] + [Снаряд] + [Позиция] + [Угол].\n"
-            "2. УГЛЫ: Если указаны градусы (30, 45 и т.д.), ОБЯЗАТЕЛЬНО добавь их в конец.\n"
-            "   Пример: 'жим на наклонной 30 град' -> 'Жим штанги в наклоне 30'\n"
-            "3. УДАЛЯЙ МУСОР: слова 'скамья', 'градусов', 'поочередно'.\n"
-            "4. ТРЕНАЖЕРЫ: Смит, Хаммер заменяй на 'в тренажере'.\n"
-            "5. НЮАНСЫ: Любые уточнения хватов, стоек (узко, широко, обратным) выноси СТРОГО в колонку Нюанс. Если их нет, ставь прочерк '-'.\n\n"
-            "СТРОГОЕ ПРАВИЛО: Верни результат списком. НЕ ПИШИ ЗАГОЛОВОК ТАБЛИЦЫ, ВЫВОДИ ТОЛЬКО ДАННЫЕ. Формат:\n"
-            "Оригинал | Каноничное | Нюанс | Вес | Повторы\n"
-            f"Текст: {input_text}"
-        )
-        
-        manager = AIManager()
-        # Вызываем ИИ
-        ai_response = await manager.get_chat_response([{"role": "user", "content": parse_prompt}], {})
-        
-        # Парсим железобетонно
-        lines = ai_response.strip().split('\n')
-        saved_exercises = []
-        
-        for line in lines:
-            if '|' not in line: continue # Пропускаем пустые строки
-            
-            # Игнорируем шапку таблицы от ИИ
-            if "Каноничное" in line or "Вес" in line or "Оригинальное" in line or "Нюанс" in line:
-                continue
-                
-            parts = line.split('|')
-            # 🔥 2. ОЖИДАЕМ 5 КОЛОНОК
-            if len(parts) >= 5:
-                try:
-                    orig_name = parts[0].strip()
-                    canon_name = parts[1].strip()
-                    comment = parts[2].strip() if parts[2].strip() != "-" else "" 
-                    
-                    weight_match = re.search(r"[\d\.]+", parts[3].strip().replace(',', '.'))
-                    weight = float(weight_match.group(0)) if weight_match else 0.0
-                    
-                    reps_match = re.search(r"\d+", parts[4].strip())
-                    reps = int(reps_match.group(0)) if reps_match else 0
-                    
-                    # СОХРАНЕНИЕ В БАЗУ
-                    new_log = WorkoutLog(
-                        user_id=message.from_user.id,
-                        workout_type=workout_type, 
-                        exercise_name=orig_name,
-                        canonical_name=canon_name,
-                        comment=comment, 
-                        weight=weight,
-                        reps=reps,
-                        sets=1, # 🔥 Оставляем 1 под капотом для БД, чтобы ничего не сломать
-                        date=datetime.datetime.now()
-                    )
-                    session.add(new_log)
-                    
-                    # 🔥 3. Формируем чистый ответ для интерфейса
-                    comment_text = f" ({comment})" if comment else ""
-                    saved_exercises.append(f"🔹 <b>{canon_name}</b>{comment_text}\n└ {weight} кг x {reps}")
-                    
-                except Exception as parse_err:
-                    print(f"⚠️ Ошибка парсинга строки: {line} | {parse_err}")
+        # 🔥 1. Сначала разбираем сами: "Жим лежа 80 10", "Присед 100 5х5" и т.п.
+        parsed = parse_diary_text(input_text)
+        # Знакомые упражнения получают то же название, что и в прошлый раз (словарь из дневника)
+        rows = [
+            (e.name, exercise_index.lookup(e.name) or exercise_index.lookup(e.canonical, fuzzy=False) or e.canonical,
+             e.comment, e.weight, e.reps, e.sets)
+            for e in parsed.entries
+        ]
+        ai_response = ""
+        used_ai = False
+        skipped = []
+
+        if parsed.leftovers and limit_exhausted:
+            if not rows:
+                await status_msg.edit_text(limit_text, reply_markup=limit_kb, parse_mode="HTML")
+                return
+            skipped = parsed.leftovers
+        elif parsed.leftovers:
+            # 🔥 2. В ИИ уходят только куски, которые не удалось разобрать локально
+            leftover_text = "\n".join(parsed.leftovers)
+            parse_prompt = (
+                "Ты — строгий фитнес-аналитик. Твоя задача: привести упражнение к ЕДИНОМУ СТАНДАРТУ для базы данных.\n\n"
+                "ПРАВИЛА КАНОНИЧНОГО НАЗВАНИЯ:\n"
+                "1. ФОРМУЛА: [Упражнение] + [Снаряд] + [Позиция] + [Угол].\n"
+                "2. УГЛЫ: Если указаны градусы (30, 45 и т.д.), ОБЯЗАТЕЛЬНО добавь их в конец.\n"
+                "   Пример: 'жим на наклонной 30 град' -> 'Жим штанги в наклоне 30'\n"
+                "3. УДАЛЯЙ МУСОР: слова 'скамья', 'градусов', 'поочередно'.\n"
+                "4. ТРЕНАЖЕРЫ: Смит, Хаммер заменяй на 'в тренажере'.\n"
+                "5. НЮАНСЫ: Любые уточнения хватов, стоек (узко, широко, обратным) выноси СТРОГО в колонку Нюанс. Если их нет, ставь прочерк '-'.\n\n"
+                "СТРОГОЕ ПРАВИЛО: Верни результат списком. НЕ ПИШИ ЗАГОЛОВОК ТАБЛИЦЫ, ВЫВОДИ ТОЛЬКО ДАННЫЕ. Формат:\n"
+                "Оригинал | Каноничное | Нюанс | Вес | Повторы\n"
+                f"Текст: {leftover_text}"
+            )
+
+            manager = AIManager(
+                tier=user.subscription_level,
+                on_queued=queue_notifier(status_msg, "⏳ <i>Обрабатываю данные...</i>")
+            )
+            # Вызываем ИИ
+            ai_response = await manager.parse_text("workout_diary", parse_prompt)
+            used_ai = True
+
+            # Парсим железобетонно
+            for line in ai_response.strip().split('\n'):
+                if '|' not in line: continue # Пропускаем пустые строки
+
+                # Игнорируем шапку таблицы от ИИ
+                if "Каноничное" in line or "Вес" in line or "Оригинальное" in line or "Нюанс" in line:
                     continue
-        
+
+                parts = line.split('|')
+                # 🔥 ОЖИДАЕМ 5 КОЛОНОК
+                if len(parts) >= 5:
+                    try:
+                        comment = parts[2].strip() if parts[2].strip() != "-" else ""
+
+                        weight_match = re.search(r"[\d\.]+", parts[3].strip().replace(',', '.'))
+                        weight = float(weight_match.group(0)) if weight_match else 0.0
+
+                        reps_match = re.search(r"\d+", parts[4].strip())
+                        reps = int(reps_match.group(0)) if reps_match else 0
+
+                        orig_name, canon_name = parts[0].strip(), parts[1].strip()
+                        canon_name = exercise_index.lookup(orig_name, fuzzy=False) or canon_name
+                        rows.append((orig_name, canon_name, comment, weight, reps, 1))
+                    except Exception as parse_err:
+                        print(f"⚠️ Ошибка парсинга строки: {line} | {parse_err}")
+                        continue
+
+        saved_exercises = []
+        for orig_name, canon_name, comment, weight, reps, sets in rows:
+            exercise_index.learn(orig_name, canon_name)
+            # СОХРАНЕНИЕ В БАЗУ: одна строка = один подход ("5х5" превращается в 5 записей)
+            for _ in range(sets):
+                session.add(WorkoutLog(
+                    user_id=message.from_user.id,
+                    workout_type=workout_type,
+                    exercise_name=orig_name,
+                    canonical_name=canon_name,
+                    comment=comment,
+                    weight=weight,
+                    reps=reps,
+                    sets=1, # 🔥 Оставляем 1 под капотом для БД, чтобы ничего не сломать
+                    date=datetime.datetime.now()
+                ))
+
+            # 🔥 3. Формируем чистый ответ для интерфейса
+            comment_text = f" ({html.escape(comment)})" if comment else ""
+            sets_text = f" ({sets} подх.)" if sets > 1 else ""
+            saved_exercises.append(f"🔹 <b>{html.escape(canon_name)}</b>{comment_text}\n└ {weight} кг x {reps}{sets_text}")
+
         # Фиксируем изменения в базе
         await session.commit()
-        
-        # Списываем лимит только при успешной записи (БЕЗОПАСНО)
-        if saved_exercises and not is_admin(message.from_user.id):
+
+        # Списываем лимит только если ходили в ИИ и запись прошла успешно (БЕЗОПАСНО)
+        if used_ai and saved_exercises and not is_admin_user:
             await UserCRUD.decrement_chat_limit(session, message.from_user.id)
 
         # Формируем ответ пользователю
         if saved_exercises:
             result_text = "✨ <b>Записано в дневник:</b>\n\n" + "\n\n".join(saved_exercises)
+            if skipped:
+                result_text += "\n\n⚠️ Не удалось разобрать (лимит вопросов исчерпан): " + "; ".join(html.escape(s) for s in skipped)
             result_text += "\n\n<i>✍️ Пиши/диктуй дальше или нажми «Завершить»</i>"
             await status_msg.edit_text(result_text, parse_mode="HTML")
         else:
@@ -13,7 +13,7 @@ from sqlalchemy import select, desc, func, distinct
 from handlers.admin import is_admin
 from database.crud import UserCRUD
 from database.models import WeightHistory, WorkoutLog, NutritionLog, ExerciseLog
-from services.ai_manager import AIManager
+from services.ai_manager import AIManager, queue_notifier
 from services.graph_service import GraphService
 from keyboards.main_menu import get_main_menu
 
@@ -57,7 +57,10 @@ async def process_instant_analysis(callback: CallbackQuery, session: AsyncSessio
         status_msg = callback.message
     # -----------------------------------------------
 
-    manager = AIManager()
+    manager = AIManager(
+        tier=user.subscription_level,
+        on_queued=queue_notifier(status_msg, "⏳ <i>Тренер изучает твои данные...</i>")
+    )
     
     # 🔥 Оборачиваем ВЕСЬ код в try, чтобы бот не зависал при сбоях БД или графиков
     try:
@@ -326,7 +329,10 @@ async def process_weight_and_analyze(message: Message, state: FSMContext, sessio
                              f"Дай короткий совет. ВАЖНО: Не используй слово 'Вердикт' в своем ответе. "
                              f"Пиши строго только про вес. Без приветствий (максимум 500 символов).")
 
-        ai = AIManager()
+        ai = AIManager(
+            tier=user.subscription_level,
+            on_queued=queue_notifier(temp_msg, "⏳ <i>Тренер анализирует данные...</i>")
+        )
         ai_feedback = await ai.analyze_progress({
             "name": user.name, "weight": new_weight, "goal": extended_goal, "workout_days": user.workout_days
         }, new_weight, workouts_count)
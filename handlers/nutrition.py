@@ -1,6 +1,6 @@
-import os
 import asyncio
 import datetime
+import html
 import time
 import json
 import re
@@ -17,8 +17,14 @@ from sqlalchemy import select, func
 
 from database.models import NutritionLog
 from handlers.admin import is_admin
-from database.crud import UserCRUD
-from services.ai_manager import AIManager 
+from database.crud import UserCRUD, AIJobCRUD
+from services.ai_manager import AIManager, queue_notifier
+from services.program_schema import NutritionProgram
+from services.food_matcher import parse_meal_text
+from services.job_queue import job_queue, JobContext
+from services.nutrition_editor import is_edit_request, latest_wish
+from services.transcription import speech, SpeechBusy, BUSY_TEXT, voice_queue_notifier
+from config import Config
 from keyboards.main_menu import get_main_menu
 from states.workout_states import WorkoutRequest, WorkoutPagination 
 from services.recipe_service import search_recipe_video
@@ -48,6 +54,37 @@ def clean_text(text: str) -> str:
     text = text.replace("###", "").replace("Menu:", "")
     return text.strip()
 
+# ==========================================
+# УЛУЧШЕННЫЙ ПАРСЕР: СЧИТАЕМ СРЕДНЕЕ (160-180 -> 170)
+# ==========================================
+# Нужен только для меню в текстовом режиме: в JSON-режиме цели берутся из NutritionProgram.targets()
+def set_targets_from_text(user, pages: list):
+    full_plan_text = " ".join(pages)
+    
+    def get_average(pattern, text):
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            # Если найден диапазон (есть две группы цифр)
+            if match.group(2): 
+                val1 = int(match.group(1))
+                val2 = int(match.group(2))
+                return (val1 + val2) // 2
+            # Если найдена только одна цифра
+            return int(match.group(1))
+        return 0
+
+    # Калории (ищем число или диапазон, например 2200-2400)
+    user.target_calories = get_average(r'КБЖУ.*?(\d{3,4})(?:-(\d{3,4}))?\s*ккал', full_plan_text)
+    
+    # Белки (Б: 160-180 или Б: 160)
+    user.target_protein = get_average(r'Б:\s*(\d+)(?:-(\d+))?', full_plan_text)
+    
+    # Жиры (Ж: 70-90 или Ж: 80)
+    user.target_fat = get_average(r'Ж:\s*(\d+)(?:-(\d+))?', full_plan_text)
+    
+    # Углеводы (У: 200-250 или У: 220)
+    user.target_carbs = get_average(r'У:\s*(\d+)(?:-(\d+))?', full_plan_text)
+
 async def show_pages(message: Message, state: FSMContext, pages: list, from_db: bool = False):
     if isinstance(pages, str):
         pages = [pages]
@@ -190,6 +227,8 @@ async def ask_nutrition_wishes(message: Message, state: FSMContext):
 # ==========================================
 # ГЕНЕРАЦИЯ МЕНЮ (С ПРОВЕРКОЙ ЛИМИТОВ)
 # ==========================================
+NUTRITION_LOADING_TEXT = "👨‍🍳 <b>Тренер составляет меню...</b>"
+
 async def generate_nutrition_process(message: Message, session: AsyncSession, user, state: FSMContext, wishes: str, status_msg: Message = None):
     user_state_data = await state.get_data()
     last_gen_time = user_state_data.get("last_nutrition_gen_time", 0)
@@ -215,114 +254,130 @@ async def generate_nutrition_process(message: Message, session: AsyncSession, us
             parse_mode="HTML"
         )
         return
+
+    # Меню уже составляется — вторую генерацию не ставим
+    if await AIJobCRUD.get_active(session, user.telegram_id, "nutrition_program"):
+        if status_msg:
+            try: await status_msg.delete()
+            except: pass
+        await message.answer("⏳ <b>Тренер уже составляет твое меню.</b>\nПришлю его, как только будет готово.", parse_mode="HTML")
+        return
     
     await state.update_data(last_nutrition_gen_time=current_time)
+    if status_msg is None:
+        status_msg = await message.answer(NUTRITION_LOADING_TEXT, parse_mode="HTML")
 
-    try:
-        history_limit = 0
-        sub_level = user.subscription_level.lower() if user.subscription_level else "free"
-        
-        if sub_level == "ultra": history_limit = 5
-        elif sub_level in ["standart", "standard"]: history_limit = 3
-        elif sub_level == "lite": history_limit = 1
-            
-        past_programs = []
-        if history_limit > 0:
-            past_programs = await UserCRUD.get_program_history(session, user.telegram_id, 'nutrition', history_limit)
-        
-        history_text = "\n\n=== ПРОШЛОЕ МЕНЮ ===\n\n".join(past_programs) if past_programs else ""
-
-        user_data = {
-            "goal": user.goal, "gender": user.gender, "weight": user.weight, 
-            "age": user.age, "activity_level": user.activity_level, "height": user.height,
-            "name": user.name, "wishes": wishes, "current_nutrition_program": user.current_nutrition_program,
-            "past_programs": history_text
-        }
-        
-        ai_service = AIManager()
-        raw_pages = await ai_service.generate_nutrition_pages(user_data)
-        
-        if not raw_pages or "❌" in raw_pages[0]:
-            if status_msg: 
-                try: await status_msg.delete()
-                except: pass
-            await message.answer("❌ Сервер перегружен, попробуй позже.")
-            return
+    # 2. ГЕНЕРАЦИЯ В ФОНОВОЙ ОЧЕРЕДИ (переживает перезапуск бота, сбойные попытки повторяются)
+    await job_queue.enqueue(
+        session, "nutrition_program", user.telegram_id, message.chat.id,
+        status_message_id=status_msg.message_id, payload={"wishes": wishes}
+    )
 
-        pages_json = json.dumps(raw_pages, ensure_ascii=False)
-        user.current_nutrition_program = pages_json
-        
-        # ==========================================
-        # УЛУЧШЕННЫЙ ПАРСЕР: СЧИТАЕМ СРЕДНЕЕ (160-180 -> 170)
-        # ==========================================
-        full_plan_text = " ".join(raw_pages)
-        
-        def get_average(pattern, text):
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                # Если найден диапазон (есть две группы цифр)
-                if match.group(2): 
-                    val1 = int(match.group(1))
-                    val2 = int(match.group(2))
-                    return (val1 + val2) // 2
-                # Если найдена только одна цифра
-                return int(match.group(1))
-            return 0
-
-        # Калории (ищем число или диапазон, например 2200-2400)
-        user.target_calories = get_average(r'КБЖУ.*?(\d{3,4})(?:-(\d{3,4}))?\s*ккал', full_plan_text)
-        
-        # Белки (Б: 160-180 или Б: 160)
-        user.target_protein = get_average(r'Б:\s*(\d+)(?:-(\d+))?', full_plan_text)
-        
-        # Жиры (Ж: 70-90 или Ж: 80)
-        user.target_fat = get_average(r'Ж:\s*(\d+)(?:-(\d+))?', full_plan_text)
-        
-        # Углеводы (У: 200-250 или У: 220)
-        user.target_carbs = get_average(r'У:\s*(\d+)(?:-(\d+))?', full_plan_text)
-        # ==========================================
+async def edit_nutrition_in_place(ai_service: AIManager, user, user_data: dict, wish: str):
+    """Точечная правка сохраненного меню. (None, None) — правка на все меню, нужна полная генерация."""
+    try:
+        pages = json.loads(user.current_nutrition_program)
+    except (TypeError, ValueError):
+        pages = [user.current_nutrition_program]
+    program = None
+    if user.current_nutrition_structured:
+        try:
+            program = NutritionProgram.from_json(user.current_nutrition_structured)
+        except Exception:
+            program = None
+
+    new_pages = await ai_service.edit_nutrition_pages(user_data, pages, wish, program=program)
+    if new_pages is None:
+        return None, None
+    return new_pages, program
+
+async def nutrition_job_failed(ctx: JobContext, error: str):
+    await ctx.progress("❌ Сервер перегружен, попробуй позже.")
+
+@job_queue.handler("nutrition_program", on_failure=nutrition_job_failed)
+async def run_nutrition_job(ctx: JobContext):
+    """Воркер очереди: генерирует меню, сохраняет его и присылает первую страницу"""
+    session = ctx.session
+    user = await UserCRUD.get_user(session, ctx.job.user_id)
+    if not user:
+        return
+    is_admin_user = is_admin(user.telegram_id)
+    status_msg = ctx.status_message()
+    if ctx.attempt > 1:
+        await ctx.progress(NUTRITION_LOADING_TEXT)
 
-        await session.commit()
+    history_limit = 0
+    sub_level = user.subscription_level.lower() if user.subscription_level else "free"
+    
+    if sub_level == "ultra": history_limit = 5
+    elif sub_level in ["standart", "standard"]: history_limit = 3
+    elif sub_level == "lite": history_limit = 1
         
-        # 2. БЕЗОПАСНОЕ СПИСАНИЕ ЛИМИТА
-        if not is_admin_user:
-            await UserCRUD.decrement_workout_limit(session, user.telegram_id)
-
-        await UserCRUD.save_program_history(session, user.telegram_id, 'nutrition', pages_json)
+    past_programs = []
+    if history_limit > 0:
+        past_programs = await UserCRUD.get_program_digests(session, user.telegram_id, 'nutrition', history_limit)
+    
+    # Из прошлых меню нужны только названия блюд, чтобы не повторяться
+    history_text = "\n\n=== ПРОШЛОЕ МЕНЮ ===\n".join(past_programs) if past_programs else ""
+
+    user_data = {
+        "goal": user.goal, "gender": user.gender, "weight": user.weight, 
+        "age": user.age, "activity_level": user.activity_level, "height": user.height,
+        "name": user.name, "wishes": ctx.payload.get("wishes"), "current_nutrition_program": user.current_nutrition_program,
+        "past_programs": history_text
+    }
+    
+    ai_service = AIManager(
+        tier=user.subscription_level,
+        on_queued=queue_notifier(status_msg, NUTRITION_LOADING_TEXT) if status_msg else None
+    )
+    # Правка вида "замени перекус": переписываем только страницы этих приемов пищи, остальное меню не трогаем
+    raw_pages = None
+    wishes = ctx.payload.get("wishes")
+    if ctx.attempt == 1 and is_edit_request(user.current_nutrition_program, wishes):
+        raw_pages, program = await edit_nutrition_in_place(ai_service, user, user_data, latest_wish(wishes))
+
+    if raw_pages is None:
+        # JSON-режим: цели КБЖУ и блюда придут структурой, страницы рисуются из нее.
+        # Повторная попытка после сбоя идет в обычном текстовом режиме (запасной путь).
+        program = NutritionProgram() if Config.AI_STRUCTURED_OUTPUT and ctx.attempt == 1 else None
+        raw_pages = await ai_service.generate_nutrition_pages(user_data, program=program)
+        if ctx.attempt > 1:
+            raw_pages = [clean_text(p) for p in raw_pages if len(p) > 20]
+    
+    if not raw_pages or "❌" in raw_pages[0]:
+        # Очередь повторит попытку, а после последней сообщит об ошибке
+        raise RuntimeError("Модель не вернула меню")
+
+    pages_json = json.dumps(raw_pages, ensure_ascii=False)
+    structured_json = program.to_json() if program and program.meals else None
+    user.current_nutrition_program = pages_json
+    user.current_nutrition_structured = structured_json
+    
+    if structured_json:
+        # Цели берем из полей программы (середина диапазонов), текст не разбираем
+        for field_name, value in program.targets().items():
+            setattr(user, field_name, value)
+    else:
+        set_targets_from_text(user, raw_pages)
 
-        if status_msg:
-            try: await status_msg.delete()
-            except: pass
+    await session.commit()
+    
+    # 3. БЕЗОПАСНОЕ СПИСАНИЕ ЛИМИТА (только за готовое меню)
+    if not is_admin_user:
+        await UserCRUD.decrement_workout_limit(session, user.telegram_id)
 
-        await state.update_data(nutrition_pages=raw_pages, current_page=0)
-        await message.answer(
-            raw_pages[0], parse_mode=ParseMode.HTML,
-            reply_markup=get_nutrition_kb_with_diary(0, len(raw_pages))
-        )
+    await UserCRUD.save_program_history(session, user.telegram_id, 'nutrition', pages_json, structured=structured_json)
 
-    except Exception as e:
-        if status_msg: 
-            try: await status_msg.delete()
-            except: pass
-        print(f"Ошибка: {e}")
-        
-        ai = AIManager()
-        raw_pages = await ai.generate_nutrition_pages(user_data)
-        
-        cleaned_pages = [clean_text(p) for p in raw_pages if len(p) > 20]
-        
-        if not cleaned_pages:
-            await message.answer("⚠️ Тренер задумался и ничего не ответил. Попробуй еще раз.")
-            return
+    if status_msg:
+        try: await status_msg.delete()
+        except: pass
 
-        pages_json = json.dumps(cleaned_pages, ensure_ascii=False)
-        await UserCRUD.update_user(session, user.telegram_id, current_nutrition_program=pages_json)
-        
-        if not is_admin_user:
-            await UserCRUD.decrement_workout_limit(session, user.telegram_id)
-            
-        await UserCRUD.save_program_history(session, user.telegram_id, 'nutrition', pages_json)
-        await show_pages(message, state, cleaned_pages, from_db=False)
+    await ctx.state().update_data(nutrition_pages=raw_pages, current_page=0)
+    await ctx.bot.send_message(
+        ctx.job.chat_id, raw_pages[0], parse_mode=ParseMode.HTML,
+        reply_markup=get_nutrition_kb_with_diary(0, len(raw_pages))
+    )
 
 # --- ЛИСТАЛКА И WISHES ---
 @router.callback_query(F.data.startswith("nutrition_page_"))
@@ -363,7 +418,7 @@ async def process_nutrition_wishes(message: Message, state: FSMContext, session:
     await state.update_data(wishes=combined_wishes)
     user = await UserCRUD.get_user(session, message.from_user.id)
     
-    status_msg = await message.answer("👨‍🍳 <b>Тренер составляет меню...</b>", parse_mode="HTML")
+    status_msg = await message.answer(NUTRITION_LOADING_TEXT, parse_mode="HTML")
     await generate_nutrition_process(message, session, user, state, wishes=combined_wishes, status_msg=status_msg)
 
 @router.callback_query(F.data == "recipe_search")
@@ -418,16 +473,15 @@ async def process_nutrition_input(message: Message, session: AsyncSession, state
     is_admin_user = is_admin(message.from_user.id)
 
     # 1. ПРОВЕРКА ЛИМИТОВ ВОПРОСОВ (ДЛЯ ДНЕВНИКА ИСПОЛЬЗУЕТСЯ ЛИМИТ ЧАТА)
-    if not is_admin_user and (user.chat_limit or 0) <= 0:
-        kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🚀 Апгрейд / Подписка", callback_data="buy_premium")]
-        ])
-        await message.answer(
-            "❌ <b>Лимит исчерпан!</b>\n\n"
-            "У вас закончились вопросы. Оформите подписку или приобретите разовый <b>Апгрейд</b>, чтобы продолжить вести дневник.",
-            reply_markup=kb, parse_mode="HTML"
-        )
-        return
+    # Лимит нужен только для расчета через ИИ: продукты из локальной таблицы считаются бесплатно
+    limit_exhausted = not is_admin_user and (user.chat_limit or 0) <= 0
+    limit_kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🚀 Апгрейд / Подписка", callback_data="buy_premium")]
+    ])
+    limit_text = (
+        "❌ <b>Лимит исчерпан!</b>\n\n"
+        "У вас закончились вопросы. Оформите подписку или приобретите разовый <b>Апгрейд</b>, чтобы продолжить вести дневник."
+    )
 
     # 2. ПРОВЕРКА ГОЛОСОВЫХ И ТАРИФА
     if message.voice and not is_admin_user:
@@ -453,84 +507,108 @@ async def process_nutrition_input(message: Message, session: AsyncSession, state
             return
 
     status_msg = await message.answer("📡 <i>Раскладываю еду на белки, жиры и углеводы...</i>", parse_mode="HTML")
-    manager = AIManager()
+    manager = AIManager(
+        tier=user.subscription_level,
+        on_queued=queue_notifier(status_msg, "📡 <i>Раскладываю еду на белки, жиры и углеводы...</i>")
+    )
     
     try:
         if message.voice:
-            file_id = message.voice.file_id
-            file = await bot.get_file(file_id)
-            temp_filename = f"voice_nut_{message.from_user.id}.ogg"
-            
             await bot.send_chat_action(chat_id=message.chat.id, action=ChatAction.TYPING)
-            await bot.download_file(file.file_path, temp_filename)
-            await asyncio.sleep(0.1)
-            
-            user_text = await manager.transcribe_voice(temp_filename)
-            
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
+
+            try:
+                # В память, без временного файла; пересланное голосовое берется из кэша
+                user_text = await speech.transcribe_voice(
+                    bot, message.voice,
+                    on_queued=voice_queue_notifier(status_msg, "📡 <i>Раскладываю еду на белки, жиры и углеводы...</i>")
+                )
+            except SpeechBusy:
+                await status_msg.edit_text(BUSY_TEXT)
+                return
         else:
             user_text = message.text
 
-        current_time = datetime.datetime.now().strftime("%H:%M")
-
-        parse_prompt = (
-            f"Ты — строгий калькулятор калорий. Текущее время пользователя: {current_time}.\n"
-            "Определи тип приема пищи строго по времени:\n"
-            "- 06:00-10:00 — Завтрак\n"
-            "- 10:00-12:00 — Перекус\n"
-            "- 12:00-15:00 — Обед\n"
-            "- 15:00-17:00 — Перекус\n"
-            "- 17:00-20:00 — Ужин\n"
-            "- 20:00-06:00 — Перекус\n\n"
-            "Если пользователь сам указал тип (например, 'на обед...'), приоритет его словам.\n"
-            "Рассчитай для каждого продукта: Вес(г), Калории, Белки(г), Жиры(г), Углеводы(г).\n\n"
-            "СТРОГИЕ ПРАВИЛА РАСЧЕТА КБЖУ:\n"
-            "1. ПРИНЦИП 'ГОТОВОГО БЛЮДА': Макароны, рис, крупы считай как ВАРЕНЫЕ (110-140 ккал/100г), если не указано 'сухой вес'.\n"
-            "2. ПРОВЕРКА: 300г готовых макарон не могут быть 1100 ккал. Это ~350-450 ккал.\n"
-            "3. СЛОЖНЫЕ БЛЮДА: Если указано блюдо (борщ, плов), считай среднюю порцию по ГОСТу.\n"
-            "4. ЧИСЛА: Используй точку как разделитель (например, 15.5), а не запятую.\n\n"
-            "ВЕРНИ СТРОГО СПИСКОМ БЕЗ ЛИШНЕГО ТЕКСТА:\n"
-            "Тип | Название | Вес | Калории | Белки | Жиры | Углеводы\n"
-            "ПРИМЕР: Завтрак | Овсяная каша на молоке | 250 | 260 | 8.5 | 9.2 | 35.0\n"
-            f"Текст пользователя: {user_text}"
-        )
-        
-        parsed_response = await manager.get_chat_response([{"role": "user", "content": parse_prompt}], {})
-        
-        lines = parsed_response.strip().split('\n')
+        now = datetime.datetime.now()
+        current_time = now.strftime("%H:%M")
+
+        # Сначала считаем по локальной таблице продуктов, в ИИ — только то, чего в ней нет
+        parsed = parse_meal_text(user_text, now=now)
+        rows = [(i.meal, i.name, i.weight, i.calories, i.protein, i.fat, i.carbs) for i in parsed.items]
+        used_ai = False
+        skipped = []
+
+        if parsed.leftovers and limit_exhausted:
+            if not rows:
+                await status_msg.edit_text(limit_text, reply_markup=limit_kb, parse_mode="HTML")
+                return
+            skipped = parsed.leftovers
+        elif parsed.leftovers:
+            leftover_text = ", ".join(parsed.leftovers)
+            if parsed.meal:
+                leftover_text = f"на {parsed.meal.lower()}: {leftover_text}"
+
+            parse_prompt = (
+                f"Ты — строгий калькулятор калорий. Текущее время пользователя: {current_time}.\n"
+                "Определи тип приема пищи строго по времени:\n"
+                "- 06:00-10:00 — Завтрак\n"
+                "- 10:00-12:00 — Перекус\n"
+                "- 12:00-15:00 — Обед\n"
+                "- 15:00-17:00 — Перекус\n"
+                "- 17:00-20:00 — Ужин\n"
+                "- 20:00-06:00 — Перекус\n\n"
+                "Если пользователь сам указал тип (например, 'на обед...'), приоритет его словам.\n"
+                "Рассчитай для каждого продукта: Вес(г), Калории, Белки(г), Жиры(г), Углеводы(г).\n\n"
+                "СТРОГИЕ ПРАВИЛА РАСЧЕТА КБЖУ:\n"
+                "1. ПРИНЦИП 'ГОТОВОГО БЛЮДА': Макароны, рис, крупы считай как ВАРЕНЫЕ (110-140 ккал/100г), если не указано 'сухой вес'.\n"
+                "2. ПРОВЕРКА: 300г готовых макарон не могут быть 1100 ккал. Это ~350-450 ккал.\n"
+                "3. СЛОЖНЫЕ БЛЮДА: Если указано блюдо (борщ, плов), считай среднюю порцию по ГОСТу.\n"
+                "4. ЧИСЛА: Используй точку как разделитель (например, 15.5), а не запятую.\n\n"
+                "ВЕРНИ СТРОГО СПИСКОМ БЕЗ ЛИШНЕГО ТЕКСТА:\n"
+                "Тип | Название | Вес | Калории | Белки | Жиры | Углеводы\n"
+                "ПРИМЕР: Завтрак | Овсяная каша на молоке | 250 | 260 | 8.5 | 9.2 | 35.0\n"
+                f"Текст пользователя: {leftover_text}"
+            )
+
+            parsed_response = await manager.parse_text("nutrition_diary", parse_prompt)
+            used_ai = True
+
+            for line in parsed_response.strip().split('\n'):
+                parts = line.split('|')
+                if len(parts) >= 7:
+                    try:
+                        rows.append((
+                            parts[0].strip().capitalize(),
+                            parts[1].strip().capitalize(),
+                            float(parts[2].strip().replace(',', '.')),
+                            float(parts[3].strip().replace(',', '.')),
+                            float(parts[4].strip().replace(',', '.')),
+                            float(parts[5].strip().replace(',', '.')),
+                            float(parts[6].strip().replace(',', '.')),
+                        ))
+                    except ValueError: continue
+
         report = "📝 <b>Добавлено в дневник КБЖУ:</b>\n\n"
-        
         added_logs_ids = []
-        
-        for line in lines:
-            parts = line.split('|')
-            if len(parts) >= 7:
-                try:
-                    meal = parts[0].strip().capitalize()
-                    name = parts[1].strip().capitalize()
-                    weight = float(parts[2].strip().replace(',', '.'))
-                    kcal = float(parts[3].strip().replace(',', '.'))
-                    p = float(parts[4].strip().replace(',', '.'))
-                    f = float(parts[5].strip().replace(',', '.'))
-                    c = float(parts[6].strip().replace(',', '.'))
-                    
-                    new_log = NutritionLog(
-                        user_id=message.from_user.id, meal_type=meal,
-                        product_name=name, weight=weight,
-                        calories=kcal, protein=p, fat=f, carbs=c
-                    )
-                    session.add(new_log)
-                    await session.flush() 
-                    added_logs_ids.append(new_log.id)
-                    
-                    report += f"🕒 <b>{meal}</b> | 🍽 <b>{name}</b> ({weight}г)\n├ 🔥 {kcal} ккал\n└ 🥩 Б:{p} | 🧈 Ж:{f} | 🍞 У:{c}\n\n"
-                except ValueError: continue
-        
+
+        for meal, name, weight, kcal, p, f, c in rows:
+            new_log = NutritionLog(
+                user_id=message.from_user.id, meal_type=meal,
+                product_name=name, weight=weight,
+                calories=kcal, protein=p, fat=f, carbs=c
+            )
+            session.add(new_log)
+            await session.flush()
+            added_logs_ids.append(new_log.id)
+
+            report += f"🕒 <b>{html.escape(meal)}</b> | 🍽 <b>{html.escape(name)}</b> ({weight}г)\n├ 🔥 {kcal} ккал\n└ 🥩 Б:{p} | 🧈 Ж:{f} | 🍞 У:{c}\n\n"
+
+        if skipped:
+            report += f"⚠️ Не посчитано (лимит вопросов исчерпан): {'; '.join(html.escape(s) for s in skipped)}\n\n"
+
         await session.commit()
 
-        # 3. БЕЗОПАСНОЕ СПИСАНИЕ ЛИМИТА
-        if added_logs_ids and not is_admin_user:
+        # 3. БЕЗОПАСНОЕ СПИСАНИЕ ЛИМИТА (только если считал ИИ)
+        if used_ai and added_logs_ids and not is_admin_user:
             await UserCRUD.decrement_chat_limit(session, message.from_user.id)
         
         if added_logs_ids:
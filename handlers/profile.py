@@ -10,6 +10,7 @@ from sqlalchemy import select, func, desc, cast, Date, distinct
 
 from database.crud import UserCRUD
 from database.models import WorkoutLog, ExerciseLog
+from services.exercise_index import exercise_index
 from states.user_states import EditForm
 from keyboards.main_menu import get_main_menu
 from keyboards.builders import (
@@ -380,8 +381,8 @@ async def show_exercise_diary(callback: CallbackQuery, session: AsyncSession):
             continue
 
         comment = getattr(log, 'comment', '') or ""
-        # Группируем по связке "Название + Нюанс"
-        name_key = f"{name.lower().strip()}_{comment.lower().strip()}"
+        # Группируем по связке "Название + Нюанс" (название — готовый ключ из словаря упражнений)
+        name_key = f"{exercise_index.group_key(name)}_{comment.lower().strip()}"
         
         if name_key not in latest_logs_dict:
             latest_logs_dict[name_key] = log
@@ -404,12 +405,12 @@ async def show_exercise_diary(callback: CallbackQuery, session: AsyncSession):
     for log in page_logs:
         date_str = log.date.strftime("%d.%m")
         weight_display = int(log.weight) if log.weight.is_integer() else log.weight
-        name = log.canonical_name if log.canonical_name else log.exercise_name
+        name = exercise_index.group_key(log.canonical_name if log.canonical_name else log.exercise_name)
         
         comment = getattr(log, 'comment', '') or ""
         comment_str = f" ({comment})" if comment else ""
         
-        text += f"🏋️‍♂️ <b>{name.capitalize()}</b>{comment_str}: {weight_display} кг х {log.reps} <i>({date_str})</i>\n"
+        text += f"🏋️‍♂️ <b>{name}</b>{comment_str}: {weight_display} кг х {log.reps} <i>({date_str})</i>\n"
         
     text += "\n<i>💡 Чтобы обновить результат, просто запиши новый вес на тренировке.</i>"
     
@@ -1,3 +1,7 @@
+import time
+
+STARTED_AT = time.perf_counter()  # Для замера холодного старта (импорты + БД + AI)
+
 import asyncio
 import logging
 import sys
@@ -17,6 +21,10 @@ from database.database import init_db, async_session
 from handlers import start, help, profile, nutrition, ai_workout, ai_chat, analysis, admin, common, payments
 from middlewares.db_middleware import DbSessionMiddleware
 from services.scheduler import setup_scheduler
+from services.llm_providers import init_ai_client, warmup_ai_client, close_ai_client
+from services.exercise_index import exercise_index
+from services.job_queue import job_queue
+from services.transcription import speech
 
 # 1. Основная настройка (оставляем INFO, чтобы видеть твои ракеты и галочки)
 logging.basicConfig(
@@ -58,6 +66,17 @@ async def main():
         logger.critical(f"❌ Ошибка подключения к БД: {e}")
         return
 
+    # --- СЛОВАРЬ УПРАЖНЕНИЙ ИЗ ДНЕВНИКА ---
+    try:
+        async with async_session() as db_session:
+            await exercise_index.load(db_session)
+    except Exception as e:
+        logger.error(f"⚠️ Словарь упражнений не загружен: {e}")
+
+    # --- ОБЩИЙ ПУЛ СОЕДИНЕНИЙ С AI ---
+    if init_ai_client():
+        await warmup_ai_client()
+
    # 1. Прописываем ВАШЕ личное зеркало на Cloudflare:
     custom_server = TelegramAPIServer(
         base="https://lucky-waterfall-1ff7.ovchinnikov-sergey89.workers.dev/bot{token}/{method}",
@@ -100,16 +119,26 @@ async def main():
         
     )
 
+    # --- ФОНОВАЯ ОЧЕРЕДЬ ГЕНЕРАЦИЙ (после роутеров: обработчики задач регистрируются в хендлерах) ---
+    await job_queue.start(bot, async_session, dp.storage)
+
     await on_startup(bot)
     await bot.delete_webhook(drop_pending_updates=True)
-    logger.info("🤖 Бот начал прослушивание...")
+    logger.info(f"🤖 Бот начал прослушивание... (холодный старт {time.perf_counter() - STARTED_AT:.1f}с)")
+
+    # --- WHISPER: грузим в фоне, бот уже отвечает. Голосовые до готовности модели просто подождут ---
+    if Config.WHISPER_PRELOAD:
+        speech.warm_up()
     
     try:
         await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"❌ Бот упал с ошибкой: {e}")
     finally:
+        await job_queue.stop()
+        await speech.shutdown()
         await bot.session.close()
+        await close_ai_client()
         logger.info("🛑 Бот остановлен")
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+
+from openai.types.chat import ChatCompletion
+from openai.types import CompletionUsage
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+# ==========================================
+# ЗАПИСЬ И ВОСПРОИЗВЕДЕНИЕ ОТВЕТОВ AI (КАССЕТЫ)
+# ==========================================
+# AI_CASSETTE=record — запросы идут в настоящий API, ответы (и задержки) дописываются в файл.
+# AI_CASSETTE=replay — API не нужен вовсе: ответ на тот же запрос берется из файла.
+# Если запрос изменился (поменяли промпт), в replay будет CassetteMiss — так видно, что кассету пора перезаписать.
+# Обертка стоит на уровне роутера провайдеров: очередь, склейка и метрики AIManager работают как обычно.
+
+# Дата и день недели в промптах меняются каждый день — в ключе кассеты они не участвуют
+DATE_RE = re.compile(r"\b\d{1,2}\.\d{1,2}(?:\.\d{2,4})?\b")
+WEEKDAY_RE = re.compile(r"Понедельник|Вторник|Среда|Четверг|Пятница|Суббота|Воскресенье", re.IGNORECASE)
+
+
+class CassetteMiss(KeyError):
+    """На такой запрос в кассете нет записи"""
+
+
+class Cassette:
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+        logger.info(f"📼 Кассета {path}: {len(self.entries)} записей")
+
+    @staticmethod
+    def key(kind: str, messages: list, temperature: float, params: dict) -> str:
+        normalized = []
+        for m in messages:
+            content = " ".join(str(m["content"]).split())
+            content = WEEKDAY_RE.sub("<день>", DATE_RE.sub("<дата>", content))
+            normalized.append({"role": m["role"], "content": content})
+        # stream_options и max_tokens не меняют сам ответ по смыслу
+        params = {k: v for k, v in params.items() if k not in ("stream_options", "max_tokens")}
+        raw = json.dumps([kind, temperature, params, normalized], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            raise CassetteMiss(f"Нет записи в кассете {self.path} (промпт изменился?)")
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: dict):
+        entry = {"key": key, **entry}
+        self.entries[key] = entry
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class RecordingRouter:
+    """Пропускает запросы в настоящий роутер и записывает ответы в кассету"""
+    def __init__(self, router, cassette: Cassette):
+        self.router = router
+        self.cassette = cassette
+
+    def stats(self) -> dict:
+        return self.router.stats()
+
+    async def complete(self, messages: list, temperature: float, timeout: float, hedge: bool = False,
+                       route: list | None = None, **params):
+        started = time.perf_counter()
+        r = await self.router.complete(messages, temperature, timeout, hedge=hedge, route=route, **params)
+        self.cassette.put(Cassette.key("complete", messages, temperature, params), {
+            "kind": "complete", "latency": time.perf_counter() - started, "response": r.model_dump(mode="json"),
+        })
+        return r
+
+    async def stream(self, messages: list, temperature: float, timeout: float, hedge: bool = False,
+                     usage_sink: dict | None = None, route: list | None = None, **params):
+        sink = usage_sink if usage_sink is not None else {}
+        chunks = []
+        started = time.perf_counter()
+        first_token = None
+        async for delta in self.router.stream(
+            messages, temperature, timeout, hedge=hedge, usage_sink=sink, route=route, **params
+        ):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            chunks.append(delta)
+            yield delta
+        usage = sink.get("usage")
+        self.cassette.put(Cassette.key("stream", messages, temperature, params), {
+            "kind": "stream", "latency": time.perf_counter() - started, "ttft": first_token or 0.0,
+            "chunks": chunks, "model": sink.get("model"),
+            "usage": usage.model_dump(mode="json") if usage is not None else None,
+        })
+
+
+class ReplayRouter:
+    """Отвечает из кассеты без сети. realtime=True — выдерживает записанные задержки (для бенчмарков)."""
+    def __init__(self, cassette: Cassette, realtime: bool = False):
+        self.cassette = cassette
+        self.realtime = realtime
+
+    def stats(self) -> dict:
+        return {"providers": {}, "hedges": 0, "hedge_wins": 0, "failovers": 0}
+
+    async def complete(self, messages: list, temperature: float, timeout: float, hedge: bool = False,
+                       route: list | None = None, **params):
+        entry = self.cassette.get(Cassette.key("complete", messages, temperature, params))
+        if self.realtime:
+            await asyncio.sleep(entry.get("latency", 0.0))
+        return ChatCompletion.model_validate(entry["response"])
+
+    async def stream(self, messages: list, temperature: float, timeout: float, hedge: bool = False,
+                     usage_sink: dict | None = None, route: list | None = None, **params):
+        entry = self.cassette.get(Cassette.key("stream", messages, temperature, params))
+        chunks = entry.get("chunks") or []
+        if self.realtime:
+            await asyncio.sleep(entry.get("ttft", 0.0))
+        pause = max(0.0, entry.get("latency", 0.0) - entry.get("ttft", 0.0)) / max(1, len(chunks))
+        for i, delta in enumerate(chunks):
+            if self.realtime and i:
+                await asyncio.sleep(pause)
+            yield delta
+        if usage_sink is not None and entry.get("usage"):
+            usage_sink["usage"] = CompletionUsage.model_validate(entry["usage"])
+            usage_sink["model"] = entry.get("model")
+
+
+_cassette: Cassette | None = None
+
+
+def cassette_router(router):
+    """Оборачивает роутер провайдеров по Config.AI_CASSETTE. Без кассеты возвращает его как есть."""
+    global _cassette
+    mode = Config.AI_CASSETTE
+    if mode not in ("record", "replay"):
+        return router
+    if _cassette is None:
+        _cassette = Cassette(Config.AI_CASSETTE_PATH)
+    if mode == "replay":
+        return ReplayRouter(_cassette, realtime=Config.AI_CASSETTE_REALTIME)
+    return RecordingRouter(router, _cassette) if router else None
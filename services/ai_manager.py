@@ -3,47 +3,598 @@ import os
 import logging
 import datetime
 import re
+import json
+import hashlib
+from dataclasses import dataclass, asdict
 from datetime import timedelta
 import asyncio
+import time
+import heapq
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
 from aiogram.enums import ChatAction
-from openai import AsyncOpenAI
 from config import Config
 from utils.text_tools import clean_text
-
-# --- НОВОЕ: ИМПОРТИРУЕМ ЛОКАЛЬНЫЙ WHISPER ---
-from faster_whisper import WhisperModel
+from services.llm_providers import get_router, parse_route
+from services.ai_cassette import cassette_router
+from services.program_schema import (
+    WorkoutProgram, WorkoutDay, NutritionProgram, Meal, JsonObjectStream, ProgramParseError,
+    parse_json_reply, WORKOUT_JSON_SPEC, NUTRITION_JSON_SPEC
+)
+from services.workout_validator import WorkoutCheck, check_workout_pages, check_workout_program
+from services.nutrition_editor import is_edit_request, wish_targets, meal_key, meal_page_index, append_shopping_items
+from services.transcription import speech
 
 logger = logging.getLogger(__name__)
 
-# 🔥 ГЛОБАЛЬНАЯ ПЕРЕМЕННАЯ: Загружаем модель ОДИН РАЗ при старте.
-# compute_type="int8" сильно снизит нагрузку на процессор и оперативку VDS!
-try:
-    whisper_model = WhisperModel("base", device="cpu", compute_type="int8")
-except Exception as e:
-    logger.error(f"Не удалось загрузить Whisper: {e}")
-    whisper_model = None
+# ==========================================
+# ОЧЕРЕДЬ ЗАПРОСОВ К LLM (ОГРАНИЧЕНИЕ ПАРАЛЛЕЛЬНОСТИ + ПРИОРИТЕТЫ)
+# ==========================================
+# Чем меньше число, тем раньше запрос попадет к API
+AI_PRIORITIES = {
+    "ultra": 0,
+    "standard": 1,
+    "lite": 2,
+    "free": 3,
+    "background": 4,  # Планировщик: мотивация, автопостинг
+}
+
+
+class AIRequestScheduler:
+    """
+    Пропускает к API не больше max_concurrency запросов одновременно.
+    Остальные ждут в очереди по приоритету тарифа (при равном приоритете — по порядку прихода).
+    """
+    def __init__(self, max_concurrency: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters = []  # heap: [priority, seq, future]
+        self._seq = itertools.count()
+
+        # --- МЕТРИКИ ---
+        self.admitted = 0
+        self.queued = 0
+        self.timed_out = 0
+        self.max_depth = 0
+        self._waits = {p: deque(maxlen=500) for p in AI_PRIORITIES.values()}
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for w in self._waiters if not w[2].done())
+
+    def _position(self, entry: list) -> int:
+        """Место в очереди, начиная с 1"""
+        return 1 + sum(1 for w in self._waiters if w[:2] < entry[:2] and not w[2].done())
+
+    @asynccontextmanager
+    async def slot(self, priority: int, on_queued=None):
+        await self._acquire(priority, on_queued)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int, on_queued=None):
+        started = time.monotonic()
+        if self._active < self.max_concurrency and not self.depth:
+            self._active += 1
+            self._admit(priority, 0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), future]
+        heapq.heappush(self._waiters, entry)
+        self.queued += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+        last_position = None
+        try:
+            while True:
+                position = self._position(entry)
+                if on_queued and position != last_position:
+                    last_position = position
+                    try:
+                        await on_queued(position)
+                    except Exception as e:
+                        logger.debug(f"Не удалось показать место в очереди: {e}")
+                try:
+                    # Просыпаемся раз в несколько секунд, чтобы обновить место в очереди
+                    await asyncio.wait_for(asyncio.shield(future), timeout=5.0)
+                    break
+                except asyncio.TimeoutError:
+                    if time.monotonic() - started > self.queue_timeout:
+                        self.timed_out += 1
+                        raise
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Слот уже успели передать нам — возвращаем его следующему
+                self._release()
+            else:
+                future.cancel()
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+        self._admit(priority, time.monotonic() - started)
+
+    def _admit(self, priority: int, waited: float):
+        self.admitted += 1
+        self._waits[priority].append(waited)
+
+    def _release(self):
+        # Передаем слот следующему ожидающему напрямую, не уменьшая счетчик активных
+        while self._waiters:
+            entry = heapq.heappop(self._waiters)
+            if not entry[2].done():
+                entry[2].set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self) -> dict:
+        tier_by_priority = {p: tier for tier, p in AI_PRIORITIES.items()}
+        depth_by_tier = {tier: 0 for tier in AI_PRIORITIES}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth_by_tier[tier_by_priority[priority]] += 1
+
+        wait_by_tier = {}
+        for tier, priority in AI_PRIORITIES.items():
+            waits = sorted(self._waits[priority])
+            if waits:
+                wait_by_tier[tier] = {
+                    "avg": sum(waits) / len(waits),
+                    "p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))],
+                    "max": waits[-1],
+                }
+
+        return {
+            "active": self._active,
+            "limit": self.max_concurrency,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "timed_out": self.timed_out,
+            "depth_by_tier": depth_by_tier,
+            "wait_by_tier": wait_by_tier,
+        }
+
+
+ai_scheduler = AIRequestScheduler(Config.AI_MAX_CONCURRENCY, Config.AI_QUEUE_TIMEOUT)
+
+
+def queue_notifier(status_msg, text: str):
+    """Колбэк для очереди: дописывает к статусному сообщению текущее место пользователя"""
+    async def notify(position: int):
+        await status_msg.edit_text(
+            f"{text}\n\n🚦 <i>Сейчас много запросов. Ты {position}-й в очереди к тренеру...</i>",
+            parse_mode="HTML"
+        )
+    return notify
+
+
+# ==========================================
+# СКЛЕЙКА ОДИНАКОВЫХ ЗАПРОСОВ (SINGLE-FLIGHT)
+# ==========================================
+class AIRequestCoalescer:
+    """
+    Если такой же промпт уже ушел в API и ответ еще не пришел,
+    новый вызов не идет к модели, а ждет тот же ответ.
+    Ключ — хэш задачи, параметров и сообщений с нормализованными пробелами.
+    """
+    def __init__(self):
+        self._inflight = {}  # key -> asyncio.Task
+
+        # --- МЕТРИКИ ---
+        self.hits = 0
+        self.misses = 0
+        self.hits_by_task = {}
+
+    @staticmethod
+    def make_key(task: str, messages: list, temperature: float, params: dict) -> str:
+        normalized = [
+            {"role": m["role"], "content": " ".join(str(m["content"]).split())}
+            for m in messages
+        ]
+        raw = json.dumps([task, temperature, params, normalized], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def run(self, key: str, task: str, factory):
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            self.hits_by_task[task] = self.hits_by_task.get(task, 0) + 1
+            logger.info(f"AI single-flight: '{task}' ждет уже идущий запрос")
+        else:
+            self.misses += 1
+            inflight = asyncio.create_task(factory())
+            self._inflight[key] = inflight
+            inflight.add_done_callback(lambda t: self._forget(key, t))
+
+        # shield: если один из ждущих отменен, общий запрос для остальных продолжается
+        return await asyncio.shield(inflight)
+
+    def _forget(self, key: str, inflight: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Забираем исключение, даже если все ждущие уже отменены (иначе asyncio ругается в лог)
+        if not inflight.cancelled():
+            inflight.exception()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "inflight": len(self._inflight),
+            "hits_by_task": dict(self.hits_by_task),
+        }
+
+
+ai_coalescer = AIRequestCoalescer()
+
+
+# ==========================================
+# КЭШ ПРОМПТОВ НА СТОРОНЕ ПРОВАЙДЕРА
+# ==========================================
+# DeepSeek и Groq кэшируют одинаковое НАЧАЛО промпта. Поэтому длинные правила вынесены
+# в неизменный system-префикс, а данные клиента идут в конце (user-сообщение).
+def cached_prompt_tokens(usage) -> int:
+    """DeepSeek: usage.prompt_cache_hit_tokens; OpenAI-совместимые (Groq): usage.prompt_tokens_details.cached_tokens"""
+    if usage is None:
+        return 0
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details else None
+    return int(cached or 0)
+
+
+class PromptCacheStats:
+    """Сколько токенов промпта провайдер взял из кэша и насколько быстрее такие ответы (по задачам)"""
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.features = {}
+
+    def record(self, feature: str, usage, latency: float):
+        if usage is None:
+            return
+        f = self.features.get(feature)
+        if f is None:
+            f = self.features[feature] = {
+                "requests": 0, "hits": 0, "prompt_tokens": 0, "cached_tokens": 0,
+                "hit_latency": deque(maxlen=self.window), "miss_latency": deque(maxlen=self.window),
+            }
+        cached = cached_prompt_tokens(usage)
+        f["requests"] += 1
+        f["prompt_tokens"] += int(getattr(usage, "prompt_tokens", 0) or 0)
+        f["cached_tokens"] += cached
+        if cached:
+            f["hits"] += 1
+            f["hit_latency"].append(latency)
+        else:
+            f["miss_latency"].append(latency)
+
+    def stats(self) -> dict:
+        result = {}
+        for feature, f in self.features.items():
+            hit_avg = sum(f["hit_latency"]) / len(f["hit_latency"]) if f["hit_latency"] else None
+            miss_avg = sum(f["miss_latency"]) / len(f["miss_latency"]) if f["miss_latency"] else None
+            saved = None
+            if hit_avg is not None and miss_avg is not None:
+                saved = max(0.0, miss_avg - hit_avg) * f["hits"]
+            result[feature] = {
+                "requests": f["requests"],
+                "hits": f["hits"],
+                "prompt_tokens": f["prompt_tokens"],
+                "cached_tokens": f["cached_tokens"],
+                "token_hit_ratio": f["cached_tokens"] / f["prompt_tokens"] if f["prompt_tokens"] else 0.0,
+                "hit_latency": hit_avg,
+                "miss_latency": miss_avg,
+                "saved_seconds": saved,
+            }
+        return result
+
+
+prompt_cache = PromptCacheStats()
+
+
+# ==========================================
+# МАРШРУТЫ ЗАДАЧ: МОДЕЛЬ И НАСТРОЙКИ ПОД КАЖДЫЙ ТИП ЗАПРОСА
+# ==========================================
+# Разбор дневника — короткий ответ в строгом формате: ему хватает маленькой быстрой модели
+# и низкой температуры. Программы, меню и чат остаются на основной модели.
+@dataclass(frozen=True)
+class TaskRoute:
+    backend: str = "smart"             # "fast" (Config.AI_FAST_ROUTE) или "smart" (Config.AI_SMART_ROUTE)
+    temperature: float | None = None   # None — как передал вызывающий метод
+    max_tokens: int | None = None
+    timeout: float | None = None
+
+
+TASK_ROUTES = {
+    "workout_diary": TaskRoute("fast", temperature=0.1, max_tokens=600, timeout=20.0),
+    "nutrition_diary": TaskRoute("fast", temperature=0.1, max_tokens=600, timeout=20.0),
+    "motivation_batch": TaskRoute("fast", max_tokens=3000, timeout=60.0),
+    "motivation_pool": TaskRoute("fast", max_tokens=4000, timeout=90.0),
+    "chat": TaskRoute("smart", max_tokens=800),
+    "analysis": TaskRoute("smart", max_tokens=900),
+    "marketing": TaskRoute("smart", max_tokens=900),
+    "single_workout": TaskRoute("smart", max_tokens=1500),
+    "workout_program": TaskRoute("smart", max_tokens=6000),
+    "workout_repair": TaskRoute("smart", max_tokens=3000),
+    "nutrition_program": TaskRoute("smart", max_tokens=6000),
+    "nutrition_edit": TaskRoute("smart", max_tokens=1500),
+}
+
+BACKEND_ROUTES = {
+    "fast": parse_route(Config.AI_FAST_ROUTE),
+    "smart": parse_route(Config.AI_SMART_ROUTE),
+}
+
+# Цена за 1М токенов, $: (вход, вход из кэша, выход). Для оценки расходов в админке.
+MODEL_PRICES = {
+    "deepseek-chat": (0.27, 0.07, 1.10),
+    "llama-3.3-70b-versatile": (0.59, 0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.05, 0.08),
+}
+
+
+def request_cost(model: str | None, usage) -> float:
+    if usage is None:
+        return 0.0
+    price_in, price_cached, price_out = MODEL_PRICES.get(model or "", (0.0, 0.0, 0.0))
+    prompt = int(getattr(usage, "prompt_tokens", 0) or 0)
+    cached = min(prompt, cached_prompt_tokens(usage))
+    completion = int(getattr(usage, "completion_tokens", 0) or 0)
+    return ((prompt - cached) * price_in + cached * price_cached + completion * price_out) / 1_000_000
+
+
+class TaskTelemetry:
+    """Задержка, токены и стоимость по типам задач (и на какой модели они реально выполнялись)"""
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.tasks = {}
+
+    def _task(self, task: str) -> dict:
+        t = self.tasks.get(task)
+        if t is None:
+            t = self.tasks[task] = {
+                "requests": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "cost": 0.0, "models": {}, "latency": deque(maxlen=self.window),
+            }
+        return t
+
+    def record(self, task: str, model: str | None, usage, latency: float):
+        t = self._task(task)
+        t["requests"] += 1
+        t["latency"].append(latency)
+        if model:
+            t["models"][model] = t["models"].get(model, 0) + 1
+        if usage is not None:
+            t["prompt_tokens"] += int(getattr(usage, "prompt_tokens", 0) or 0)
+            t["completion_tokens"] += int(getattr(usage, "completion_tokens", 0) or 0)
+            t["cost"] += request_cost(model, usage)
+
+    def record_error(self, task: str):
+        self._task(task)["errors"] += 1
+
+    def stats(self) -> dict:
+        result = {}
+        for task, t in self.tasks.items():
+            latency = sorted(t["latency"])
+            result[task] = {
+                "backend": TASK_ROUTES.get(task.split(" (")[0], TaskRoute()).backend,
+                "requests": t["requests"],
+                "errors": t["errors"],
+                "p50": latency[len(latency) // 2] if latency else None,
+                "p95": latency[min(len(latency) - 1, int(len(latency) * 0.95))] if latency else None,
+                "prompt_tokens": t["prompt_tokens"],
+                "completion_tokens": t["completion_tokens"],
+                "cost": t["cost"],
+                "models": dict(t["models"]),
+            }
+        return result
+
+
+task_telemetry = TaskTelemetry()
+
+
+# --- НЕИЗМЕННЫЕ ЧАСТИ ПРОМПТОВ (system-префикс, одинаковый для всех клиентов) ---
+WORKOUT_SYSTEM_PROMPT = """
+        Ты — элитный фитнес-тренер бота TrAIner. Составляешь персональные планы тренировок по анкете клиента.
+
+        ЛОГИКА ИНДИВИДУАЛЬНОСТИ:
+        1. ЗАПРЕЩЕНО вычислять или упоминать ИМТ (индекс массы тела). При объективно большом весе минимизируй прыжки и ударную нагрузку.
+        2. Новичок — акцент на нейромышечную связь.
+        3. Набор массы — "Прогрессия весов".
+        4. 40+ лет — разминка и контроль давления.
+        5. Строго придерживайся локации из пожеланий.
+
+        ПЕРИОДИЗАЦИЯ (КРИТИЧЕСКИ ВАЖНО, если в запросе есть история прошлых программ):
+        Твоя задача — составить АБСОЛЮТНО НОВУЮ программу.
+        1. СТРОГО запрещено выдавать точно такую же структуру, как в последней программе!
+        2. Проанализируй историю: если клиент несколько недель подряд делал одни и те же базовые движения (например, классический жим лежа или присед), ОБЯЗАТЕЛЬНО замени их на аналоги (жим гантелей, жим под углом, жим ногами, выпады).
+        3. Измени сплит, диапазоны повторений или методы интенсификации (добавь суперсеты или дропсеты, если позволяет уровень), чтобы избежать плато.
+        """
+
+WORKOUT_FORMAT_RULES = """
+        СТРОГИЕ ПРАВИЛА ОФОРМЛЕНИЯ:
+        1. Всегда пиши названия упражнений, используя HTML-тег <code>название</code>, чтобы пользователь мог их скопировать.
+        2. СРАЗУ начинай с программы по дням. Формат отдыха: 📅 <b>[Дата], День [Номер] ([День недели]) — ВОССТАНОВЛЕНИЕ</b>
+        3. После каждого упражнения отступ строки.
+        4. Формат упражнения (строго оберни название в тег code для копирования по клику):
+        <b>[Номер].</b> <code>[Название]</code>
+        <i>[Сеты] х [Повторы] (Отдых [сек])</i>
+        Техника: [Короткий совет]
+        5. В дни ВОССТАНОВЛЕНИЯ: 1-2 совета по активности.
+        6. В САМОМ КОНЦЕ добавь "💡 Советы тренера" (3-4 пункта).
+        Разделяй дни СТРОГО тегом: ===PAGE_BREAK===
+        """
+
+NUTRITION_SYSTEM_PROMPT = """
+        Ты — профессиональный фитнес-диетолог бота TrAIner. Твоя задача — составить или скорректировать рацион.
+
+        ПРАВИЛА РАСЧЕТА:
+        1. РАССЧИТАЙ суточную норму калорий и диапазоны БЖУ по актуальным параметрам клиента (вес, рост, возраст, пол, активность), и только после этого применяй профицит или дефицит калорий согласно цели.
+        2. МАТЕМАТИКА: Запрещено выдавать шаблонные 2500 ккал! Результат расчета должен быть уникальным и точным, а не шаблонным.
+        3. Меню на день: Завтрак, Обед, Ужин, Перекусы. В каждом блоке по 3 варианта.
+        4. ИСТОРИЯ ПРОШЛЫХ МЕНЮ (если есть в запросе) — ТОЛЬКО для анализа блюд. Ты обязан ПОЛНОСТЬЮ ИГНОРИРОВАТЬ любые цифры калорий, белков, жиров и углеводов из истории. Они неактуальны.
+        5. Пожелания/Ограничения клиента — это самое главное, что нужно учитывать!
+
+        РЕЖИМ ПРАВОК (если в запросе есть текущий рацион и правки клиента):
+        Не создавай меню полностью с нуля! Возьми ТЕКУЩИЙ рацион и внеси в него ТОЛЬКО те изменения, о которых просит клиент в своих правках.
+        Например: если клиент просит поменять только обеды — измени варианты обедов, а завтраки, ужины и перекусы оставь точно такими же, как в текущем рационе. Сохраняй структуру.
+        """
+
+NUTRITION_FORMAT_RULES = """
+        СТРОГИЕ ПРАВИЛА ОФОРМЛЕНИЯ (ЧИТАЙ ВНИМАТЕЛЬНО!):
+        1. Всегда пиши названия упражнений и названия блюд, используя HTML-тег <code>название</code>, чтобы пользователь мог их скопировать.
+        2. СТРОГО, сразу начинай с заголовка.
+        3. При составлении списка продуктов, заголовок: <b>Список покупок:</b>, заместо "*" используй "-", разделяй белки жиры углеводы (используй пример: <b>Белки</b>, <b>Жиры</b>, <b>Углеводы</b> ) делай отступ строки между ними.
+        4. ЗАПРЕЩЕНО ставить ===PAGE_BREAK=== между вариантами одного и того же приема пищи! Варианты разделяй просто пустой строкой.
+        5. Каждая новая страница (Завтрак, Обед, Ужин, Перекусы) ОБЯЗАТЕЛЬНО начинается с заголовка: 
+        <b>Твой КБЖУ ~[Число] ккал (Б: [мин]-[макс], Ж: [мин]-[макс], У: [мин]-[макс])</b>
+        6. Каждый ингридиент с новой строки
+        7. Никаких отклонений от этих правил! Используй теги <code>, жирный шрифт <b> и ===PAGE_BREAK=== ровно там, где указано.
+        ФОРМАТ ВАРИАНТА:
+        Вариант X: <b>[Название]</b>
+        - [Ингредиенты с весом]
+        - <b>КБЖУ: ~[ккал] (Б:..г, Ж:..г, У:..г)</b>
+        - Разделяй приемы пищи тегом ===PAGE_BREAK===. В конце добавь Shopping List.
+        """
+
+MOTIVATION_BATCH_SYSTEM_PROMPT = """
+        Ты фитнес-тренер бота TrAIner. Пишешь персональные утренние напоминания сразу для нескольких клиентов.
+        Каждая строка запроса — JSON с данными одного клиента: id, tier (standard или ultra), goal, workout, nutrition.
+
+        ПРАВИЛА:
+        - tier "standard": ОЧЕНЬ КОРОТКОЕ (максимум 150 символов) мотивирующее напоминание на сегодня с учетом активности. Дружелюбно.
+        - tier "ultra": ты элитный фитнес-коуч. ОЧЕНЬ КОРОТКИЙ (до 180 симв.) персональный инсайт по тренировкам и питанию.
+          Если данных мало — дай совет по биохакингу, режиму или психологии успеха. Не зацикливайся на одном питании!
+        - Без приветствий, сразу по делу. Без звездочек и Markdown.
+        - Тексты разных клиентов НЕ должны повторять друг друга.
+
+        ФОРМАТ ОТВЕТА: строго один JSON-объект (json) без текста вокруг:
+        {"messages": [{"id": 1, "text": "..."}, {"id": 2, "text": "..."}]}
+        Ровно по одному сообщению на каждый id из запроса.
+        """
+
+MOTIVATION_POOL_SYSTEM_PROMPT = """
+        Ты фитнес-тренер бота TrAIner. Пишешь короткие утренние мотивирующие напоминания для всех клиентов.
+        ПРАВИЛА: до 150 символов каждое, одно эмодзи в конце, без приветствий, без звездочек и Markdown.
+        Темы чередуй: тренировки, питание, сон, дисциплина, восстановление, психология прогресса.
+        Тексты НЕ должны повторять друг друга по смыслу.
+        ФОРМАТ ОТВЕТА: строго один JSON-объект (json) без текста вокруг: {"messages": ["...", "..."]}
+        """
+
+ANALYSIS_SYSTEM_PROMPTS = {
+    "workouts": (
+        "Ты элитный фитнес-тренер бота TrAIner. Оцениваешь недавние тренировки клиента по данным из дневника.\n"
+        "Дай профессиональный, мотивирующий совет по рабочим весам и частоте. "
+        "Пиши сразу по делу, структурированно, без общих фраз."
+    ),
+    "nutrition": (
+        "Ты фитнес-нутрициолог бота TrAIner. Оцениваешь рацион клиента за последние 7 дней по сводке КБЖУ.\n"
+        "Дай профессиональный анализ рациона. "
+        "Пиши сразу по делу, структурированно, укажи на перекосы (если есть)."
+    ),
+}
+
 
 class AIManager:
     """
     Единый менеджер для работы с AI.
     Отвечает за генерацию тренировок, питания, анализ прогресса и распознавание голоса.
+    Сам соединений не создает: запросы идут через общий роутер провайдеров (services/llm_providers.py).
+    tier — тариф пользователя (или "background" для планировщика), задает приоритет в очереди;
+    on_queued — колбэк, которому сообщается место в очереди (см. queue_notifier).
     """
-    def __init__(self):
-        self.api_key = Config.DEEPSEEK_API_KEY
-        self.client = None
-        self.model = "deepseek-chat"
-        
-        if self.api_key:
+    # Задачи, где пользователь ждет ответа вживую: тут можно потратить второй запрос ради скорости
+    HEDGED_TASKS = {"chat"}
+
+    def __init__(self, tier: str | None = None, on_queued=None):
+        self.router = cassette_router(get_router())
+        self.priority = AI_PRIORITIES.get((tier or "free").lower(), AI_PRIORITIES["free"])
+        self.on_queued = on_queued
+
+    def _hedge(self, task: str) -> bool:
+        return Config.AI_HEDGE_ENABLED and task in self.HEDGED_TASKS
+
+    @staticmethod
+    def _route(task: str, temperature: float, timeout: float, params: dict):
+        """Применяет TASK_ROUTES: модель/провайдеры, температура, max_tokens и таймаут задачи"""
+        route = TASK_ROUTES.get(task)
+        if route is None:
+            return None, temperature, timeout
+        if route.max_tokens:
+            params.setdefault("max_tokens", route.max_tokens)
+        return (
+            BACKEND_ROUTES.get(route.backend) or None,
+            route.temperature if route.temperature is not None else temperature,
+            route.timeout or timeout,
+        )
+
+    # --- ТЕХНИЧЕСКИЙ МЕТОД: ЕДИНАЯ ТОЧКА ВЫЗОВА LLM (через очередь и роутер провайдеров) ---
+    async def _complete(self, task: str, messages: list, temperature: float, timeout: float, **params):
+        backend, temperature, timeout = self._route(task, temperature, timeout, params)
+
+        async def call():
+            async with ai_scheduler.slot(self.priority, self.on_queued):
+                started = time.perf_counter()
+                try:
+                    r = await self.router.complete(
+                        messages, temperature, timeout, hedge=self._hedge(task), route=backend, **params
+                    )
+                except Exception:
+                    task_telemetry.record_error(task)
+                    raise
+                latency = time.perf_counter() - started
+                usage = getattr(r, "usage", None)
+                prompt_cache.record(task, usage, latency)
+                task_telemetry.record(task, getattr(r, "model", None), usage, latency)
+                return r
+
+        # Одинаковые запросы, идущие одновременно, делят один ответ API
+        key = ai_coalescer.make_key(task, messages, temperature, params)
+        return await ai_coalescer.run(key, task, call)
+
+    async def _stream(self, task: str, messages: list, temperature: float, timeout: float, **params):
+        """Потоковый вызов: отдает куски текста, слот очереди занят до конца стрима"""
+        # В последнем куске провайдер присылает usage (там и токены из кэша); задержка — до первого куска
+        params.setdefault("stream_options", {"include_usage": True})
+        backend, temperature, timeout = self._route(task, temperature, timeout, params)
+        usage = {}
+        first_token = None
+        async with ai_scheduler.slot(self.priority, self.on_queued):
+            started = time.perf_counter()
             try:
-                self.client = AsyncOpenAI(
-                    api_key=self.api_key,
-                    base_url="https://api.deepseek.com"
-                )
-            except Exception as e:
-                logger.error(f"AI Generation Error: {e}")
-                self.client = None
+                async for delta in self.router.stream(
+                    messages, temperature, timeout, hedge=self._hedge(task), usage_sink=usage, route=backend, **params
+                ):
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    yield delta
+            except Exception:
+                task_telemetry.record_error(f"{task} (стрим)")
+                raise
+        if first_token is not None:
+            prompt_cache.record(f"{task} (стрим)", usage.get("usage"), first_token)
+            task_telemetry.record(f"{task} (стрим)", usage.get("model"), usage.get("usage"), time.perf_counter() - started)
+
+    async def parse_text(self, task: str, prompt: str) -> str:
+        """Разбор свободного текста по инструкции (дневник тренировок/питания): без персоны чата, быстрый маршрут"""
+        if not self.router:
+            return ""
+        try:
+            r = await self._complete(task, [{"role": "user", "content": prompt}], temperature=0.1, timeout=20.0)
+            return r.choices[0].message.content or ""
+        except Exception as e:
+            logger.error(f"Parse Error ({task}): {e}")
+            return ""
 
-    # --- ТЕХНИЧЕСКИЙ МЕТОД: РАЗДЕЛЕНИЕ НА СТРАНИЦЫ ---
     def _smart_split(self, text: str) -> list[str]:
         text = clean_text(text)
         pages = text.split("===PAGE_BREAK===")
@@ -52,7 +603,7 @@ class AIManager:
     
     # --- 1. АНАЛИЗ ПРОГРЕССА ---
     async def analyze_progress(self, user_data: dict, current_weight: float, workouts_count: int = 0) -> str:
-        if not self.client: return "Ошибка API: Ключ не настроен"
+        if not self.router: return "Ошибка API: Ключ не настроен"
         
         old_weight = user_data.get('weight', current_weight)
         goal = user_data.get('goal', 'maintenance')
@@ -72,9 +623,9 @@ class AIManager:
         4. Четвертая строка: <b>Рекомендация:</b> (Один совет).
         """
         try:
-            r = await self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model, temperature=0.7, timeout=90.0
+            r = await self._complete(
+                "analysis", [{"role": "user", "content": prompt}],
+                temperature=0.7, timeout=90.0
             )
             return clean_text(r.choices[0].message.content)
         except Exception: 
@@ -82,29 +633,26 @@ class AIManager:
 
     # --- 1.5. МГНОВЕННЫЙ АНАЛИЗ КАТЕГОРИЙ (ТРЕНИРОВКИ / ПИТАНИЕ) ---
     async def analyze_category(self, user_data: dict, category: str, data_text: str) -> str:
-        if not self.client: return "❌ Ошибка API: Ключ не настроен"
+        if not self.router: return "❌ Ошибка API: Ключ не настроен"
         
         goal = user_data.get('goal', 'фитнес')
         name = user_data.get('name', 'Атлет')
         weight = user_data.get('weight', 'неизвестен')
 
+        # Инструкция — в неизменном system-префиксе, данные клиента — в конце
         if category == "workouts":
-            prompt = (f"Ты элитный фитнес-тренер бота TrAIner. Оцени недавние тренировки клиента {name}.\n"
-                      f"Цель: {goal}. Вес: {weight} кг.\n"
-                      f"Данные из дневника:\n{data_text}\n\n"
-                      f"Дай профессиональный, мотивирующий совет по рабочим весам и частоте. "
-                      f"Пиши сразу по делу, структурированно, без общих фраз.")
+            system_prompt = ANALYSIS_SYSTEM_PROMPTS["workouts"]
+            prompt = (f"Клиент: {name}. Цель: {goal}. Вес: {weight} кг.\n"
+                      f"Данные из дневника:\n{data_text}")
         else:
-            prompt = (f"Ты фитнес-нутрициолог бота TrAIner. Оцени рацион клиента {name} за последние 7 дней.\n"
-                      f"Цель: {goal}. Текущий вес: {weight} кг.\n"
-                      f"Сводка КБЖУ по дням:\n{data_text}\n\n"
-                      f"Дай профессиональный анализ рациона. "
-                      f"Пиши сразу по делу, структурированно, укажи на перекосы (если есть).")
+            system_prompt = ANALYSIS_SYSTEM_PROMPTS["nutrition"]
+            prompt = (f"Клиент: {name}. Цель: {goal}. Текущий вес: {weight} кг.\n"
+                      f"Сводка КБЖУ по дням:\n{data_text}")
 
         try:
-            r = await self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model, temperature=0.6, timeout=60.0
+            r = await self._complete(
+                "analysis", [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
+                temperature=0.6, timeout=60.0
             )
             return clean_text(r.choices[0].message.content)
         except Exception as e:
@@ -112,9 +660,11 @@ class AIManager:
             return "❌ Тренер временно не может составить отчет из-за нагрузки на сервер. Попробуй позже."
 
     # --- 2. ГЕНЕРАЦИЯ ТРЕНИРОВКИ ---
-    async def generate_workout_pages(self, user_data: dict) -> list[str]:
-        if not self.client: return ["❌ Ошибка API"]
-        
+    def _workout_messages(self, user_data: dict, structured: bool = False) -> list:
+        """
+        system — неизменные правила (кэшируются провайдером), user — анкета, история и задача на сегодня.
+        structured=True: вместо правил оформления — JSON-схема (страницы рисует WorkoutProgram.pages()).
+        """
         level = user_data.get('workout_level', 'beginner')
         days_per_week = user_data.get('workout_days', 3)
         goal = user_data.get('goal', 'maintenance')
@@ -128,6 +678,8 @@ class AIManager:
         today_date = now.strftime("%d.%m")
         wishes = user_data.get('wishes', 'Нет особых пожеланий.')
 
+        system_prompt = WORKOUT_SYSTEM_PROMPT + (WORKOUT_JSON_SPEC if structured else WORKOUT_FORMAT_RULES)
+
         # Базовая анкета
         user_prompt = f"""
         СОСТАВЬ ПЕРСОНАЛЬНЫЙ ПЛАН ТРЕНИРОВОК.
@@ -137,56 +689,195 @@ class AIManager:
         # --- НОВОЕ: БЛОК ПАМЯТИ (ПЕРИОДИЗАЦИЯ) ---
         if past_programs:
             user_prompt += f"""
-        ⚠️ ИСТОРИЯ ПРОШЛЫХ ПРОГРАММ (архив за прошлые недели):
+        ⚠️ ИСТОРИЯ ПРОШЛЫХ ПРОГРАММ (выжимка за прошлые недели: сплит, повторы, упражнения по дням):
         {past_programs}
-        
-        ЗАДАЧА ПО ПЕРИОДИЗАЦИИ (КРИТИЧЕСКИ ВАЖНО):
-        Выше представлен архив из нескольких прошлых программ клиента. 
-        Твоя задача — составить АБСОЛЮТНО НОВУЮ программу.
-        1. СТРОГО запрещено выдавать точно такую же структуру, как в последней программе!
-        2. Проанализируй историю: если клиент несколько недель подряд делал одни и те же базовые движения (например, классический жим лежа или присед), ОБЯЗАТЕЛЬНО замени их на аналоги (жим гантелей, жим под углом, жим ногами, выпады).
-        3. Измени сплит, диапазоны повторений или методы интенсификации (добавь суперсеты или дропсеты, если позволяет уровень), чтобы избежать плато.
-        САМОЕ ГЛАВНОЕ! Учитывай пожелания на сегодня: {wishes}
         """
 
-        # Правила оформления (остались без изменений)
         user_prompt += f"""
-        ЛОГИКА ИНДИВИДУАЛЬНОСТИ:
-        1. ЗАПРЕЩЕНО вычислять или упоминать ИМТ (индекс массы тела). При объективно большом весе минимизируй прыжки и ударную нагрузку.
-        2. Новичок — акцент на нейромышечную связь.
-        3. Набор массы — "Прогрессия весов".
-        4. 40+ лет — разминка и контроль давления.
-        5. Строго придерживайся локации из пожеланий.
-          
-        
         ЗАДАЧА: Создай программу на СЕМЬ ДНЕЙ. Ровно {days_per_week} тренировочных дней.
         Начиная с СЕГОДНЯ ({today_name} {today_date}).
-        
-        СТРОГИЕ ПРАВИЛА ОФОРМЛЕНИЯ:
-        1. Всегда пиши названия упражнений, используя HTML-тег <code>название</code>, чтобы пользователь мог их скопировать.
-        2. СРАЗУ начинай с программы по дням. Формат отдыха: 📅 <b>[Дата], День [Номер] ([День недели]) — ВОССТАНОВЛЕНИЕ</b>
-        3. После каждого упражнения отступ строки.
-        4. Формат упражнения (строго оберни название в тег code для копирования по клику):
-        <b>[Номер].</b> <code>[Название]</code>
-        <i>[Сеты] х [Повторы] (Отдых [сек])</i>
-        Техника: [Короткий совет]
-        5. В дни ВОССТАНОВЛЕНИЯ: 1-2 совета по активности.
-        6. В САМОМ КОНЦЕ добавь "💡 Советы тренера" (3-4 пункта).
-        Разделяй дни СТРОГО тегом: ===PAGE_BREAK===
+        САМОЕ ГЛАВНОЕ! Учитывай пожелания на сегодня: {wishes}
         """
-        
+        return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+
+    async def generate_workout_pages(self, user_data: dict) -> list[str]:
+        if not self.router: return ["❌ Ошибка API"]
         try:
-            r = await self.client.chat.completions.create(
-                messages=[{"role": "user", "content": user_prompt}], 
-                model=self.model, temperature=0.65, timeout=90.0
+            r = await self._complete(
+                "workout_program", self._workout_messages(user_data),
+                temperature=0.65, timeout=90.0
             )
             return self._smart_split(r.choices[0].message.content)
         except Exception:
             return ["❌ Ошибка при составлении программы."]
+
+    # --- 2.1. ГЕНЕРАЦИЯ ТРЕНИРОВКИ ПОСТРАНИЧНО (ПОТОКОВЫЙ РЕЖИМ) ---
+    async def stream_workout_pages(self, user_data: dict, program: WorkoutProgram | None = None):
+        """
+        Та же программа, что и generate_workout_pages, но каждая страница отдается,
+        как только в потоке появился ее ===PAGE_BREAK===. Последней приходит страница советов.
+        Если передан пустой program — генерация идет в JSON-режиме и program заполняется днями и советами.
+        """
+        if not self.router:
+            yield "❌ Ошибка API"
+            return
+
+        if program is not None:
+            pages_sent = 0
+            try:
+                async for page in self._stream_workout_structured(user_data, program):
+                    pages_sent += 1
+                    yield page
+                return
+            except Exception as e:
+                logger.error(f"Workout JSON Stream Error: {e}")
+                if pages_sent:
+                    # Часть дней уже показана: досылаем советы (если успели) и не начинаем заново
+                    if program.tips:
+                        yield program.render_tips()
+                    return
+                program.days.clear()
+                program.tips.clear()
+            # JSON не получился с первого же дня — генерируем обычным текстом
+
+        buffer = ""
+        pages_sent = 0
+        try:
+            async for delta in self._stream(
+                "workout_program", self._workout_messages(user_data),
+                temperature=0.65, timeout=90.0
+            ):
+                buffer += delta
+
+                while "===PAGE_BREAK===" in buffer:
+                    page, buffer = buffer.split("===PAGE_BREAK===", 1)
+                    page = clean_text(page)
+                    if len(page) > 5:
+                        pages_sent += 1
+                        yield page
+        except Exception as e:
+            logger.error(f"Workout Stream Error: {e}")
+            if not pages_sent:
+                yield "❌ Ошибка при составлении программы."
+            return
+
+        tail = clean_text(buffer)
+        if len(tail) > 5 or not pages_sent:
+            yield tail
         
+    async def _stream_workout_structured(self, user_data: dict, program: WorkoutProgram):
+        """JSON-режим: каждый день отдается отрисованной страницей, как только его объект закрылся в стриме"""
+        parser = JsonObjectStream()
+        async for delta in self._stream(
+            "workout_program", self._workout_messages(user_data, structured=True),
+            temperature=0.65, timeout=90.0, response_format={"type": "json_object"}
+        ):
+            for obj in parser.feed(delta):
+                try:
+                    day = WorkoutDay.from_dict(obj)
+                except ProgramParseError as e:
+                    logger.warning(f"Workout JSON: пропускаю битый день ({e})")
+                    continue
+                program.days.append(day)
+                yield day.render()
+
+        if not program.days:
+            raise ProgramParseError("В ответе нет ни одного дня")
+        try:
+            tips = parser.result().get("tips") or []
+        except ValueError:
+            tips = []  # Ответ оборвался после дней — советы просто не покажем
+        program.tips = [str(t).strip() for t in tips if str(t).strip()]
+        if program.tips:
+            yield program.render_tips()
+
+    # --- 2.2. ДОСОСТАВЛЕНИЕ НЕПОЛНОЙ ПРОГРАММЫ ---
+    def _workout_repair_messages(self, user_data: dict, check: WorkoutCheck, structured: bool = False) -> list:
+        """Короткий запрос только на недостающие дни. system тот же, что у полной генерации (кэш провайдера)."""
+        system_prompt = WORKOUT_SYSTEM_PROMPT + (WORKOUT_JSON_SPEC if structured else WORKOUT_FORMAT_RULES)
+        weekdays_ru = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
+        today = datetime.datetime.now()
+        labels = []
+        for number in check.missing:
+            day = today + timedelta(days=number - 1)
+            labels.append(f"День {number} ({weekdays_ru[day.weekday()]} {day.strftime('%d.%m')})")
+
+        rest_count = len(check.missing) - check.training_needed
+        user_prompt = f"""
+        ДОСОСТАВЬ ПЛАН ТРЕНИРОВОК.
+        АНКЕТА КЛИЕНТА: Пол: {user_data.get('gender')}, Возраст: {user_data.get('age')} лет, Вес: {user_data.get('weight')} кг, Цель: {user_data.get('goal')}, Уровень: {user_data.get('workout_level')}, Пожелания: {user_data.get('wishes') or 'Нет особых пожеланий.'}
+        УЖЕ ГОТОВЫЕ ДНИ (не переписывай их и не повторяй упражнения без необходимости):
+        {check.summary() or 'нет'}
+        ЗАДАЧА: составь ТОЛЬКО эти дни: {', '.join(labels) or 'нет'}.
+        Из них тренировочных: {check.training_needed}, дней ВОССТАНОВЛЕНИЯ: {rest_count}.
+        """
+        if check.tips is None:
+            user_prompt += """
+        В конце добавь советы тренера (3-4 пункта).
+        """
+        if structured:
+            user_prompt += """
+        В "days" верни только перечисленные дни с их номерами.
+        """
+        return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+
+    async def complete_workout_pages(self, user_data: dict, pages: list[str], program: WorkoutProgram | None = None) -> list[str]:
+        """
+        Проверяет программу после генерации: 7 дней, нужное число дней отдыха, советы в конце.
+        Недостающие и пустые дни досоставляются одним коротким запросом и встают на свои места.
+        Если передан program (JSON-режим) — досоставленные дни добавляются и в него.
+        """
+        workout_days = user_data.get('workout_days') or 3
+        structured = program is not None and bool(program.days)
+        if structured:
+            check = check_workout_program(program, workout_days)
+            # Страницы и разметка листалки строятся из program.days — оставляем те же дни, что прошли проверку
+            seen = set()
+            program.days = [d for d in program.days if d.number in check.days and not (d.number in seen or seen.add(d.number))]
+        else:
+            check = check_workout_pages(pages, workout_days)
+        if check.ok or not self.router:
+            if not check.ok:
+                logger.warning(f"Программа неполная ({check.describe()}), досоставить нечем")
+            return check.pages() if check.days else pages
+
+        logger.warning(f"Программа неполная ({check.describe()}) — досоставляю {len(check.missing)} дн.")
+        params = {"response_format": {"type": "json_object"}} if structured else {}
+        try:
+            r = await self._complete(
+                "workout_repair", self._workout_repair_messages(user_data, check, structured),
+                temperature=0.65, timeout=60.0, **params
+            )
+            reply = r.choices[0].message.content
+            if structured:
+                data = parse_json_reply(reply)
+                extra = WorkoutProgram(tips=[str(t).strip() for t in data.get("tips") or [] if str(t).strip()])
+                for item in data.get("days") or []:
+                    try:
+                        extra.days.append(WorkoutDay.from_dict(item))
+                    except ProgramParseError:
+                        continue
+                wanted = set(check.missing)
+                for day in extra.days:
+                    if day.number in wanted:
+                        program.days.append(day)
+                        wanted.discard(day.number)
+                program.days.sort(key=lambda day: day.number)
+                if not program.tips:
+                    program.tips = extra.tips
+                check.merge(check_workout_program(extra, workout_days))
+            else:
+                check.merge(check_workout_pages(self._smart_split(reply), workout_days))
+        except Exception as e:
+            logger.error(f"Workout Repair Error: {e}")
+
+        if check.missing or check.tips is None:
+            logger.warning(f"После досоставления: {check.describe()}")
+        return check.pages()
+
     # --- НОВОЕ: ГЕНЕРАЦИЯ РАЗОВОЙ ТРЕНИРОВКИ ---
     async def generate_single_workout(self, user_data: dict) -> str:
-        if not self.client: return "❌ Ошибка API"
+        if not self.router: return "❌ Ошибка API"
         level = user_data.get('workout_level', 'beginner')
         goal = user_data.get('goal', 'maintenance')
         wishes = user_data.get('wishes', 'Стандартная тренировка')
@@ -202,17 +893,22 @@ class AIManager:
         Техника: [Короткий совет]
         """
         try:
-            r = await self.client.chat.completions.create(
-                messages=[{"role": "user", "content": user_prompt}], 
-                model=self.model, temperature=0.5, timeout=60.0
+            r = await self._complete(
+                "single_workout", [{"role": "user", "content": user_prompt}],
+                temperature=0.5, timeout=60.0
             )
             return r.choices[0].message.content
         except Exception:
             return "❌ Ошибка при составлении тренировки."    
 
     # --- 3. ГЕНЕРАЦИЯ ПИТАНИЯ (С РЕЖИМОМ РЕДАКТИРОВАНИЯ И ПАМЯТЬЮ!) ---
-    async def generate_nutrition_pages(self, user_data: dict) -> list[str]:
-        if not self.client: return ["❌ Ошибка API"]
+    async def generate_nutrition_pages(self, user_data: dict, program: NutritionProgram | None = None) -> list[str]:
+        """
+        Меню по страницам (приемы пищи + список покупок).
+        Если передан пустой program — просим JSON по схеме и заполняем program (цели КБЖУ, блюда);
+        при неудаче тихо возвращаемся к обычному текстовому режиму.
+        """
+        if not self.router: return ["❌ Ошибка API"]
         goal = user_data.get('goal', 'maintenance')
         wishes = user_data.get('wishes', 'Нет особых предпочтений')
         
@@ -223,14 +919,14 @@ class AIManager:
         past_programs = user_data.get('past_programs', '')
         
         # Проверяем, это создание с нуля или запрос на изменение старого меню (длина пожелания > 3 символов)
-        is_edit_mode = bool(prev_plan) and len(wishes) > 3 and not any(skip in wishes.lower() for skip in ['пропустить', 'нет особых', 'ем всё', 'ем все'])
+        is_edit_mode = is_edit_request(prev_plan, wishes)
 
+        # Неизменные правила — в system-префиксе (кэшируется провайдером), все данные клиента — в user
         prompt = f"""
-        Ты — профессиональный фитнес-диетолог. Твоя задача — составить или скорректировать рацион. 
-        
         ДАННЫЕ КЛИЕНТА: 
         - Вес: {user_data.get('weight')} кг, Рост: {user_data.get('height')} см
         - Возраст: {user_data.get('age')} лет, Пол: {user_data.get('gender')}
+        - Уровень активности: {user_data.get('activity_level')}
         - Цель: {goal}
         """
 
@@ -240,83 +936,141 @@ class AIManager:
         ⚠️ У КЛИЕНТА УЖЕ ЕСТЬ СОСТАВЛЕННЫЙ РАЦИОН:
         {prev_plan}
         
-        🔥 КЛИЕНТ ПРОСИТ ВНЕСТИ ПРАВКИ В ЭТОТ РАЦИОН: 
+        🔥 КЛИЕНТ ПРОСИТ ВНЕСТИ ПРАВКИ В ЭТОТ РАЦИОН (РЕЖИМ ПРАВОК): 
         "{wishes}"
-        
-        ЗАДАЧА:
-        Не создавай меню полностью с нуля! Возьми ТЕКУЩИЙ рацион (предоставлен выше) и внеси в него ТОЛЬКО те изменения, о которых просит клиент в своих правках. 
-        Например: если клиент просит поменять только обеды — измени варианты обедов, а завтраки, ужины и перекусы оставь точно такими же, как в текущем рационе. Сохраняй структуру.
         """
         else:
             prompt += f"""
-        ЗАДАЧА:
-        1. Пожелания/Ограничения: {wishes} - Это самое главное что нужно учитывать!
-        2. РАССЧИТАЙ суточную норму калорий и диапазоны БЖУ.
-        3. Составь меню на день: Завтрак, Обед, Ужин, Перекусы. В каждом блоке по 3 варианта. 
+        ЗАДАЧА: Составь новый рацион.
+        Пожелания/Ограничения: {wishes}
         """
             # --- НОВОЕ: Включаем память только для новых генераций! ---
             if past_programs:
                 prompt += f"""
-        ⚠️ ИСТОРИЯ ПРОШЛЫХ МЕНЮ КЛИЕНТА (ТОЛЬКО ДЛЯ АНАЛИЗА БЛЮД):
+        ⚠️ ИСТОРИЯ ПРОШЛЫХ МЕНЮ КЛИЕНТА (ТОЛЬКО ДЛЯ АНАЛИЗА БЛЮД, цифры КБЖУ игнорируй):
         {past_programs}
-        
-        🚨 КРИТИЧЕСКОЕ ТРЕБОВАНИЕ ПО РАСЧЕТУ КБЖУ:
-        Ты обязан ПОЛНОСТЬЮ ИГНОРИРОВАТЬ любые цифры калорий, белков, жиров и углеводов из истории выше. Они неактуальны.
-        
-        Сделай НОВЫЙ математический расчет, используя ТОЛЬКО актуальные параметры клиента:
-        - Вес: {user_data.get('weight')} кг
-        - Рост: {user_data.get('height')} см
-        - Возраст: {user_data.get('age')} лет
-        - Пол: {user_data.get('gender')}
-        - Уровень активности: {user_data.get('activity_level')}
-        - Текущая цель: {goal}
-        - Пожелания/Ограничения: {wishes}
-
-        Только после этого расчета применяй профицит или дефицит калорий согласно цели.
-        Результат расчета должен быть уникальным и точным, а не шаблонным.
         """
 
-        prompt += """
-        СТРОГИЕ ПРАВИЛА ОФОРМЛЕНИЯ (ЧИТАЙ ВНИМАТЕЛЬНО!):
-        1. Всегда пиши названия упражнений и названия блюд, используя HTML-тег <code>название</code>, чтобы пользователь мог их скопировать.
-        2. СТРОГО, сразу начинай с заголовка.
-        3. При составлении списка продуктов, заголовок: <b>Список покупок:</b>, заместо "*" используй "-", разделяй белки жиры углеводы (используй пример: <b>Белки</b>, <b>Жиры</b>, <b>Углеводы</b> ) делай отступ строки между ними.
-        4. ЗАПРЕЩЕНО ставить ===PAGE_BREAK=== между вариантами одного и того же приема пищи! Варианты разделяй просто пустой строкой.
-        5. Каждая новая страница (Завтрак, Обед, Ужин, Перекусы) ОБЯЗАТЕЛЬНО начинается с заголовка: 
-        <b>Твой КБЖУ ~[Число] ккал (Б: [мин]-[макс], Ж: [мин]-[макс], У: [мин]-[макс])</b>
-        6. Каждый ингридиент с новой строки
-        ФОРМАТ ВАРИАНТА:
-        Вариант X: <b>[Название]</b>
-        - [Ингредиенты с весом]
-        - <b>КБЖУ: ~[ккал] (Б:..г, Ж:..г, У:..г)</b>
-        - Разделяй приемы пищи тегом ===PAGE_BREAK===. В конце добавь Shopping List.
-        """
-        
         # Добиваем ИИ последним правилом перед генерацией
         prompt += f"""
-        🚨 ФИНАЛЬНОЕ ПРАВИЛО (ВЫПОЛНИТЬ БЕЗУКОРИЗНЕННО): 
-        1. СТРОГО выполни пожелание пользователя: "{wishes}".
-        2. ОФОРМЛЕНИЕ: Никаких отклонений от СТРОГИХ ПРАВИЛ выше! Используй теги <code>, жирный шрифт <b> и ===PAGE_BREAK=== ровно там, где указано.
-        3. МАТЕМАТИКА: Запрещено выдавать шаблонные 2500 ккал! Сделай точный расчет по формуле под параметры:
-        - Вес: {user_data.get('weight')} кг
-        - Рост: {user_data.get('height')} см
-        - Возраст: {user_data.get('age')} лет
-        - Пол: {user_data.get('gender')}
-        - Уровень активности: {user_data.get('activity_level')}
-        - Текущая цель: {goal}
-        - Пожелания/Ограничения: {wishes}  
+        🚨 ФИНАЛЬНОЕ ПРАВИЛО (ВЫПОЛНИТЬ БЕЗУКОРИЗНЕННО): СТРОГО выполни пожелание пользователя: "{wishes}".
         """
 
+        if program is not None:
+            try:
+                r = await self._complete(
+                    "nutrition_program",
+                    [{"role": "system", "content": NUTRITION_SYSTEM_PROMPT + NUTRITION_JSON_SPEC},
+                     {"role": "user", "content": prompt}],
+                    temperature=0.6, timeout=90.0, response_format={"type": "json_object"}
+                )
+                parsed = NutritionProgram.from_dict(parse_json_reply(r.choices[0].message.content))
+                program.__dict__.update(parsed.__dict__)
+                return program.pages()
+            except Exception as e:
+                logger.error(f"Nutrition JSON Error: {e}")
+
         try:
             # Чуть подняли температуру (до 0.6), чтобы ИИ перестал "лениться" и выдавать шаблон
-            r = await self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}], 
-                model=self.model, temperature=0.6, timeout=90.0
+            r = await self._complete(
+                "nutrition_program",
+                [{"role": "system", "content": NUTRITION_SYSTEM_PROMPT + NUTRITION_FORMAT_RULES},
+                 {"role": "user", "content": prompt}],
+                temperature=0.6, timeout=90.0
             )
             return self._smart_split(r.choices[0].message.content)
         except Exception:
             return ["❌ Ошибка генерации рациона."]
 
+    # --- 3.1. ТОЧЕЧНАЯ ПРАВКА МЕНЮ (ТОЛЬКО ЗАТРОНУТЫЕ ПРИЕМЫ ПИЩИ) ---
+    def _meal_edit_messages(self, user_data: dict, meal_text: str, wish: str, structured: bool) -> list:
+        """В запросе только одна страница меню и правка; system тот же, что у полной генерации (кэш провайдера)"""
+        if structured:
+            task = """
+        Верни JSON-объект ТОЛЬКО этого приема пищи: {"name": "...", "variants": [...], "shopping_add": ["новые продукты"]}.
+        В "shopping_add" — продукты из новых вариантов, которых не было в текущих (пустой список, если таких нет).
+        """
+        else:
+            task = """
+        Верни ТОЛЬКО эту страницу в том же формате, заголовок с КБЖУ оставь без изменений.
+        После страницы поставь ===PAGE_BREAK=== и перечисли через "-" новые продукты для списка покупок,
+        которых не было на текущей странице. Если новых продуктов нет, после ===PAGE_BREAK=== ничего не пиши.
+        """
+        prompt = f"""
+        ДАННЫЕ КЛИЕНТА: Вес: {user_data.get('weight')} кг, Пол: {user_data.get('gender')}, Цель: {user_data.get('goal', 'maintenance')}
+        ТОЧЕЧНАЯ ПРАВКА. Текущий прием пищи из рациона клиента:
+        {meal_text}
+
+        🔥 ПРАВКА КЛИЕНТА: "{wish}"
+        Измени варианты согласно правке, калорийность и БЖУ вариантов держи примерно такими же, как сейчас.
+        Другие приемы пищи не пиши.
+        {task}"""
+        spec = NUTRITION_JSON_SPEC if structured else NUTRITION_FORMAT_RULES
+        return [{"role": "system", "content": NUTRITION_SYSTEM_PROMPT + spec}, {"role": "user", "content": prompt}]
+
+    async def edit_nutrition_pages(self, user_data: dict, pages: list[str], wish: str, program: NutritionProgram | None = None) -> list[str] | None:
+        """
+        Правка вида "замени перекус": переписываются только страницы упомянутых приемов пищи,
+        остальное меню и цели КБЖУ не меняются. Если передан program (JSON-режим), он патчится на месте.
+        None — точечно не получилось (правка на все меню, страница не найдена, сбой), нужна полная генерация.
+        """
+        targets = wish_targets(wish)
+        if not targets or not self.router:
+            return None
+
+        structured = program is not None and bool(program.meals)
+        if structured:
+            index = {}
+            for i, meal in enumerate(program.meals):
+                index.setdefault(meal_key(meal.name), i)
+        else:
+            index = meal_page_index(pages)
+        if any(t not in index for t in targets):
+            return None
+
+        async def edit_one(target: str):
+            i = index[target]
+            if structured:
+                r = await self._complete(
+                    "nutrition_edit",
+                    self._meal_edit_messages(user_data, json.dumps(asdict(program.meals[i]), ensure_ascii=False), wish, True),
+                    temperature=0.6, timeout=45.0, response_format={"type": "json_object"}
+                )
+                data = parse_json_reply(r.choices[0].message.content)
+                meal = Meal.from_dict({**data, "name": program.meals[i].name})
+                return i, meal, [str(x).strip() for x in data.get("shopping_add") or [] if str(x).strip()]
+
+            r = await self._complete(
+                "nutrition_edit", self._meal_edit_messages(user_data, pages[i], wish, False),
+                temperature=0.6, timeout=45.0
+            )
+            page, _, extra = r.choices[0].message.content.partition("===PAGE_BREAK===")
+            page = clean_text(page)
+            if "Вариант" not in page:
+                raise ProgramParseError("В ответе нет вариантов блюд")
+            return i, page, [line.strip(" -•*") for line in extra.split("\n") if line.strip().startswith(("-", "•", "*"))]
+
+        try:
+            results = await asyncio.gather(*(edit_one(t) for t in targets))
+        except Exception as e:
+            logger.error(f"Nutrition Edit Error: {e}")
+            return None
+
+        new_products = [item for _, _, items in results for item in items]
+        if structured:
+            for i, meal, _ in results:
+                program.meals[i] = meal
+            if new_products and program.shopping_list:
+                program.shopping_list.setdefault("Добавлено после правки", []).extend(new_products)
+            return program.pages()
+
+        pages = list(pages)
+        for i, page, _ in results:
+            pages[i] = page
+        if "shopping" in index:
+            pages[index["shopping"]] = append_shopping_items(pages[index["shopping"]], new_products)
+        return pages
+
     # --- 4. РАСЧЕТ КАЛОРИЙ ---
     def _calculate_target_calories(self, user_data: dict) -> int:
         try:
@@ -338,9 +1092,7 @@ class AIManager:
             return 2000
 
     # --- 5. ЧАТ С ТРЕНЕРОМ ---
-    async def get_chat_response(self, history: list, user_context: dict) -> str:
-        if not self.client: return "Ошибка: API не настроен"
-        
+    def _chat_messages(self, history: list, user_context: dict) -> list:
         name = user_context.get('name', 'атлет')
         goal = user_context.get('goal', 'фитнес')
         
@@ -348,11 +1100,14 @@ class AIManager:
             f"Ты — тренер TrAIner. Твой клиент: {name}, цель: {goal}. "
             "Отвечай на ВСЕ вопросы. Пиши простым текстом без звездочек."
         )
+        return [{"role": "system", "content": system_prompt}] + history[-6:]
+
+    async def get_chat_response(self, history: list, user_context: dict) -> str:
+        if not self.router: return "Ошибка: API не настроен"
 
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "system", "content": system_prompt}] + history[-6:],
+            response = await self._complete(
+                "chat", self._chat_messages(history, user_context),
                 temperature=0.7, timeout=30.0
             )
             result = response.choices[0].message.content
@@ -361,65 +1116,97 @@ class AIManager:
         except Exception as e:
             logger.error(f"DeepSeek Error: {e}")
             return f"❌ Ошибка связи с ИИ. Попробуй еще раз."
+
+    # --- 5.1. ЧАТ С ТРЕНЕРОМ (ПОТОКОВЫЙ РЕЖИМ) ---
+    async def stream_chat_response(self, history: list, user_context: dict):
+        """Тот же ответ, что и get_chat_response, но отдается кусками по мере генерации"""
+        if not self.router:
+            yield "Ошибка: API не настроен"
+            return
+
+        got_text = False
+        try:
+            async for delta in self._stream(
+                "chat", self._chat_messages(history, user_context),
+                temperature=0.7, timeout=30.0
+            ):
+                delta = delta.replace("*", "").replace("#", "")
+                if delta:
+                    got_text = True
+                    yield delta
+        except Exception as e:
+            logger.error(f"DeepSeek Stream Error: {e}")
+            if not got_text:
+                yield "❌ Ошибка связи с ИИ. Попробуй еще раз."
+            return
+
+        if not got_text:
+            yield "Я тут, готов к работе!"
         
-    # --- 6. БЕЗОПАСНОЕ РАСПОЗНАВАНИЕ ГОЛОСА (ЛОКАЛЬНО В ФОНЕ) ---
-    async def transcribe_voice(self, file_data) -> str:
-        if not whisper_model:
-            return ""
-            
+    # --- 5.2. ПАКЕТНАЯ МОТИВАЦИЯ ДЛЯ ПЛАНИРОВЩИКА ---
+    async def generate_motivation_batch(self, clients: list[dict]) -> dict:
+        """
+        Один запрос на пачку клиентов: clients — список {"id", "tier", "goal", "workout", "nutrition"}.
+        Возвращает {id: текст} только для корректных ответов. Если не разобрался ни один — исключение
+        (планировщик поделит пачку и попробует еще раз).
+        """
+        if not self.router:
+            raise RuntimeError("API не настроен")
+
+        lines = "\n".join(json.dumps(c, ensure_ascii=False) for c in clients)
+        r = await self._complete(
+            "motivation_batch",
+            [{"role": "system", "content": MOTIVATION_BATCH_SYSTEM_PROMPT},
+             {"role": "user", "content": f"КЛИЕНТЫ:\n{lines}"}],
+            temperature=0.9, timeout=60.0 + 3 * len(clients),
+            response_format={"type": "json_object"}, max_tokens=120 * len(clients) + 100
+        )
+        data = parse_json_reply(r.choices[0].message.content)
+
+        wanted = {c["id"] for c in clients}
+        texts = {}
+        for item in data.get("messages", []) if isinstance(data, dict) else []:
+            if not isinstance(item, dict) or item.get("id") not in wanted:
+                continue
+            text = str(item.get("text") or "").replace("*", "").replace("#", "").strip()
+            if 10 <= len(text) <= 400:
+                texts[item["id"]] = text
+
+        if not texts:
+            raise ProgramParseError(f"В ответе нет ни одного сообщения из {len(clients)}")
+        if len(texts) < len(clients):
+            logger.warning(f"Пакетная мотивация: получено {len(texts)} из {len(clients)}, остальным — запасные тексты")
+        return texts
+
+    async def generate_motivation_pool(self, count: int) -> list[str]:
+        """Общие (не персональные) мотивашки для пула контента, одним запросом"""
+        if not self.router:
+            return []
         try:
-            if isinstance(file_data, str):
-                file_path = file_data
-                
-                def run_transcription():
-                    segments, _ = whisper_model.transcribe(
-                        file_path, 
-                        beam_size=5, 
-                        language="ru",
-                        initial_prompt="Жим лежа, присед, становая тяга, гантели, штанга, КБЖУ, спагетти, углеводы, калории, повторения.",
-                        vad_filter=True, # 🔥 Отрезаем тишину
-                        vad_parameters=dict(min_silence_duration_ms=500)
-                    )
-                    return "".join([segment.text for segment in segments]).strip()
-
-                transcription_text = await asyncio.to_thread(run_transcription)
-                return transcription_text
-                
-            elif isinstance(file_data, io.BytesIO):
-                import tempfile
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".ogg") as tmp:
-                    tmp.write(file_data.read())
-                    tmp_path = tmp.name
-                    
-                def run_transcription_bytes():
-                    segments, _ = whisper_model.transcribe(
-                        tmp_path, # Исправлена старая опечатка
-                        beam_size=5, 
-                        language="ru",
-                        initial_prompt="Жим лежа, присед, становая тяга, гантели, штанга, КБЖУ, спагетти, углеводы, калории, повторения.",
-                        vad_filter=True, # 🔥 Отрезаем тишину
-                        vad_parameters=dict(min_silence_duration_ms=500)
-                    )
-                    return "".join([segment.text for segment in segments]).strip()
-                    
-                transcription_text = await asyncio.to_thread(run_transcription_bytes)
-                import re
-                transcription_text = re.sub(r'(?i)\b\d*\s*подход[а-я]*\b', '', transcription_text)
-                os.remove(tmp_path)
-                return transcription_text
-                
-            else:
-                return ""
-                
+            r = await self._complete(
+                "motivation_pool",
+                [{"role": "system", "content": MOTIVATION_POOL_SYSTEM_PROMPT},
+                 {"role": "user", "content": f"Напиши {count} разных напоминаний."}],
+                temperature=1.0, timeout=90.0,
+                response_format={"type": "json_object"}, max_tokens=80 * count + 100
+            )
+            data = parse_json_reply(r.choices[0].message.content)
         except Exception as e:
-            logger.error(f"Ошибка распознавания голоса: {e}")
-            return ""
+            logger.error(f"Motivation pool error: {e}")
+            return []
+        texts = [str(t).replace("*", "").replace("#", "").strip() for t in data.get("messages", [])]
+        return [t for t in texts if 10 <= len(t) <= 300]
+
+    # --- 6. БЕЗОПАСНОЕ РАСПОЗНАВАНИЕ ГОЛОСА (ЛОКАЛЬНО В ФОНЕ) ---
+    async def transcribe_voice(self, file_data, on_queued=None) -> str:
+        """Локальный Whisper в отдельных процессах (services/transcription.py). Может бросить SpeechBusy."""
+        return await speech.transcribe(file_data, on_queued=on_queued)
 
 
-    async def generate_marketing_post(self) -> str:
-        """Генерирует уникальный пост от лица TrAIner Bot"""
-        if not self.client: 
-            return "🤖 Пора на тренировку! Заходи в @TrAInerFitnessBot"
+    async def generate_marketing_post(self, fallback: bool = True) -> str | None:
+        """Генерирует уникальный пост от лица TrAIner Bot. fallback=False — None вместо запасного текста (для пула)."""
+        if not self.router: 
+            return "🤖 Пора на тренировку! Заходи в @TrAInerFitnessBot" if fallback else None
         
         import random
         
@@ -467,12 +1254,14 @@ class AIManager:
         """
 
         try:
-            r = await self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model, 
+            r = await self._complete(
+                "marketing", [{"role": "user", "content": prompt}],
                 temperature=1.0, # Максимальный хаос для креатива
                 timeout=60.0
             )
             return r.choices[0].message.content
         except Exception as e:
+            if not fallback:
+                logger.error(f"Marketing post error: {e}")
+                return None
             return f"<b>Твое тело — твой проект.</b> Начни работу вместе со мной: {bot_username}"
\ No newline at end of file
@@ -0,0 +1,270 @@
+import re
+from dataclasses import dataclass, field
+
+
+# ==========================================
+# ЛОКАЛЬНЫЙ РАЗБОР ДНЕВНИКА ТРЕНИРОВОК
+# ==========================================
+# Аккуратные записи вида "Жим штанги лежа 80 10", "Присед 100кг 5х5", "Подтягивания 12 раз"
+# разбираются прямо в процессе, без запроса к ИИ. Все, что выглядит неоднозначно
+# (лишние числа, непонятные слова после названия), возвращается в leftovers и уходит в ИИ.
+
+MAX_WEIGHT = 500
+MAX_REPS = 100
+MAX_SETS = 20
+# "3х10" / "3 по 10" без кг: первое число до PAIR_MAX_SETS — подходы (вес не указан), больше MAX_SETS — вес.
+# Между ними ("15х10" — 15 кг или 15 подходов?) не угадываем, отдаем ИИ.
+PAIR_MAX_SETS = 10
+
+# Правила каноничного названия — те же, что в промпте process_workout_weights
+NUANCE_RE = re.compile(
+    r"\b(?:(?:узк|широк|обратн|прям|нейтральн|средн|параллельн|разнохват)\w*\s+(?:хват|стойк|постановк)\w*"
+    r"|(?:хват|стойк)\w*\s+(?:узк|широк|обратн|прям|нейтральн|средн)\w*"
+    r"|узко|широко|обратным|разнохватом)\b",
+    re.IGNORECASE
+)
+TRASH_RE = re.compile(r"\b(?:на\s+)?(?:скамь\w*|скамейк\w*|градус\w*|град|поочередно)\b|°", re.IGNORECASE)
+MACHINE_RE = re.compile(r"\b(?:в\s+|на\s+)?(?:смит\w*|хаммер\w*|тренажер\w*)\b", re.IGNORECASE)
+ANGLE_RE = re.compile(r"\b(\d{2})\s*(?:°|град\w*)", re.IGNORECASE)
+
+SEGMENT_SPLIT_RE = re.compile(r"[\n;]+|,(?!\d)")
+BULLET_RE = re.compile(r"^\s*(?:[-–—•*]+|\d+[.)])\s*")
+NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+BODYWEIGHT_RE = re.compile(r"\s*(?:со?\s+)?(?:свой|своим|собственн\w*)\s+вес\w*\s*$|\s*без\s+веса\s*$", re.IGNORECASE)
+TRAILING_BY_RE = re.compile(r"\s+(?:по|на)\s*$", re.IGNORECASE)
+TOKEN_RE = re.compile(
+    r"(?P<num>\d+(?:[.,]\d+)?)|(?P<x>[xх×*])(?![а-яa-z])|(?P<kg>(?:кг|kg|килограмм\w*|кило)\b)"
+    r"|(?P<reps>(?:повтор\w*|повт|раза?)\b)|(?P<sets>(?:подход\w*|сет\w*)\b)"
+    r"|(?P<by>(?:по|на)\b)|(?P<bw>(?:собствен\w*|свой|своим|без)\b)|(?P<filler>(?:вес\w*|с|и)\b)",
+    re.IGNORECASE
+)
+
+
+@dataclass
+class DiaryEntry:
+    name: str           # Как написал пользователь (колонка exercise_name)
+    canonical: str      # Единое название для графиков (колонка canonical_name)
+    comment: str        # Нюанс: хват, стойка
+    weight: float
+    reps: int
+    sets: int = 1
+
+
+@dataclass
+class DiaryParseResult:
+    entries: list[DiaryEntry] = field(default_factory=list)
+    leftovers: list[str] = field(default_factory=list)  # Куски текста, которые надо отдать ИИ
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.entries) and not self.leftovers
+
+
+def canonicalize_exercise(name: str) -> tuple[str, str]:
+    """Каноничное название + нюанс по правилам дневника (без ИИ)"""
+    text = name.lower().replace("ё", "е")
+
+    nuances = [m.group(0) for m in NUANCE_RE.finditer(text)]
+    text = NUANCE_RE.sub(" ", text)
+
+    angle = ANGLE_RE.search(text)
+    text = ANGLE_RE.sub(" ", text)
+
+    has_machine = bool(MACHINE_RE.search(text))
+    text = MACHINE_RE.sub(" ", text)
+    text = TRASH_RE.sub(" ", text)
+    text = re.sub(r"[^\w\s-]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip(" -")
+
+    if has_machine:
+        text += " в тренажере"
+    if angle:
+        text += f" {angle.group(1)}"
+
+    canonical = text[:1].upper() + text[1:]
+    comment = ", ".join(n.strip() for n in nuances)
+    return canonical, comment
+
+
+def _to_float(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+def _unlabeled_first(value: str) -> str | None:
+    """Первое число пары без кг: 'sets', 'weight' или None — не угадать"""
+    number = _to_float(value)
+    if number <= PAIR_MAX_SETS:
+        return "sets"
+    if number > MAX_SETS:
+        return "weight"
+    return None
+
+
+def _parse_numbers(tail: str) -> tuple[float, int, int] | None:
+    """Разбирает хвост записи после названия: вес, повторы, подходы. None — неоднозначно."""
+    weight = reps = sets = None
+    bodyweight = False
+    pending = []      # Числа без пометки, по порядку
+    pair = None       # A x B (x C)
+    chained = False   # "80кг x 10 x 3" — пара продолжает вес: повторы x подходы
+    expect = None     # Что означает следующее число после 'по'/'на'
+
+    pos = 0
+    tokens = []
+    for m in TOKEN_RE.finditer(tail):
+        # Между токенами не должно быть ничего, кроме пробелов и знаков препинания
+        if re.search(r"[^\s.,:()/+-]", tail[pos:m.start()]):
+            return None
+        tokens.append(m)
+        pos = m.end()
+    if re.search(r"[^\s.,:()/+-]", tail[pos:]):
+        return None
+
+    # Любое противоречие (поле задано дважды, единица без своего числа) — не угадываем, отдаем ИИ
+    labeled = set()   # Индексы единиц (кг, раз, подходов), которые относятся к числу перед ними
+    for i, m in enumerate(tokens):
+        kind = m.lastgroup
+        nxt = tokens[i + 1].lastgroup if i + 1 < len(tokens) else None
+        prev = tokens[i - 1].lastgroup if i else None
+        if kind == "num":
+            value = m.group("num")
+            if pair is not None and pair[-1] is None:
+                pair[-1] = value
+                if nxt == "reps" and len(pair) == 2:
+                    labeled.add(i + 1)  # "80 x 10 повторений" — второе число пары и есть повторы
+            elif pair is not None and nxt not in ("kg", "reps", "sets"):
+                return None  # "2х20 12" — лишнее число после пары
+            elif nxt == "x":
+                pair = [value, None]
+            elif nxt in ("kg", "reps", "sets"):
+                if {"kg": weight, "reps": reps, "sets": sets}[nxt] is not None:
+                    return None
+                if nxt == "kg":
+                    weight = _to_float(value)
+                elif nxt == "reps":
+                    reps = value
+                else:
+                    sets = value
+                labeled.add(i + 1)
+            elif expect == "reps":
+                if reps is not None:
+                    return None  # "100 на 10 на 3"
+                reps = value
+            else:
+                pending.append(value)
+            expect = None
+        elif kind in ("kg", "reps", "sets"):
+            if i not in labeled:
+                return None  # "2х16 кг" — кг относится к паре, непонятно как
+        elif kind == "x":
+            if pair is not None and pair[-1] is not None:
+                pair.append(None)  # "80х10х3"
+            elif pair is None and prev == "kg":
+                chained = True
+        elif kind == "by":
+            if pending and weight is None and sets is None:
+                # "Присед 3 по 10" — подходы по повторы, "Жим 80 по 10" — вес по повторы
+                first = _unlabeled_first(pending[-1])
+                if first is None:
+                    return None
+                if first == "sets":
+                    sets = pending.pop()
+            expect = "reps" if (weight is not None or sets is not None or pending) else None
+        elif kind == "bw":
+            bodyweight = True
+
+    if pair is not None:
+        if pair[-1] is None or len(pair) > 3 or reps is not None or sets is not None:
+            return None
+        if len(pair) == 3:
+            # "80х10х3" — вес х повторы х подходы
+            if weight is not None or pending or sets is not None:
+                return None
+            weight, reps, sets = _to_float(pair[0]), pair[1], pair[2]
+        elif chained:
+            # "80кг x 10 x 3" — вес х повторы х подходы
+            reps, sets = pair
+        elif weight is not None or pending or bodyweight:
+            # "100 5х5", "80кг 3х10" — вес отдельно, пара — подходы х повторы
+            a, b = pair
+            if weight is None and pending:
+                weight = _to_float(pending.pop(0))
+            sets, reps = a, b
+        else:
+            # "80х10" — вес х повторы, "3х10" — подходы х повторы без веса
+            a, b = pair
+            first = _unlabeled_first(a)
+            if first is None:
+                return None
+            if first == "sets":
+                sets, reps = a, b
+            else:
+                weight, reps = _to_float(a), b
+
+    # Непомеченные числа: сначала вес, потом повторы
+    if weight is None and not bodyweight and pending:
+        if len(pending) == 1 and reps is None:
+            return None  # "Жим 80" — это вес или повторы? Пусть решает ИИ
+        weight = _to_float(pending.pop(0))
+    if reps is None and pending:
+        reps = pending.pop(0)
+    if pending or reps is None:
+        return None
+
+    try:
+        weight = 0.0 if weight is None else weight
+        reps, sets = int(float(str(reps).replace(",", "."))), int(sets or 1)
+    except ValueError:
+        return None
+    if not (0 <= weight <= MAX_WEIGHT and 1 <= reps <= MAX_REPS and 1 <= sets <= MAX_SETS):
+        return None
+    return weight, reps, sets
+
+
+def _split_name(segment: str) -> tuple[str, str]:
+    """Название — все до первого числа, которое не является углом наклона"""
+    for m in NUMBER_RE.finditer(segment):
+        if ANGLE_RE.match(segment, m.start()):
+            continue
+        name, tail = segment[:m.start()], segment[m.start():]
+        # "Отжимания свой вес 15" — пометка про вес относится к числам, а не к названию
+        bodyweight = BODYWEIGHT_RE.search(name)
+        if bodyweight:
+            name, tail = name[:bodyweight.start()], bodyweight.group(0) + " " + tail
+        # "Выпады по 20 кг 12" — "по"/"на" перед числом относится к весу, а не к названию
+        name = TRAILING_BY_RE.sub("", name)
+        return name.strip(" -:"), tail
+    return segment.strip(), ""
+
+
+def parse_diary_text(text: str) -> DiaryParseResult:
+    result = DiaryParseResult()
+    last_name = None
+
+    for raw in SEGMENT_SPLIT_RE.split(text or ""):
+        segment = BULLET_RE.sub("", raw).strip()
+        if not segment:
+            continue
+
+        name, tail = _split_name(segment)
+        if name and not re.search(r"[a-zа-яё]{2,}", name, re.IGNORECASE):
+            name = ""
+        parsed = _parse_numbers(tail) if tail else None
+
+        # "Жим 80 10, 85 8" — второй подход без названия относится к тому же упражнению
+        if not name:
+            name = last_name
+        if parsed is None or not name:
+            result.leftovers.append(segment)
+            last_name = None
+            continue
+
+        weight, reps, sets = parsed
+        canonical, comment = canonicalize_exercise(name)
+        if not canonical:
+            result.leftovers.append(segment)
+            continue
+        result.entries.append(DiaryEntry(name=name, canonical=canonical, comment=comment, weight=weight, reps=reps, sets=sets))
+        last_name = name
+
+    return result
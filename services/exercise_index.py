@@ -0,0 +1,120 @@
+import re
+import difflib
+import logging
+from collections import Counter
+
+from sqlalchemy import select, func, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from data.gifs import EXERCISE_DB
+from database.models import WorkoutLog
+
+logger = logging.getLogger(__name__)
+
+
+# ==========================================
+# СЛОВАРЬ КАНОНИЧНЫХ НАЗВАНИЙ УПРАЖНЕНИЙ
+# ==========================================
+# Держим в памяти "как написал пользователь" -> "каноничное название".
+# Стартовые названия — из data/gifs.EXERCISE_DB, дальше словарь дополняется парами
+# exercise_name -> canonical_name из дневника. Повторные упражнения получают то же
+# название, что и в прошлый раз, а графики группируют записи по готовым ключам.
+# Если для одного ключа в дневнике встречаются разные каноничные названия, побеждает самое частое:
+# одна ошибка ИИ не закрепляется навсегда. Стартовые названия уступают любому выученному.
+
+FUZZY_CUTOFF = 0.9
+
+
+def normalize_key(name: str) -> str:
+    """Ключ для сравнения: нижний регистр, е вместо ё, без лишних пробелов и знаков"""
+    text = str(name or "").lower().replace("ё", "е")
+    text = re.sub(r"[^\w\s%-]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def display_name(name: str) -> str:
+    """Как показываем название на графиках и в дневнике"""
+    return normalize_key(name).capitalize()
+
+
+class ExerciseIndex:
+    def __init__(self):
+        self.aliases: dict[str, str] = {}     # ключ -> каноничное название
+        self._group_keys: dict[str, str] = {} # сырое название -> ключ группировки (кэш)
+        self._votes: dict[str, Counter] = {}  # ключ -> сколько раз встречалось каждое каноничное название
+        self.hits = 0
+        self.misses = 0
+
+        for name in EXERCISE_DB:
+            self.aliases.setdefault(normalize_key(name), display_name(name))
+
+    def learn(self, name: str, canonical: str, count: int = 1):
+        """Запоминает пару из дневника (count — сколько раз она встретилась). Ключ получает самое частое название."""
+        if not canonical:
+            return
+        canonical = display_name(canonical)
+        changed = False
+        keys = {normalize_key(canonical)}
+        if name:
+            keys.add(normalize_key(name))
+        for key in keys:
+            votes = self._votes.setdefault(key, Counter())
+            votes[canonical] += count
+            # При равенстве остается то, что набрало счет первым (load идет от частых пар к редким)
+            best = votes.most_common(1)[0][0]
+            if self.aliases.get(key) != best:
+                self.aliases[key] = best
+                changed = True
+        if changed:
+            self._group_keys.clear()
+
+    async def load(self, session: AsyncSession):
+        """Подтягивает все известные пары из WorkoutLog (при старте бота), частые — первыми"""
+        uses = func.count().label("uses")
+        stmt = select(WorkoutLog.exercise_name, WorkoutLog.canonical_name, uses).where(
+            WorkoutLog.canonical_name.isnot(None)
+        ).group_by(
+            WorkoutLog.exercise_name, WorkoutLog.canonical_name
+        ).order_by(desc(uses), WorkoutLog.exercise_name, WorkoutLog.canonical_name)
+        result = await session.execute(stmt)
+        pairs = result.all()
+        for name, canonical, count in pairs:
+            self.learn(name, canonical, count)
+        logger.info(f"📚 Словарь упражнений: {len(self.aliases)} названий ({len(pairs)} пар из дневника)")
+
+    def lookup(self, name: str, fuzzy: bool = True) -> str | None:
+        """Каноничное название для того, что написал пользователь. None — упражнение не знакомо."""
+        key = normalize_key(name)
+        if not key:
+            return None
+        found = self.aliases.get(key)
+        if not found and fuzzy:
+            close = difflib.get_close_matches(key, self.aliases.keys(), n=1, cutoff=FUZZY_CUTOFF)
+            # Цифры (углы наклона) должны совпадать: "в наклоне 30" и "в наклоне 45" — разные упражнения
+            if close and re.findall(r"\d+", close[0]) == re.findall(r"\d+", key):
+                found = self.aliases[close[0]]
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    def group_key(self, name: str) -> str:
+        """Готовый ключ для группировки записей на графиках (без повторной нормализации)"""
+        cached = self._group_keys.get(name)
+        if cached is None:
+            cached = display_name(self.aliases.get(normalize_key(name), name))
+            self._group_keys[name] = cached
+        return cached
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "aliases": len(self.aliases),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 2) if total else 0.0,
+        }
+
+
+exercise_index = ExerciseIndex()
@@ -0,0 +1,191 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+# ==========================================
+# ЛОКАЛЬНАЯ ЗАГЛУШКА OPENAI-СОВМЕСТИМОГО API
+# ==========================================
+# Нужна для проверок без настоящих ключей: роутер провайдеров, очередь, стриминг.
+# Запуск: python -m services.fake_llm_server --port 8099 --delay 0.5
+# Затем в .env: DEEPSEEK_BASE_URL=http://127.0.0.1:8099/v1  DEEPSEEK_API_KEY=fake
+# Сбои для нагрузочных прогонов: --jitter 0.3 --error-rate 0.05 --rate-limit-rate 0.05 --drop-rate 0.02 --seed 1
+
+DEFAULT_REPLY = "Привет! Это тестовый ответ локальной заглушки. Делай 3 подхода по 12 повторений."
+
+
+class FakeLLMServer:
+    """
+    Отвечает на /v1/models и /v1/chat/completions (обычный и stream=True) в формате OpenAI.
+    delay — задержка перед ответом (сек), hang — не отвечать вообще (для проверки таймаутов).
+    jitter — случайная добавка к delay (0..jitter), error_rate / rate_limit_rate — доля ответов 500 / 429,
+    drop_rate — доля стримов, оборванных на середине. seed делает сбои повторяемыми между прогонами.
+    replies — список (маркер, ответ): если маркер есть в тексте запроса, отдается этот ответ вместо reply.
+    """
+    def __init__(self, model: str = "fake-model", delay: float = 0.0, reply: str = DEFAULT_REPLY,
+                 hang: bool = False, chunk_delay: float = 0.02, jitter: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, drop_rate: float = 0.0,
+                 replies: list[tuple[str, str]] | None = None, seed: int | None = None):
+        self.model = model
+        self.delay = delay
+        self.reply = reply
+        self.hang = hang
+        self.chunk_delay = chunk_delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.drop_rate = drop_rate
+        self.replies = replies or []
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.injected = {"errors": 0, "rate_limits": 0, "drops": 0}
+        self._seen_prefixes = set()  # Имитация кэша префикса: повторный system-промпт "берется из кэша"
+        self._runner: web.AppRunner | None = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v1/models", self.models)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        return app
+
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": self.model, "object": "model", "owned_by": "fake"}]})
+
+    def pick_reply(self, messages: list) -> str:
+        text = "\n".join(str(m.get("content", "")) for m in messages)
+        return next((reply for marker, reply in self.replies if marker in text), self.reply)
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = await request.json()
+        if self.hang:
+            await asyncio.sleep(3600)
+        await asyncio.sleep(self.delay + self.random.uniform(0, self.jitter))
+
+        roll = self.random.random()
+        if roll < self.error_rate:
+            self.injected["errors"] += 1
+            return web.json_response({"error": {"message": "Injected server error", "type": "server_error"}}, status=500)
+        if roll < self.error_rate + self.rate_limit_rate:
+            self.injected["rate_limits"] += 1
+            return web.json_response(
+                {"error": {"message": "Injected rate limit", "type": "rate_limit_error"}},
+                status=429, headers={"Retry-After": "1"},
+            )
+        drop = self.random.random() < self.drop_rate
+        reply = self.pick_reply(body.get("messages", []))
+
+        completion_id = f"chatcmpl-fake-{self.requests}"
+        created = int(time.time())
+        model = body.get("model") or self.model  # Отвечаем той моделью, которую попросили (маршруты задач)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        completion_tokens = len(reply) // 4
+        prefix = next((str(m.get("content", "")) for m in body.get("messages", []) if m.get("role") == "system"), "")
+        cached_tokens = len(prefix) // 4 if prefix in self._seen_prefixes else 0
+        if prefix:
+            self._seen_prefixes.add(prefix)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": cached_tokens,
+            "prompt_cache_miss_tokens": prompt_tokens - cached_tokens,
+        }
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+        # Клиент может уйти раньше (например, проиграл хедж) — это не ошибка заглушки
+        try:
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+            await response.prepare(request)
+
+            words = reply.split(" ")
+            for i, word in enumerate(words):
+                if drop and i == len(words) // 2:
+                    # Обрыв соединения посреди ответа: клиент получит ошибку чтения стрима
+                    self.injected["drops"] += 1
+                    request.transport.close()
+                    return response
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": word if i == 0 else " " + word},
+                        "finish_reason": None,
+                    }],
+                }
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                await asyncio.sleep(self.chunk_delay)
+
+            final = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            await response.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage_chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [], "usage": usage,
+                }
+                await response.write(f"data: {json.dumps(usage_chunk)}\n\n".encode("utf-8"))
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            logger.info("🧪 Клиент закрыл стрим раньше времени")
+        return response
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8099) -> str:
+        """Запускает сервер в текущем event loop и возвращает base_url для клиента"""
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"🧪 Заглушка LLM слушает http://{host}:{port}/v1")
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная заглушка OpenAI-совместимого API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.0, help="Задержка перед ответом, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, сек")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="Пауза между кусками стрима, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Доля стримов, оборванных на середине")
+    parser.add_argument("--seed", type=int, default=None, help="Зерно генератора сбоев")
+    parser.add_argument("--hang", action="store_true", help="Никогда не отвечать (проверка таймаутов)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeLLMServer(
+        delay=args.delay, hang=args.hang, jitter=args.jitter, chunk_delay=args.chunk_delay,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, drop_rate=args.drop_rate, seed=args.seed,
+    )
+    web.run_app(server.make_app(), host=args.host, port=args.port)
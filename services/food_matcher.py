@@ -0,0 +1,207 @@
+import re
+import difflib
+import datetime
+from dataclasses import dataclass, field
+
+from data.food_db import FOOD_DB, FOOD_ALIASES, RAW_VARIANTS, PIECE_WEIGHTS, UNIT_WEIGHTS
+
+
+# ==========================================
+# ЛОКАЛЬНЫЙ РАСЧЕТ КБЖУ ДЛЯ ДНЕВНИКА ПИТАНИЯ
+# ==========================================
+# "200г гречки, 2 яйца, банан" считается по таблице data/food_db.py прямо в процессе.
+# В ИИ уходят только куски, которые не нашлись в таблице или записаны без понятного веса.
+
+MATCH_CUTOFF = 0.85
+
+MEAL_WORDS = {"завтрак": "Завтрак", "обед": "Обед", "ужин": "Ужин", "перекус": "Перекус", "полдник": "Перекус"}
+MEAL_RE = re.compile(r"\b(?:на\s+)?(завтрак|обед|ужин|перекус|полдник)\w*\s*:?", re.IGNORECASE)
+FILLER_RE = re.compile(
+    r"\b(?:я|съел\w*|съела|поел\w*|скушал\w*|выпил\w*|сегодня|еще|ещё|было|примерно|около|грамм?ов)\b",
+    re.IGNORECASE
+)
+RAW_RE = re.compile(r"\b(?:сух\w*|сыр(?:ой|ого|ая|ую|ом|ые|ых)|в\s+сухом\s+виде|до\s+варки|до\s+готовки)\b", re.IGNORECASE)
+COOKED_RE = re.compile(r"\b(?:варен\w*|отварн\w*|готов\w*)\b", re.IGNORECASE)
+SEGMENT_SPLIT_RE = re.compile(r"[;\n+]+|,(?!\d)|\s+а\s+также\s+", re.IGNORECASE)
+# "и" делим осторожно: "салат из огурцов и помидоров 200г" — одно блюдо, см. _split_and
+AND_SPLIT_RE = re.compile(r"\s+и\s+", re.IGNORECASE)
+
+NUMBER_WORDS = {
+    "один": 1, "одно": 1, "одна": 1, "одну": 1, "два": 2, "две": 2, "три": 3, "четыре": 4,
+    "пять": 5, "шесть": 6, "пол": 0.5, "половина": 0.5, "половинку": 0.5, "полтора": 1.5, "полторы": 1.5,
+}
+NUM = r"(?P<num>\d+(?:[.,]\d+)?|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")"
+MASS_RE = re.compile(NUM + r"\s*(?P<unit>кг|килограмм\w*|г|гр|грамм\w*|g|мл|ml|миллилитр\w*|л|литр\w*)(?![а-яa-z])", re.IGNORECASE)
+HOUSEHOLD_RE = re.compile(
+    r"(?:" + NUM + r"\s*)?(?P<unit>чайн\w*\s+ложк\w*|столов\w*\s+ложк\w*|ст\.\s?л\.?|ч\.\s?л\.?|ложк\w*|стакан\w*|кружк\w*|чашк\w*|тарелк\w*|скуп\w*|мерн\w*\s+ложк\w*)",
+    re.IGNORECASE
+)
+PIECE_RE = re.compile(r"(?:" + NUM + r"\s*)?(?P<unit>шт\w*\.?|штук\w*|кус\w*|ломтик\w*|порци\w*)(?![а-яa-z])", re.IGNORECASE)
+COUNT_RE = re.compile(r"^\s*" + NUM + r"\b", re.IGNORECASE)
+
+SUFFIXES = sorted([
+    "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее",
+    "ую", "юю", "ых", "их", "ом", "ем", "ам", "ям", "ах", "ях", "ов", "ев", "ы", "и", "а", "я", "у", "ю", "е", "о", "ь",
+], key=len, reverse=True)
+
+
+@dataclass
+class FoodItem:
+    meal: str
+    name: str
+    weight: float
+    calories: float
+    protein: float
+    fat: float
+    carbs: float
+
+
+@dataclass
+class FoodParseResult:
+    items: list[FoodItem] = field(default_factory=list)
+    leftovers: list[str] = field(default_factory=list)   # Куски текста для ИИ
+    meal: str | None = None                              # Тип приема пищи, если пользователь назвал его сам
+
+
+def meal_by_time(now: datetime.datetime) -> str:
+    """Те же окна, что в промпте калькулятора"""
+    minutes = now.hour * 60 + now.minute
+    if 6 * 60 <= minutes < 10 * 60:
+        return "Завтрак"
+    if 12 * 60 <= minutes < 15 * 60:
+        return "Обед"
+    if 17 * 60 <= minutes < 20 * 60:
+        return "Ужин"
+    return "Перекус"
+
+
+def _stem(word: str) -> str:
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def _key(text: str) -> str:
+    words = re.findall(r"[а-яa-z0-9%.]+", text.lower().replace("ё", "е"))
+    return " ".join(_stem(w) for w in words)
+
+
+def _build_index() -> dict[str, str]:
+    index = {}
+    for name in FOOD_DB:
+        index[_key(name)] = name
+    for alias, name in FOOD_ALIASES.items():
+        index.setdefault(_key(alias), name)
+    # Порядок слов не важен: "филе куриное" == "куриное филе"
+    for key, name in list(index.items()):
+        index.setdefault(" ".join(sorted(key.split())), name)
+    return index
+
+
+FOOD_INDEX = _build_index()
+
+
+def match_food(phrase: str, fuzzy: bool = True) -> str | None:
+    """Нечеткий поиск продукта в таблице. Учитывает 'сухой'/'сырой' вес. fuzzy=False — только точное совпадение."""
+    raw = bool(RAW_RE.search(phrase))
+    phrase = COOKED_RE.sub(" ", RAW_RE.sub(" ", phrase))
+    key = _key(phrase)
+    if not key:
+        return None
+
+    name = FOOD_INDEX.get(key) or FOOD_INDEX.get(" ".join(sorted(key.split())))
+    if not name and fuzzy:
+        close = difflib.get_close_matches(key, FOOD_INDEX.keys(), n=1, cutoff=MATCH_CUTOFF)
+        name = FOOD_INDEX[close[0]] if close else None
+    if name and raw:
+        name = RAW_VARIANTS.get(name, name)
+    return name
+
+
+def _number(value: str) -> float:
+    value = value.lower()
+    return NUMBER_WORDS[value] if value in NUMBER_WORDS else float(value.replace(",", "."))
+
+
+def _extract_quantity(segment: str) -> tuple[str, float | None, float | None]:
+    """Возвращает (текст без количества, вес в граммах или None, число штук или None)"""
+    m = MASS_RE.search(segment)
+    if m:
+        unit = m.group("unit").lower()
+        grams = _number(m.group("num"))
+        if unit.startswith(("кг", "килограмм", "л", "литр")):
+            grams *= 1000
+        return segment[:m.start()] + " " + segment[m.end():], grams, None
+
+    m = HOUSEHOLD_RE.search(segment)
+    if m:
+        unit = m.group("unit").lower()
+        count = _number(m.group("num")) if m.group("num") else 1
+        per_unit = next((w for stem, w in UNIT_WEIGHTS.items() if unit.startswith(stem)), 15)
+        return segment[:m.start()] + " " + segment[m.end():], count * per_unit, None
+
+    m = PIECE_RE.search(segment)
+    if m:
+        count = _number(m.group("num")) if m.group("num") else 1
+        return segment[:m.start()] + " " + segment[m.end():], None, count
+
+    m = COUNT_RE.search(segment)
+    if m:
+        return segment[m.end():], None, _number(m.group("num"))
+
+    return segment, None, 1.0  # "банан" — одна штука
+
+
+def _has_quantity(segment: str) -> bool:
+    return any(r.search(segment) for r in (MASS_RE, HOUSEHOLD_RE, PIECE_RE, COUNT_RE))
+
+
+def _split_and(segment: str) -> list[str]:
+    """
+    Делит по "и", только если части независимы: у каждой свое количество ("2 яйца и 200г творога")
+    или каждая точно есть в таблице ("яйца и банан"). Иначе кусок целиком (уйдет в ИИ, если не найдется).
+    """
+    parts = [p.strip(" .:-–") for p in AND_SPLIT_RE.split(segment)]
+    if len(parts) == 1 or not all(parts):
+        return [segment]
+    if all(_has_quantity(p) for p in parts):
+        return parts
+    if all(match_food(_extract_quantity(p)[0], fuzzy=False) for p in parts):
+        return parts
+    return [segment]
+
+
+def parse_meal_text(text: str, now: datetime.datetime | None = None) -> FoodParseResult:
+    result = FoodParseResult()
+    now = now or datetime.datetime.now()
+
+    meal_match = MEAL_RE.search(text or "")
+    if meal_match:
+        result.meal = MEAL_WORDS[meal_match.group(1).lower()]
+    meal = result.meal or meal_by_time(now)
+
+    segments = []
+    for raw in SEGMENT_SPLIT_RE.split(MEAL_RE.sub(" ", text or "")):
+        segment = FILLER_RE.sub(" ", raw).strip(" .:-–")
+        if segment:
+            segments.extend(_split_and(segment))
+
+    for segment in segments:
+        phrase, grams, pieces = _extract_quantity(segment)
+        name = match_food(phrase) if not re.search(r"\d", phrase) else None
+        if name and grams is None:
+            piece = PIECE_WEIGHTS.get(name)
+            grams = piece * pieces if piece and pieces else None
+        if not name or not grams or grams > 3000:
+            result.leftovers.append(segment)
+            continue
+
+        kcal, p, f, c = FOOD_DB[name]
+        k = grams / 100
+        result.items.append(FoodItem(
+            meal=meal, name=name.capitalize(), weight=round(grams, 1),
+            calories=round(kcal * k, 1), protein=round(p * k, 1), fat=round(f * k, 1), carbs=round(c * k, 1)
+        ))
+
+    return result
@@ -4,6 +4,7 @@ import matplotlib
 matplotlib.use('Agg') # Анти-GUI бэкенд для сервера
 import matplotlib.pyplot as plt
 from collections import defaultdict
+from services.exercise_index import exercise_index
 
 class GraphService:
     
@@ -47,9 +48,8 @@ class GraphService:
                 if not raw_name:
                     raw_name = "Упражнение"
                     
-                # 2. ЖЕСТКАЯ ОЧИСТКА (удаляем лишние пробелы, приводим всё к нижнему регистру, меняем Ё на Е)
-                import re
-                clean_name = re.sub(r'\s+', ' ', str(raw_name)).strip().lower().replace('ё', 'е').capitalize()
+                # 2. Готовый ключ из словаря упражнений (синонимы сводятся к одному названию)
+                clean_name = exercise_index.group_key(str(raw_name))
                 
                 # 3. Добавляем в словарь уже идеально чистое имя
                 ex_dict[clean_name].append((ex.date, ex.weight))
@@ -205,9 +205,8 @@ class GraphService:
                 if not raw_name:
                     continue
                 
-                # 2. ЖЕСТКАЯ ОЧИСТКА
-                # Убираем все пробелы, приводим к нижнему регистру, меняем Ё на Е
-                clean_name = re.sub(r'\s+', ' ', raw_name).strip().lower().replace('ё', 'е').capitalize()
+                # 2. Готовый ключ из словаря упражнений
+                clean_name = exercise_index.group_key(raw_name)
                 
                 ex_dict[clean_name].append((ex.date, ex.weight))
 
@@ -0,0 +1,203 @@
+import json
+import asyncio
+import logging
+import datetime
+
+from aiogram import Bot
+from aiogram.types import Message, Chat
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.exceptions import TelegramBadRequest
+
+from config import Config
+from database.crud import AIJobCRUD
+
+logger = logging.getLogger(__name__)
+
+
+# ==========================================
+# ФОНОВАЯ ОЧЕРЕДЬ ДОЛГИХ ГЕНЕРАЦИЙ
+# ==========================================
+# Недельная программа и меню генерируются 60-90 секунд. Раньше это шло прямо внутри
+# хендлера: перезапуск бота посреди генерации терял и работу, и запрос пользователя.
+# Теперь хендлер только проверяет лимиты и ставит задачу в таблицу ai_jobs,
+# а воркеры (несколько asyncio-задач в том же процессе) забирают ее, показывают прогресс
+# в статусном сообщении и присылают результат. Упавшая попытка повторяется с паузой,
+# задачи в статусе running после перезапуска возвращаются в очередь.
+
+class JobContext:
+    """Все, что нужно обработчику задачи: параметры, сессия БД, бот и статусное сообщение"""
+
+    def __init__(self, queue: "AIJobQueue", job, session):
+        self.queue = queue
+        self.job = job
+        self.session = session
+        self.bot: Bot = queue.bot
+        self.payload: dict = json.loads(job.payload) if job.payload else {}
+
+    @property
+    def attempt(self) -> int:
+        return self.job.attempts
+
+    def status_message(self) -> Message | None:
+        """Статусное сообщение как объект Message: с ним работают edit_text/answer и queue_notifier"""
+        if not self.job.status_message_id:
+            return None
+        return Message(
+            message_id=self.job.status_message_id,
+            date=datetime.datetime.now(),
+            chat=Chat(id=self.job.chat_id, type="private"),
+        ).as_(self.bot)
+
+    async def progress(self, text: str):
+        """Обновляет статусное сообщение. Ошибки Telegram (тот же текст, сообщение удалено) не важны."""
+        if not self.job.status_message_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                text, chat_id=self.job.chat_id, message_id=self.job.status_message_id, parse_mode="HTML"
+            )
+        except TelegramBadRequest:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Задача #{self.job.id}: не удалось обновить статус: {e}")
+
+    def state(self) -> FSMContext:
+        """FSM пользователя, как в хендлере (листалка программы хранит страницы в состоянии)"""
+        key = StorageKey(bot_id=self.bot.id, chat_id=self.job.chat_id, user_id=self.job.user_id)
+        return FSMContext(storage=self.queue.storage, key=key)
+
+
+async def _default_failure(ctx: JobContext, error: str):
+    await ctx.progress("❌ Ошибка генерации. Попробуйте позже.")
+
+
+class AIJobQueue:
+    def __init__(self):
+        self._handlers = {}  # kind -> (обработчик, обработчик финальной ошибки)
+        self._wakeup = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+        self.bot: Bot | None = None
+        self.session_pool = None
+        self.storage: BaseStorage | None = None
+
+        # --- МЕТРИКИ ---
+        self.enqueued = 0
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+        self.resumed = 0
+
+    def handler(self, kind: str, on_failure=None):
+        """Регистрирует обработчик задач типа kind (как router.message для апдейтов)"""
+        def decorator(func):
+            self._handlers[kind] = (func, on_failure or _default_failure)
+            return func
+        return decorator
+
+    async def enqueue(self, session, kind: str, user_id: int, chat_id: int, status_message_id: int = None, payload: dict = None):
+        job = await AIJobCRUD.enqueue(
+            session, kind, user_id, chat_id, status_message_id,
+            json.dumps(payload, ensure_ascii=False) if payload else None
+        )
+        self.enqueued += 1
+        self._wakeup.set()
+        logger.info(f"📥 Задача #{job.id} ({kind}) поставлена в очередь для {user_id}")
+        return job
+
+    async def start(self, bot: Bot, session_pool, storage: BaseStorage, workers: int = Config.JOB_WORKERS):
+        self.bot = bot
+        self.session_pool = session_pool
+        self.storage = storage
+
+        async with session_pool() as session:
+            self.resumed = await AIJobCRUD.requeue_running(session)
+            purged = await AIJobCRUD.purge(session, Config.JOB_KEEP_DAYS)
+        if self.resumed:
+            logger.info(f"♻️ Возвращено в очередь после перезапуска: {self.resumed} задач")
+        if purged:
+            logger.info(f"🧹 Удалено старых задач: {purged}")
+
+        self._workers = [asyncio.create_task(self._worker(n)) for n in range(workers)]
+        self._wakeup.set()
+        logger.info(f"🧵 Очередь генераций запущена ({workers} воркеров)")
+
+    async def stop(self):
+        """Прерванные задачи остаются в статусе running и будут подхвачены при следующем запуске"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self, number: int):
+        while True:
+            try:
+                self._wakeup.clear()
+                async with self.session_pool() as session:
+                    job = await AIJobCRUD.claim_next(session)
+                if job is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=Config.JOB_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Воркер очереди #{number}: {e}")
+                await asyncio.sleep(Config.JOB_POLL_SECONDS)
+
+    async def _run(self, job):
+        handler, on_failure = self._handlers.get(job.kind, (None, _default_failure))
+
+        async with self.session_pool() as session:
+            ctx = JobContext(self, job, session)
+            if handler is None:
+                await AIJobCRUD.finish(session, job.id, "failed", f"Неизвестный тип задачи: {job.kind}")
+                self.failed += 1
+                return
+
+            try:
+                await asyncio.wait_for(handler(ctx), timeout=Config.JOB_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"[:500]
+                await session.rollback()
+
+                if job.attempts < Config.JOB_MAX_ATTEMPTS:
+                    delay = Config.JOB_RETRY_DELAY * job.attempts
+                    await AIJobCRUD.retry_later(session, job.id, delay, error)
+                    self.retried += 1
+                    logger.warning(f"🔁 Задача #{job.id} ({job.kind}), попытка {job.attempts}: {error}. Повтор через {delay:.0f}с")
+                    await ctx.progress(
+                        "⚠️ <b>Тренер споткнулся, но не сдается.</b>\n\n"
+                        f"<i>Пробую еще раз (попытка {job.attempts + 1} из {Config.JOB_MAX_ATTEMPTS})...</i>"
+                    )
+                    asyncio.get_running_loop().call_later(delay, self._wakeup.set)
+                else:
+                    await AIJobCRUD.finish(session, job.id, "failed", error)
+                    self.failed += 1
+                    logger.error(f"❌ Задача #{job.id} ({job.kind}) провалена после {job.attempts} попыток: {error}")
+                    try:
+                        await on_failure(ctx, error)
+                    except Exception as notify_error:
+                        logger.error(f"❌ Задача #{job.id}: не удалось сообщить об ошибке: {notify_error}")
+                return
+
+            await AIJobCRUD.finish(session, job.id, "done")
+            self.done += 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "enqueued": self.enqueued,
+            "done": self.done,
+            "retried": self.retried,
+            "failed": self.failed,
+            "resumed": self.resumed,
+        }
+
+
+job_queue = AIJobQueue()
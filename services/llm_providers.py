@@ -0,0 +1,388 @@
+import time
+import asyncio
+import logging
+import importlib.util
+from collections import deque
+import httpx
+from openai import AsyncOpenAI, APITimeoutError
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+# ==========================================
+# ПРОВАЙДЕРЫ LLM (DEEPSEEK + GROQ КАК РЕЗЕРВ)
+# ==========================================
+# Все провайдеры говорят на OpenAI-совместимом API, различаются только адресом, ключом и моделью
+PROVIDER_SETTINGS = {
+    "deepseek": {
+        "base_url": Config.DEEPSEEK_BASE_URL,
+        "api_key": Config.DEEPSEEK_API_KEY,
+        "model": Config.DEEPSEEK_MODEL,
+    },
+    "groq": {
+        "base_url": Config.GROQ_BASE_URL,
+        "api_key": Config.GROQ_API_KEY,
+        "model": Config.GROQ_MODEL,
+    },
+}
+
+
+class AllProvidersDown(Exception):
+    """Все провайдеры недоступны (у всех сработал предохранитель)"""
+
+
+def _http2_available() -> bool:
+    """HTTP/2 в httpx работает только при установленном пакете h2"""
+    return Config.AI_HTTP2 and importlib.util.find_spec("h2") is not None
+
+
+def _percentile(values, q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class LLMProvider:
+    """
+    Один бэкенд LLM: свой клиент с пулом keep-alive соединений, статистика задержек и ошибок
+    и предохранитель (circuit breaker): после N таймаутов подряд провайдер на время выключается.
+    """
+    def __init__(self, name: str, base_url: str, api_key: str, model: str, max_retries: int = 0):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+
+        http2 = _http2_available()
+        http_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=Config.AI_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.AI_MAX_KEEPALIVE,
+                keepalive_expiry=Config.AI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(90.0, connect=10.0),
+        )
+        # При наличии резерва повторы делает роутер: встроенные ретраи SDK только прячут таймауты от предохранителя
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=max_retries)
+        logger.info(
+            f"🔌 Провайдер {name}: пул создан (max={Config.AI_MAX_CONNECTIONS}, "
+            f"keep-alive={Config.AI_MAX_KEEPALIVE}, HTTP/2={'да' if http2 else 'нет'})"
+        )
+
+        # --- МЕТРИКИ ---
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latencies = deque(maxlen=200)  # Полный ответ (сек)
+        self.ttft = deque(maxlen=200)       # Время до первого куска в стриме (сек)
+
+        # --- ПРЕДОХРАНИТЕЛЬ ---
+        self.consecutive_timeouts = 0
+        self.open_until = 0.0
+        self.trips = 0
+
+    # --- СОСТОЯНИЕ ПРЕДОХРАНИТЕЛЯ ---
+    @property
+    def state(self) -> str:
+        if self.consecutive_timeouts < Config.AI_BREAKER_THRESHOLD:
+            return "closed"
+        if time.monotonic() < self.open_until:
+            return "open"
+        return "half_open"  # Время вышло: пропускаем пробный запрос
+
+    def available(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self, latency: float, first_token: bool = False):
+        self.requests += 1
+        (self.ttft if first_token else self.latencies).append(latency)
+        if self.consecutive_timeouts >= Config.AI_BREAKER_THRESHOLD:
+            logger.info(f"✅ Провайдер {self.name} снова отвечает, предохранитель сброшен")
+        self.consecutive_timeouts = 0
+
+    def record_failure(self, error: BaseException):
+        self.requests += 1
+        self.errors += 1
+        if not isinstance(error, (APITimeoutError, asyncio.TimeoutError)):
+            return
+
+        self.timeouts += 1
+        self.consecutive_timeouts += 1
+        if self.consecutive_timeouts >= Config.AI_BREAKER_THRESHOLD:
+            # В состоянии half_open одного таймаута хватает, чтобы снова выключить провайдера
+            self.open_until = time.monotonic() + Config.AI_BREAKER_COOLDOWN
+            self.trips += 1
+            logger.warning(
+                f"⛔️ Провайдер {self.name}: {self.consecutive_timeouts} таймаутов подряд, "
+                f"отключен на {Config.AI_BREAKER_COOLDOWN:.0f}с"
+            )
+
+    def hedge_delay(self, stream: bool) -> float:
+        """Через сколько секунд без ответа стоит звать запасного провайдера (p95 задержки)"""
+        p95 = _percentile(self.ttft if stream else self.latencies, 0.95)
+        if p95 is None:
+            return Config.AI_HEDGE_DEFAULT_DELAY
+        return max(Config.AI_HEDGE_MIN_DELAY, p95)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "state": self.state,
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "trips": self.trips,
+            "p50": _percentile(self.latencies, 0.5),
+            "p95": _percentile(self.latencies, 0.95),
+            "ttft_p95": _percentile(self.ttft, 0.95),
+        }
+
+    # --- ВЫЗОВЫ ---
+    async def complete(self, messages: list, temperature: float, timeout: float, model: str | None = None, **params):
+        started = time.perf_counter()
+        try:
+            response = await self.client.chat.completions.create(
+                model=model or self.model, messages=messages,
+                temperature=temperature, timeout=timeout, **params
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success(time.perf_counter() - started)
+        return response
+
+    async def open_stream(self, messages: list, temperature: float, timeout: float, model: str | None = None, **params):
+        """Открывает стрим и ждет первый непустой кусок. Возвращает (первый кусок, остаток стрима)."""
+        started = time.perf_counter()
+        stream = None
+        try:
+            stream = await self.client.chat.completions.create(
+                model=model or self.model, messages=messages,
+                temperature=temperature, timeout=timeout, stream=True, **params
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    self.record_success(time.perf_counter() - started, first_token=True)
+                    return chunk.choices[0].delta.content, stream
+        except BaseException as e:
+            if stream is not None:
+                await stream.close()
+            if not isinstance(e, asyncio.CancelledError):
+                self.record_failure(e)
+            raise
+        # Модель ничего не написала — тоже ответ
+        self.record_success(time.perf_counter() - started, first_token=True)
+        return "", stream
+
+    async def close(self):
+        try:
+            await self.client.close()
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии провайдера {self.name}: {e}")
+
+
+# ==========================================
+# РОУТЕР: ПОРЯДОК ПРОВАЙДЕРОВ, ФЕЙЛОВЕР, ХЕДЖИРОВАНИЕ
+# ==========================================
+class LLMRouter:
+    """
+    Выбирает провайдера для запроса.
+    Обычный режим: по порядку из AI_PROVIDERS, при ошибке — следующий.
+    Хеджирование (hedge=True): если основной молчит дольше своего p95, параллельно
+    запускается запасной, берется первый ответ, второй запрос отменяется.
+    route — маршрут задачи [(провайдер, модель или None)]: эти провайдеры идут первыми и со своей моделью,
+    остальные остаются резервом со своей моделью по умолчанию (см. parse_route).
+    """
+    def __init__(self, providers: list[LLMProvider]):
+        self.providers = providers
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def _candidates(self, route: list | None = None) -> list[LLMProvider]:
+        candidates = [p for p in self.providers if p.available()]
+        if not candidates:
+            raise AllProvidersDown("Все AI-провайдеры временно отключены")
+        if route:
+            order = [name for name, _ in route]
+            candidates.sort(key=lambda p: order.index(p.name) if p.name in order else len(order))
+        return candidates
+
+    async def complete(self, messages: list, temperature: float, timeout: float, hedge: bool = False,
+                       route: list | None = None, **params):
+        candidates = self._candidates(route)
+        models = {name: model for name, model in route or [] if model}
+        call = lambda p: p.complete(messages, temperature, timeout, model=models.get(p.name), **params)
+        if hedge and len(candidates) > 1:
+            return await self._hedged(candidates[0], candidates[1], call, stream=False)
+        return await self._failover(candidates, call)
+
+    async def stream(self, messages: list, temperature: float, timeout: float, hedge: bool = False,
+                     usage_sink: dict | None = None, route: list | None = None, **params):
+        """
+        Асинхронный генератор кусков текста. Провайдер меняется только до первого куска.
+        usage_sink — словарь, куда кладется usage из последнего куска (если провайдер его прислал) и модель.
+        """
+        candidates = self._candidates(route)
+        models = {name: model for name, model in route or [] if model}
+        opener = lambda p: p.open_stream(messages, temperature, timeout, model=models.get(p.name), **params)
+        if hedge and len(candidates) > 1:
+            first, stream = await self._hedged(candidates[0], candidates[1], opener, stream=True)
+        else:
+            first, stream = await self._failover(candidates, opener)
+
+        try:
+            if first:
+                yield first
+            async for chunk in stream:
+                if usage_sink is not None and getattr(chunk, "usage", None):
+                    usage_sink["usage"] = chunk.usage
+                    usage_sink["model"] = getattr(chunk, "model", None)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+    async def _failover(self, candidates: list[LLMProvider], call):
+        last_error = None
+        for provider in candidates:
+            try:
+                return await call(provider)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                last_error = e
+                if provider is not candidates[-1]:
+                    self.failovers += 1
+                    logger.warning(f"⚠️ Провайдер {provider.name} не ответил ({e}), пробую следующего")
+        raise last_error
+
+    async def _hedged(self, primary: LLMProvider, backup: LLMProvider, call, stream: bool):
+        tasks = {asyncio.create_task(call(primary)): primary}
+        winner = None
+        try:
+            done, _ = await asyncio.wait(set(tasks), timeout=primary.hedge_delay(stream))
+            if not done:
+                self.hedges += 1
+                logger.info(f"🏁 Хедж: {primary.name} молчит, параллельно спрашиваю {backup.name}")
+                tasks[asyncio.create_task(call(backup))] = backup
+
+            last_error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if tasks[task] is backup:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+
+            if len(tasks) == 1:
+                # Основной упал быстрее задержки хеджа — обычный фейловер на запасного
+                self.failovers += 1
+                return await call(backup)
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif stream and task is not winner and not task.cancelled() and task.exception() is None:
+                    # Проигравший стрим успел открыться — закрываем соединение
+                    await task.result()[1].close()
+
+    def stats(self) -> dict:
+        return {
+            "providers": {p.name: p.stats() for p in self.providers},
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+        }
+
+
+def parse_route(text: str) -> list[tuple[str, str | None]]:
+    """'groq:llama-3.1-8b-instant,deepseek' -> [('groq', 'llama-3.1-8b-instant'), ('deepseek', None)]"""
+    route = []
+    for part in (text or "").split(","):
+        name, _, model = part.strip().partition(":")
+        if name:
+            route.append((name.strip(), model.strip() or None))
+    return route
+
+
+# ==========================================
+# ОБЩИЙ РОУТЕР (ОДИН НА ПРОЦЕСС)
+# ==========================================
+_router: LLMRouter | None = None
+
+
+def init_ai_client() -> LLMRouter | None:
+    """Создает провайдеров из AI_PROVIDERS, у которых задан ключ (вызывается в main.main())"""
+    global _router
+    if _router is not None:
+        return _router
+
+    configured = []
+    for name in Config.AI_PROVIDERS:
+        settings = PROVIDER_SETTINGS.get(name)
+        if not settings:
+            logger.warning(f"⚠️ Неизвестный AI-провайдер в AI_PROVIDERS: {name}")
+        elif settings["api_key"]:
+            configured.append((name, settings))
+
+    # Если резерва нет, оставляем SDK его штатные повторы
+    max_retries = 0 if len(configured) > 1 else 2
+    providers = []
+    for name, settings in configured:
+        try:
+            providers.append(LLMProvider(name, max_retries=max_retries, **settings))
+        except Exception as e:
+            logger.error(f"Не удалось создать провайдера {name}: {e}")
+
+    if not providers:
+        logger.warning("⚠️ Ни один ключ AI-провайдера не задан, AI-функции отключены")
+        return None
+
+    _router = LLMRouter(providers)
+    logger.info(f"🧭 AI-провайдеры по приоритету: {', '.join(p.name for p in providers)}")
+    return _router
+
+
+def get_router() -> LLMRouter | None:
+    """Возвращает общий роутер. Скрипты без main() получают его лениво при первом обращении."""
+    if _router is None:
+        return init_ai_client()
+    return _router
+
+
+async def warmup_ai_client() -> None:
+    """Заранее открывает TLS-соединения ко всем провайдерам, чтобы первый пользователь не ждал рукопожатия"""
+    router = get_router()
+    if not router or Config.AI_WARMUP_CONNECTIONS <= 0:
+        return
+
+    started = time.perf_counter()
+    for provider in router.providers:
+        results = await asyncio.gather(
+            *[provider.client.models.list(timeout=10.0) for _ in range(Config.AI_WARMUP_CONNECTIONS)],
+            return_exceptions=True
+        )
+        failed = sum(1 for r in results if isinstance(r, Exception))
+        if failed:
+            logger.warning(f"⚠️ Прогрев {provider.name}: {failed}/{len(results)} запросов не прошли")
+    logger.info(f"🔥 Пулы AI-соединений прогреты за {time.perf_counter() - started:.2f}с")
+
+
+async def close_ai_client() -> None:
+    """Закрывает всех провайдеров и их соединения (вызывается при остановке бота)"""
+    global _router
+    if _router is None:
+        return
+    for provider in _router.providers:
+        await provider.close()
+    _router = None
@@ -0,0 +1,69 @@
+import re
+
+
+# ==========================================
+# ТОЧЕЧНЫЕ ПРАВКИ МЕНЮ
+# ==========================================
+# "Замени перекус" раньше отправляло в модель весь текущий рацион и заставляло
+# переписать все страницы. Здесь определяем, каких приемов пищи касается правка,
+# и находим их страницы: AIManager.edit_nutrition_pages переписывает только их,
+# остальные страницы и цели КБЖУ остаются как были.
+
+SKIP_WISHES = ['пропустить', 'нет особых', 'ем всё', 'ем все']
+
+MEAL_KEYS = {
+    "breakfast": re.compile(r"завтрак", re.IGNORECASE),
+    "lunch": re.compile(r"обед", re.IGNORECASE),
+    "dinner": re.compile(r"ужин", re.IGNORECASE),
+    "snack": re.compile(r"перекус|полдник", re.IGNORECASE),
+}
+PAGE_ICONS = {"🍳": "breakfast", "🍲": "lunch", "🥗": "dinner", "🥪": "snack"}
+SHOPPING_RE = re.compile(r"🛒|список покупок|shopping list", re.IGNORECASE)
+# "Замени все / меню целиком / поменяй калории" — правка на весь рацион, точечно не выйдет
+WHOLE_MENU_RE = re.compile(r"\b(?:вс[её]|весь|целиком|полностью|калори\w*|ккал|кбжу)\b", re.IGNORECASE)
+
+
+def is_edit_request(prev_plan: str | None, wishes: str | None) -> bool:
+    """Меню уже есть и клиент написал правку (а не нажал 'Пропустить')"""
+    wishes = wishes or ""
+    return bool(prev_plan) and len(wishes) > 3 and not any(skip in wishes.lower() for skip in SKIP_WISHES)
+
+
+def latest_wish(wishes: str | None) -> str:
+    """Пожелания копятся: 'старые. Дополнительно: новые' — правка касается только последней части"""
+    return (wishes or "").rsplit("Дополнительно:", 1)[-1].strip()
+
+
+def wish_targets(wish: str) -> list[str]:
+    """Какие приемы пищи упомянуты в правке. Пустой список — правка на все меню."""
+    if WHOLE_MENU_RE.search(wish or ""):
+        return []
+    return [key for key, pattern in MEAL_KEYS.items() if pattern.search(wish or "")]
+
+
+def meal_key(name: str) -> str | None:
+    for key, pattern in MEAL_KEYS.items():
+        if pattern.search(name or ""):
+            return key
+    return None
+
+
+def meal_page_index(pages: list[str]) -> dict[str, int]:
+    """Номер страницы для каждого приема пищи (и 'shopping' — список покупок) в текстовом меню"""
+    index = {}
+    for i, page in enumerate(pages):
+        head = "\n".join(str(page).split("\n")[:3])
+        key = next((k for icon, k in PAGE_ICONS.items() if icon in head), None) or meal_key(head)
+        if key is None and SHOPPING_RE.search(head):
+            key = "shopping"
+        if key and key not in index:
+            index[key] = i
+    return index
+
+
+def append_shopping_items(page: str, items: list[str]) -> str:
+    """Дописывает новые продукты в конец страницы списка покупок"""
+    items = [i for i in items if i]
+    if not items:
+        return page
+    return page + "\n\n<b>Добавлено после правки:</b>\n" + "\n".join(f"- {i}" for i in items)
@@ -0,0 +1,157 @@
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# ==========================================
+# КОМПАКТНЫЕ ВЫЖИМКИ ПРОГРАММ ДЛЯ ИСТОРИИ
+# ==========================================
+# Для периодизации ИИ нужно знать только структуру прошлых программ
+# (какие упражнения в какие дни, сплит, диапазоны повторений / какие блюда),
+# а не весь текст с техникой и советами. Выжимка считается один раз при сохранении в архив.
+
+WEEKDAY_SHORT = {
+    "понедельник": "Пн", "вторник": "Вт", "среда": "Ср", "четверг": "Чт",
+    "пятница": "Пт", "суббота": "Сб", "воскресенье": "Вс",
+}
+MEAL_NAMES = ["Завтрак", "Обед", "Ужин", "Перекус"]
+REST_MARKERS = ["восстановлен", "отдых", "rest"]
+
+# <code>Жим лежа</code> ... <i>4 х 8-10 (Отдых 90 сек)</i>
+EXERCISE_RE = re.compile(
+    r"<code>(?P<name>[^<]{2,80})</code>[^\n]*\n?\s*(?:<i>)?\s*(?P<sets>\d+)\s*[xх×]\s*(?P<reps>[\d\-–—]+(?:\s*(?:сек|мин))?)",
+    re.IGNORECASE
+)
+DAY_HEADER_RE = re.compile(r"День\s*(?P<num>\d+)\s*\((?P<weekday>[А-Яа-яё]+)\)\s*(?:[—\-–:]\s*(?P<title>[^<\n]+))?", re.IGNORECASE)
+DISH_RE = re.compile(r"Вариант\s*\d+\s*:?\s*(?:<b>)?\s*(?P<name>[^<\n]{2,80})", re.IGNORECASE)
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка токенов: кириллица дробится токенизатором заметно мельче латиницы"""
+    if not text:
+        return 0
+    cyrillic = sum(1 for ch in text if "а" <= ch.lower() <= "я" or ch in "ёЁ")
+    return int(cyrillic / 2.5 + (len(text) - cyrillic) / 4) + 1
+
+
+def _load_pages(program_text: str) -> list[str]:
+    try:
+        pages = json.loads(program_text)
+        if isinstance(pages, list):
+            return [str(p) for p in pages]
+    except (TypeError, ValueError):
+        pass
+    return [program_text or ""]
+
+
+# --- ТРЕНИРОВКИ ---
+def build_workout_digest(program_text: str) -> dict:
+    """Из сохраненной программы (JSON-список страниц) достает дни, упражнения и схемы подходов"""
+    days = []
+    for page in _load_pages(program_text):
+        header = DAY_HEADER_RE.search(page)
+        if not header:
+            continue  # Страница с советами тренера и т.п.
+
+        title = TAG_RE.sub("", header.group("title") or "").strip(" *")
+        exercises = [
+            [m.group("name").strip(), f"{m.group('sets')}x{m.group('reps').replace(' ', '')}"]
+            for m in EXERCISE_RE.finditer(page)
+        ]
+        is_rest = not exercises and any(marker in page.lower() for marker in REST_MARKERS)
+        days.append({
+            "weekday": WEEKDAY_SHORT.get(header.group("weekday").lower(), header.group("weekday")[:2]),
+            "title": title,
+            "rest": is_rest,
+            "exercises": exercises,
+        })
+
+    return _workout_summary(days)
+
+
+def _workout_summary(days: list[dict]) -> dict:
+    training_days = [d for d in days if not d["rest"]]
+    return {
+        "type": "workout",
+        "split": " / ".join(d["title"] for d in training_days if d["title"]) or f"{len(training_days)} тр/нед",
+        "rep_ranges": sorted({scheme.split("x", 1)[1] for d in training_days for _, scheme in d["exercises"]}),
+        "days": days,
+    }
+
+
+def format_workout_digest(digest: dict) -> str:
+    lines = [f"Сплит: {digest.get('split')}"]
+    if digest.get("rep_ranges"):
+        lines.append(f"Повторы: {', '.join(digest['rep_ranges'])}")
+    for day in digest.get("days", []):
+        if day["rest"]:
+            lines.append(f"{day['weekday']}: отдых")
+        else:
+            moves = "; ".join(f"{name} {scheme}" for name, scheme in day["exercises"]) or day["title"]
+            lines.append(f"{day['weekday']}: {moves}")
+    return "\n".join(lines)
+
+
+# --- ПИТАНИЕ ---
+def build_nutrition_digest(program_text: str) -> dict:
+    """Из сохраненного меню достает названия блюд по приемам пищи (КБЖУ не нужны: их всегда считают заново)"""
+    meals = {}
+    for page in _load_pages(program_text):
+        dishes = [TAG_RE.sub("", m.group("name")).strip(" *:-") for m in DISH_RE.finditer(page)]
+        if not dishes:
+            continue
+        plain = TAG_RE.sub("", page).lower()
+        found = [(plain.find(name.lower()), name) for name in MEAL_NAMES if name.lower() in plain]
+        meal = min(found)[1] if found else "Прочее"
+        meals.setdefault(meal, []).extend(d for d in dishes if d)
+    return {"type": "nutrition", "meals": meals}
+
+
+def format_nutrition_digest(digest: dict) -> str:
+    return "\n".join(f"{meal}: {', '.join(dishes)}" for meal, dishes in digest.get("meals", {}).items())
+
+
+# --- ОБЩЕЕ ---
+def workout_digest_from_structured(structured: str) -> dict:
+    program = json.loads(structured)
+    days = [{
+        "weekday": WEEKDAY_SHORT.get(d.get("weekday", "").lower(), d.get("weekday", "")[:2]),
+        "title": d.get("title", ""),
+        "rest": d.get("rest", False),
+        "exercises": [[e["name"], f"{e['sets']}x{e['reps']}"] for e in d.get("exercises", [])],
+    } for d in program.get("days", [])]
+    return _workout_summary(days)
+
+
+def nutrition_digest_from_structured(structured: str) -> dict:
+    program = json.loads(structured)
+    return {
+        "type": "nutrition",
+        "meals": {m["name"]: [v["name"] for v in m.get("variants", [])] for m in program.get("meals", [])},
+    }
+
+
+def build_digest(program_type: str, program_text: str, structured: str | None = None) -> str | None:
+    """
+    Выжимка в виде JSON-строки для колонки digest. None, если разобрать текст не удалось.
+    Если есть JSON-версия программы (structured), берем данные из нее, а не из текста.
+    """
+    try:
+        if structured:
+            digest = workout_digest_from_structured(structured) if program_type == "workout" else nutrition_digest_from_structured(structured)
+        else:
+            digest = build_workout_digest(program_text) if program_type == "workout" else build_nutrition_digest(program_text)
+    except Exception as e:
+        logger.error(f"Не удалось построить выжимку {program_type}: {e}")
+        return None
+
+    empty = not digest.get("days") if program_type == "workout" else not digest.get("meals")
+    return None if empty else json.dumps(digest, ensure_ascii=False)
+
+
+def format_digest(program_type: str, digest_json: str) -> str:
+    digest = json.loads(digest_json)
+    return format_workout_digest(digest) if program_type == "workout" else format_nutrition_digest(digest)
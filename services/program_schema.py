@@ -0,0 +1,349 @@
+import json
+import html
+import logging
+from dataclasses import dataclass, field, asdict
+
+logger = logging.getLogger(__name__)
+
+
+# ==========================================
+# СТРУКТУРИРОВАННЫЕ ПРОГРАММЫ (JSON-РЕЖИМ ГЕНЕРАЦИИ)
+# ==========================================
+# Модель отвечает JSON-ом по схеме ниже, он один раз разбирается в объекты,
+# из объектов рендерятся страницы (в том же HTML-формате, что и раньше),
+# а листалка, кнопки и цели КБЖУ читают готовые поля вместо регулярок по тексту.
+
+class ProgramParseError(ValueError):
+    """Ответ модели не похож на программу по схеме"""
+
+
+def _num(value, default=0.0) -> float:
+    try:
+        return float(str(value).replace(",", ".").strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def _range(value) -> list[float]:
+    """[мин, макс] из списка, числа или строки '150-170'"""
+    if isinstance(value, (list, tuple)) and value:
+        low, high = _num(value[0]), _num(value[-1])
+    elif isinstance(value, str) and "-" in value:
+        low, high = (_num(v) for v in value.split("-", 1))
+    else:
+        low = high = _num(value)
+    return [min(low, high), max(low, high)]
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:.1f}"
+
+
+def _e(text) -> str:
+    return html.escape(str(text or "").strip(), quote=False)
+
+
+# --- ТРЕНИРОВКИ ---
+@dataclass
+class Exercise:
+    name: str
+    sets: int = 3
+    reps: str = "10-12"
+    rest_sec: int = 60
+    tip: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Exercise":
+        name = str(data.get("name") or "").strip()
+        if not name:
+            raise ProgramParseError("Упражнение без названия")
+        return cls(
+            name=name,
+            sets=int(_num(data.get("sets"), 3)) or 3,
+            reps=str(data.get("reps") or "10-12").strip(),
+            rest_sec=int(_num(data.get("rest_sec"), 60)),
+            tip=str(data.get("tip") or "").strip(),
+        )
+
+
+@dataclass
+class WorkoutDay:
+    number: int
+    date: str = ""
+    weekday: str = ""
+    title: str = ""
+    rest: bool = False
+    exercises: list[Exercise] = field(default_factory=list)
+    notes: list[str] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WorkoutDay":
+        if not isinstance(data, dict) or "number" not in data and "weekday" not in data:
+            raise ProgramParseError("Нет номера/дня недели")
+        exercises = [Exercise.from_dict(e) for e in data.get("exercises") or []]
+        return cls(
+            number=int(_num(data.get("number"), 0)),
+            date=str(data.get("date") or "").strip(),
+            weekday=str(data.get("weekday") or "").strip(),
+            title=str(data.get("title") or "").strip(),
+            rest=bool(data.get("rest")) or not exercises,
+            exercises=exercises,
+            notes=[str(n).strip() for n in data.get("notes") or [] if str(n).strip()],
+        )
+
+    def render(self) -> str:
+        title = "ВОССТАНОВЛЕНИЕ" if self.rest else (self.title.upper() or "ТРЕНИРОВКА")
+        date = f"{_e(self.date)}, " if self.date else ""
+        lines = [f"📅 <b>{date}День {self.number} ({_e(self.weekday)}) — {_e(title)}</b>", ""]
+        for i, ex in enumerate(self.exercises, 1):
+            lines.append(f"<b>{i}.</b> <code>{_e(ex.name)}</code>")
+            lines.append(f"<i>{ex.sets} х {_e(ex.reps)} (Отдых {ex.rest_sec} сек)</i>")
+            if ex.tip:
+                lines.append(f"Техника: {_e(ex.tip)}")
+            lines.append("")
+        lines.extend(f"• {_e(note)}" for note in self.notes)
+        return "\n".join(lines).strip()
+
+
+@dataclass
+class WorkoutProgram:
+    days: list[WorkoutDay] = field(default_factory=list)
+    tips: list[str] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WorkoutProgram":
+        days = [WorkoutDay.from_dict(d) for d in data.get("days") or []]
+        if not days:
+            raise ProgramParseError("В программе нет дней")
+        return cls(days=days, tips=[str(t).strip() for t in data.get("tips") or [] if str(t).strip()])
+
+    @classmethod
+    def from_json(cls, text: str) -> "WorkoutProgram":
+        return cls.from_dict(json.loads(text))
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    def render_tips(self) -> str:
+        lines = ["💡 <b>Советы тренера</b>", ""]
+        lines.extend(f"{i}. {_e(tip)}" for i, tip in enumerate(self.tips, 1))
+        return "\n".join(lines)
+
+    def pages(self) -> list[str]:
+        pages = [day.render() for day in self.days]
+        if self.tips:
+            pages.append(self.render_tips())
+        return pages
+
+    def rest_pages(self) -> list[int]:
+        """Индексы страниц-дней отдыха"""
+        return [i for i, day in enumerate(self.days) if day.rest]
+
+    def layout(self) -> dict:
+        """Разметка страниц для листалки: сколько страниц-дней и какие из них отдых (дальше — советы)"""
+        return {"days": len(self.days), "rest": self.rest_pages()}
+
+
+# --- ПИТАНИЕ ---
+MEAL_ICONS = {"завтрак": "🍳", "обед": "🍲", "ужин": "🥗", "перекус": "🥪"}
+
+
+@dataclass
+class MealVariant:
+    name: str
+    ingredients: list[str] = field(default_factory=list)
+    calories: float = 0.0
+    protein: float = 0.0
+    fat: float = 0.0
+    carbs: float = 0.0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MealVariant":
+        name = str(data.get("name") or "").strip()
+        if not name:
+            raise ProgramParseError("Вариант без названия")
+        return cls(
+            name=name,
+            ingredients=[str(i).strip() for i in data.get("ingredients") or [] if str(i).strip()],
+            calories=_num(data.get("calories")),
+            protein=_num(data.get("protein")),
+            fat=_num(data.get("fat")),
+            carbs=_num(data.get("carbs")),
+        )
+
+    def render(self, number: int) -> str:
+        lines = [f"Вариант {number}: <b>{_e(self.name)}</b>"]
+        lines.extend(f"- {_e(i)}" for i in self.ingredients)
+        lines.append(
+            f"- <b>КБЖУ: ~{_fmt(self.calories)} ккал "
+            f"(Б: {_fmt(self.protein)}г, Ж: {_fmt(self.fat)}г, У: {_fmt(self.carbs)}г)</b>"
+        )
+        return "\n".join(lines)
+
+
+@dataclass
+class Meal:
+    name: str
+    variants: list[MealVariant] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Meal":
+        variants = [MealVariant.from_dict(v) for v in data.get("variants") or []]
+        if not variants:
+            raise ProgramParseError(f"Прием пищи без вариантов: {data.get('name')}")
+        return cls(name=str(data.get("name") or "Прием пищи").strip(), variants=variants)
+
+
+@dataclass
+class NutritionProgram:
+    calories: float = 0.0
+    protein: list[float] = field(default_factory=lambda: [0.0, 0.0])
+    fat: list[float] = field(default_factory=lambda: [0.0, 0.0])
+    carbs: list[float] = field(default_factory=lambda: [0.0, 0.0])
+    meals: list[Meal] = field(default_factory=list)
+    shopping_list: dict[str, list[str]] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NutritionProgram":
+        meals = [Meal.from_dict(m) for m in data.get("meals") or []]
+        if not meals:
+            raise ProgramParseError("В меню нет приемов пищи")
+        shopping = data.get("shopping_list") or {}
+        if isinstance(shopping, list):
+            shopping = {"Продукты": shopping}
+        return cls(
+            calories=_num(data.get("calories")),
+            protein=_range(data.get("protein")),
+            fat=_range(data.get("fat")),
+            carbs=_range(data.get("carbs")),
+            meals=meals,
+            shopping_list={str(k): [str(i) for i in v] for k, v in shopping.items() if v},
+        )
+
+    @classmethod
+    def from_json(cls, text: str) -> "NutritionProgram":
+        return cls.from_dict(json.loads(text))
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    def targets(self) -> dict:
+        """Дневные цели для профиля: середина диапазонов (160-180 -> 170)"""
+        return {
+            "target_calories": int(self.calories),
+            "target_protein": int(sum(self.protein) / 2),
+            "target_fat": int(sum(self.fat) / 2),
+            "target_carbs": int(sum(self.carbs) / 2),
+        }
+
+    def header(self) -> str:
+        ranges = ", ".join(
+            f"{letter}: {_fmt(r[0])}-{_fmt(r[1])}"
+            for letter, r in (("Б", self.protein), ("Ж", self.fat), ("У", self.carbs))
+        )
+        return f"<b>Твой КБЖУ ~{_fmt(self.calories)} ккал ({ranges})</b>"
+
+    def render_meal(self, meal: Meal) -> str:
+        icon = next((i for key, i in MEAL_ICONS.items() if key in meal.name.lower()), "🍽")
+        blocks = [self.header(), f"{icon} <b>{_e(meal.name)}</b>"]
+        blocks.extend(v.render(n) for n, v in enumerate(meal.variants, 1))
+        return "\n\n".join(blocks)
+
+    def render_shopping_list(self) -> str:
+        blocks = ["🛒 <b>Список покупок:</b>"]
+        for group, items in self.shopping_list.items():
+            blocks.append(f"<b>{_e(group)}</b>\n" + "\n".join(f"- {_e(i)}" for i in items))
+        return "\n\n".join(blocks)
+
+    def pages(self) -> list[str]:
+        pages = [self.render_meal(meal) for meal in self.meals]
+        if self.shopping_list:
+            pages.append(self.render_shopping_list())
+        return pages
+
+
+# --- СХЕМЫ ДЛЯ ПРОМПТОВ ---
+WORKOUT_JSON_SPEC = """
+        ФОРМАТ ОТВЕТА: строго один JSON-объект (json), без текста вокруг. Ключ "days" идет ПЕРВЫМ:
+        {"days": [
+          {"number": 1, "date": "ДД.ММ", "weekday": "Понедельник", "title": "Верх тела", "rest": false,
+           "exercises": [{"name": "Жим штанги лежа", "sets": 4, "reps": "8-10", "rest_sec": 90, "tip": "Короткий совет по технике"}],
+           "notes": []},
+          {"number": 2, "date": "ДД.ММ", "weekday": "Вторник", "title": "Восстановление", "rest": true,
+           "exercises": [], "notes": ["1-2 совета по активности"]}
+        ],
+        "tips": ["3-4 совета тренера"]}
+        Ровно 7 элементов в "days" (по одному на каждый день, начиная с сегодня). Без HTML и Markdown внутри строк.
+        """
+
+NUTRITION_JSON_SPEC = """
+        ФОРМАТ ОТВЕТА: строго один JSON-объект (json), без текста вокруг:
+        {"calories": 2200, "protein": [150, 170], "fat": [60, 75], "carbs": [220, 260],
+         "meals": [
+           {"name": "Завтрак", "variants": [
+             {"name": "Название блюда", "ingredients": ["Продукт 80 г", "Продукт 150 г"],
+              "calories": 450, "protein": 30, "fat": 12, "carbs": 55}
+           ]}
+         ],
+         "shopping_list": {"Белки": ["..."], "Жиры": ["..."], "Углеводы": ["..."]}}
+        В "meals" четыре приема пищи: Завтрак, Обед, Ужин, Перекусы — в каждом по 3 варианта.
+        Все числа — числами, без единиц измерения. Без HTML и Markdown внутри строк.
+        """
+
+
+class JsonObjectStream:
+    """
+    Разбирает JSON-ответ по мере стрима: как только в потоке закрылся очередной объект
+    второго уровня (день в "days"), отдает его, не дожидаясь конца всего ответа.
+    """
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None
+
+    def feed(self, delta: str) -> list[dict]:
+        self.text += delta
+        ready = []
+        while self._pos < len(self.text):
+            ch = self.text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+                if self._depth == 2:
+                    self._start = self._pos
+            elif ch == "}":
+                if self._depth == 2 and self._start is not None:
+                    try:
+                        ready.append(json.loads(self.text[self._start:self._pos + 1]))
+                    except ValueError as e:
+                        logger.warning(f"Не удалось разобрать объект из стрима: {e}")
+                    self._start = None
+                self._depth -= 1
+            self._pos += 1
+        return ready
+
+    def result(self) -> dict:
+        """Весь ответ целиком (вызывать после конца стрима)"""
+        return parse_json_reply(self.text)
+
+
+def parse_json_reply(text: str) -> dict:
+    """JSON из ответа модели (иногда она все же оборачивает его в ```json ... ```)"""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end == -1:
+        raise ProgramParseError("В ответе нет JSON")
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError as e:
+        raise ProgramParseError(f"Битый JSON: {e}") from e
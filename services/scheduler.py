@@ -3,13 +3,15 @@ import datetime
 import pytz
 import random
 import asyncio
+import time
 from aiogram import Bot
 from sqlalchemy import update, select, func, desc
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from database.models import User, WorkoutLog, NutritionLog
-from database.crud import UserCRUD
+from database.crud import UserCRUD, ContentPoolCRUD
 from services.ai_manager import AIManager
+from config import Config
 
 logger = logging.getLogger(__name__)
 
@@ -21,11 +23,121 @@ SUBSCRIPTION_LIMITS = {
     "ultra": (50, 100)   
 }
 
+MOTIVATIONS = [
+    "Твое тело — это отражение твоих привычек. Начни день правильно! 💪",
+    "Маленькие шаги каждый день ведут к большим результатам. Не останавливайся! 🚀",
+    "Единственная плохая тренировка — та, которой не было. Вперед! 🏋️‍♂️",
+    "Дисциплина — это мост между целями и достижениями. Построй свой мост сегодня! 🌉",
+    "Ты сильнее, чем думаешь. Докажи это себе сегодня! 💥",
+    "Не жди идеального момента, создай его! Время действовать. 🔥",
+    "Капля пота сегодня — это океан гордости завтра. 🌊",
+    "Победи свою лень, и ты победишь всё! 🏆",
+    "Боль временна, триумф вечен. Выложись сегодня на полную! ⚡️",
+    "Твой единственный соперник — это ты вчерашний. Стань лучше! 🥇",
+    "Либо ты управляешь своим днем, либо день управляет тобой. Решай! 😤",
+    "Успех начинается за чертой твоего комфорта. Выходи и делай! 🚪",
+    "Тебе не нужно быть великим, чтобы начать. Тебе нужно начать, чтобы стать великим! ✨",
+    "Оправдания калории не жгут. Просто иди и работай! ⏳",
+    "Мотивация дает толчок, но только привычка заставляет двигаться дальше. ⚙️",
+    "Твой завтрашний успех зависит от того, что ты сделаешь сегодня. 🗓",
+    "Не рассказывай о своих целях — покажи свои результаты! 🤫",
+    "Твое тело может всё, если ты убедишь свой разум. 🧠",
+    "Прогресс — это не прямая линия. Главное — не останавливаться! 📈",
+    "Слабость — это просто выбор. Выбери быть сильным! 🔥",
+    "Сделай сегодня то, за что завтра скажешь себе 'спасибо'. 🙏",
+    "Твое здоровье — это инвестиция, а не расход. Вкладывай в себя! 💎",
+    "Через месяц ты поблагодаришь себя за то, что не сдался сегодня. 🦾"
+]
+
+# Сколько текстов из пула забирать на один час рассылки Free/Lite (между ними выбираем случайно).
+# Рассылка идет каждый час, так что за сутки уходит до 24 * POOL_TEXTS_PER_TICK текстов — под это и пополняем пул
+POOL_TEXTS_PER_TICK = 2
+POOL_DAILY_USE = 24 * POOL_TEXTS_PER_TICK
+
+MOTIVATION_HEADERS = {
+    "standard": "⚡️ <b>Тренер на связи:</b>",
+    "ultra": "👑 <b>Ultra Аналитика:</b>",
+}
+
+
+def _workout_info(last_date, today) -> str:
+    if not last_date:
+        return "Пока не записывал тренировки"
+    days_ago = (today - last_date.date()).days
+    if days_ago == 0:
+        return "Тренировался СЕГОДНЯ"
+    if days_ago == 1:
+        return "Тренировался ВЧЕРА"
+    return f"Не тренировался уже {days_ago} дней"
+
+
+async def _collect_pro_contexts(session, users: list, today) -> list[dict]:
+    """Данные для персональной мотивации: два групповых запроса вместо пары запросов на каждого клиента"""
+    ids = [u.telegram_id for u in users]
+
+    res_w = await session.execute(
+        select(WorkoutLog.user_id, func.max(WorkoutLog.date)).where(WorkoutLog.user_id.in_(ids)).group_by(WorkoutLog.user_id)
+    )
+    last_workouts = dict(res_w.all())
+
+    res_n = await session.execute(
+        select(
+            NutritionLog.user_id,
+            func.sum(NutritionLog.calories).label("kcal"),
+            func.sum(NutritionLog.protein).label("p")
+        ).where(NutritionLog.user_id.in_(ids), func.date(NutritionLog.date) == today).group_by(NutritionLog.user_id)
+    )
+    nutrition = {row.user_id: row for row in res_n.all()}
+
+    contexts = []
+    for idx, user in enumerate(users, start=1):
+        context = {
+            "id": idx,
+            "tier": user.subscription_level,
+            "goal": user.goal,
+            "workout": _workout_info(last_workouts.get(user.telegram_id), today),
+        }
+        if user.subscription_level == "ultra":
+            nut = nutrition.get(user.telegram_id)
+            kcal = int(nut.kcal or 0) if nut else 0
+            protein = int(nut.p or 0) if nut else 0
+            # Если данных о еде нет, даем ИИ свободу выбора темы
+            context["nutrition"] = (
+                f"По питанию сегодня: {kcal} ккал, {protein}г белка." if kcal > 0
+                else "Данных по еде сегодня еще нет."
+            )
+        contexts.append(context)
+    return contexts
+
+
+async def _generate_motivations(manager: AIManager, contexts: list[dict], batch_size: int) -> dict:
+    """Пакеты уходят параллельно (их пропускает общая очередь AI). Неразобранный пакет делится пополам."""
+    async def run(batch: list[dict]) -> dict:
+        try:
+            return await manager.generate_motivation_batch(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.warning(f"Мотивация для клиента #{batch[0]['id']} не сгенерировалась: {e}")
+                return {}
+            mid = len(batch) // 2
+            logger.warning(f"Пакет мотиваций из {len(batch)} не разобрался ({e}), делю пополам")
+            left, right = await asyncio.gather(run(batch[:mid]), run(batch[mid:]))
+            return {**left, **right}
+
+    batches = [contexts[i:i + batch_size] for i in range(0, len(contexts), batch_size)]
+    results = await asyncio.gather(*(run(b) for b in batches))
+    texts = {}
+    for result in results:
+        texts.update(result)
+    return texts
+
+
 async def send_morning_motivation(bot: Bot, session_pool: async_sessionmaker):
     """
     Запускается каждый час.
     Выбирает пользователей, у которых notification_time совпадает с текущим часом.
-    Индивидуальные сообщения для Premium тарифов.
+    Индивидуальные сообщения для Premium тарифов: генерируются пакетами (один запрос на
+    MOTIVATION_BATCH_SIZE клиентов), кому не досталось — запасной текст из MOTIVATIONS.
     """
     msk_tz = pytz.timezone("Europe/Moscow")
     now_msk = datetime.datetime.now(msk_tz)
@@ -40,110 +152,38 @@ async def send_morning_motivation(bot: Bot, session_pool: async_sessionmaker):
         if not users:
             return
 
-        motivations = [
-            "Твое тело — это отражение твоих привычек. Начни день правильно! 💪",
-            "Маленькие шаги каждый день ведут к большим результатам. Не останавливайся! 🚀",
-            "Единственная плохая тренировка — та, которой не было. Вперед! 🏋️‍♂️",
-            "Дисциплина — это мост между целями и достижениями. Построй свой мост сегодня! 🌉",
-            "Ты сильнее, чем думаешь. Докажи это себе сегодня! 💥",
-            "Не жди идеального момента, создай его! Время действовать. 🔥",
-            "Капля пота сегодня — это океан гордости завтра. 🌊",
-            "Победи свою лень, и ты победишь всё! 🏆"
-            "Боль временна, триумф вечен. Выложись сегодня на полную! ⚡️",
-            "Твой единственный соперник — это ты вчерашний. Стань лучше! 🥇",
-            "Либо ты управляешь своим днем, либо день управляет тобой. Решай! 😤",
-            "Успех начинается за чертой твоего комфорта. Выходи и делай! 🚪",
-            "Тебе не нужно быть великим, чтобы начать. Тебе нужно начать, чтобы стать великим! ✨",
-            "Оправдания калории не жгут. Просто иди и работай! ⏳",
-            "Мотивация дает толчок, но только привычка заставляет двигаться дальше. ⚙️",
-            "Твой завтрашний успех зависит от того, что ты сделаешь сегодня. 🗓",
-            "Не рассказывай о своих целях — покажи свои результаты! 🤫",
-            "Твое тело может всё, если ты убедишь свой разум. 🧠",
-            "Прогресс — это не прямая линия. Главное — не останавливаться! 📈",
-            "Слабость — это просто выбор. Выбери быть сильным! 🔥",
-            "Сделай сегодня то, за что завтра скажешь себе 'спасибо'. 🙏",
-            "Твое здоровье — это инвестиция, а не расход. Вкладывай в себя! 💎",
-            "Через месяц ты поблагодаришь себя за то, что не сдался сегодня. 🦾"
-        ]
-
-        manager = AIManager()
+        pro_users = [u for u in users if (u.subscription_level or "free") in MOTIVATION_HEADERS]
+        texts = {}
+        if pro_users:
+            contexts = await _collect_pro_contexts(session, pro_users, today)
+            started = time.perf_counter()
+            texts = await _generate_motivations(AIManager(tier="background"), contexts, Config.MOTIVATION_BATCH_SIZE)
+            logger.info(
+                f"🧠 Мотивация: {len(texts)}/{len(pro_users)} персональных текстов "
+                f"за {time.perf_counter() - started:.1f}с (пакеты по {Config.MOTIVATION_BATCH_SIZE})"
+            )
+        pro_ids = {u.telegram_id: idx for idx, u in enumerate(pro_users, start=1)}
+
+        # Free/Lite: свежие тексты из ночного пула (несколько на весь час), если пул пуст — статичный список
+        free_count = len(users) - len(pro_users)
+        pool_texts = await ContentPoolCRUD.take(session, "motivation", min(free_count, POOL_TEXTS_PER_TICK)) if free_count else []
 
         for user in users:
             try:
-                sub_level = user.subscription_level or "free"
-                
                 # --- ЛОГИКА ДЛЯ FREE И LITE (Оставляем как было) ---
-                if sub_level in ["free", "lite"]:
-                    text = random.choice(motivations)
+                if user.telegram_id not in pro_ids:
+                    text = random.choice(pool_texts or MOTIVATIONS)
                     await bot.send_message(user.telegram_id, f"🌅 <b>Тренер напоминает:</b>\n\n{text}", parse_mode="HTML")
                     continue
-                
-                # --- ПОДГОТОВКА БАЗОВЫХ ДАННЫХ ДЛЯ PRO (Тренировки) ---
-                stmt_w = select(WorkoutLog).where(WorkoutLog.user_id == user.telegram_id).order_by(desc(WorkoutLog.date)).limit(1)
-                res_w = await session.execute(stmt_w)
-                last_workout = res_w.scalar_one_or_none()
-                
-                if last_workout:
-                    days_ago = (today - last_workout.date.date()).days
-                    if days_ago == 0:
-                        workout_info = "Тренировался СЕГОДНЯ"
-                    elif days_ago == 1:
-                        workout_info = "Тренировался ВЧЕРА"
-                    else:
-                        workout_info = f"Не тренировался уже {days_ago} дней"
-                else:
-                    workout_info = "Пока не записывал тренировки"
-
-                # --- ЛОГИКА ДЛЯ STANDARD (Учитывает тренировки) ---
-                if sub_level == "standard":
-                    prompt = (
-                        f"Ты фитнес-тренер. У клиента тариф Standard (Цель: {user.goal}). "
-                        f"Его активность: {workout_info}. "
-                        f"Напиши ОЧЕНЬ КОРОТКОЕ (максимум 150 символов) мотивирующее напоминание на сегодня. "
-                        f"Без приветствий, сразу по делу, дружелюбно."
-                    )
-                    ai_text = await manager.get_chat_response([{"role": "user", "content": prompt}], {})
-                    
-                    await bot.send_message(user.telegram_id, f"⚡️ <b>Тренер на связи:</b>\n\n{ai_text}", parse_mode="HTML")
-
-                # --- ЛОГИКА ДЛЯ ULTRA (Учитывает Тренировки + Питание + Общие советы) ---
-                elif sub_level == "ultra":
-                    stmt_n = select(
-                        func.sum(NutritionLog.calories).label("kcal"),
-                        func.sum(NutritionLog.protein).label("p")
-                    ).where(NutritionLog.user_id == user.telegram_id, func.date(NutritionLog.date) == today)
-                    
-                    res_n = await session.execute(stmt_n)
-                    nut_data = res_n.first()
-                    
-                    kcal = int(nut_data.kcal or 0)
-                    protein = int(nut_data.p or 0)
-                    
-                    # Если данных о еде нет, даем ИИ свободу выбора темы
-                    if kcal > 0:
-                        nut_info = f"По питанию сегодня: {kcal} ккал, {protein}г белка."
-                    else:
-                        nut_info = "Данных по еде сегодня еще нет. Можешь дать совет по восстановлению, сну или мотивации."
-
-                    prompt = (
-                        f"Ты элитный фитнес-коуч уровня Ultra. Клиент (Цель: {user.goal}). "
-                        f"Статус тренировок: {workout_info}. {nut_info} "
-                        f"ЗАДАЧА: Напиши ОЧЕНЬ КОРОТКИЙ (до 180 симв.) персональный инсайт. "
-                        f"Если данных мало — дай совет по биохакингу, режиму или психологии успеха. "
-                        f"Без приветствий. Будь максимально разнообразным, не зацикливайся на одном питании!"
-                    )
-                    ai_text = await manager.get_chat_response([{"role": "user", "content": prompt}], {})
-                    
-                    await bot.send_message(user.telegram_id, f"👑 <b>Ultra Аналитика:</b>\n\n{ai_text}", parse_mode="HTML")
 
+                ai_text = texts.get(pro_ids[user.telegram_id])
+                if ai_text:
+                    await bot.send_message(user.telegram_id, f"{MOTIVATION_HEADERS[user.subscription_level]}\n\n{ai_text}", parse_mode="HTML")
+                else:
+                    # Fallback: ИИ не ответил для этого клиента — обычная мотивация
+                    await bot.send_message(user.telegram_id, f"⚡️ <b>Тренер на связи:</b>\n\n{random.choice(MOTIVATIONS)}", parse_mode="HTML")
             except Exception as e:
-                logger.error(f"Ошибка ИИ-уведомления для {user.telegram_id}: {e}")
-                # Fallback: Если ИИ отвалился, отправляем обычную мотивацию
-                fallback_text = random.choice(motivations)
-                try:
-                    await bot.send_message(user.telegram_id, f"⚡️ <b>Тренер на связи:</b>\n\n{fallback_text}", parse_mode="HTML")
-                except:
-                    pass
+                logger.error(f"Ошибка отправки уведомления для {user.telegram_id}: {e}")
 
 async def reset_daily_limits(session_pool: async_sessionmaker):
     """
@@ -182,47 +222,72 @@ async def reset_daily_limits(session_pool: async_sessionmaker):
             logger.error(f"❌ Ошибка при сбросе лимитов: {e}")
 
 
-async def auto_post_to_channel(bot: Bot):
-    """Генерирует и отправляет пост в маркетинговый канал"""
-    manager = AIManager()
-    channel_id = "@TrAIner_Life" # Наш крутой канал
-    
-    logger.info("📢 Запуск генерации автоматического поста в канал...")
-    
-    try:
-        post_text = await manager.generate_marketing_post()
-        await bot.send_message(chat_id=channel_id, text=post_text, parse_mode="HTML")
-        logger.info("✅ Рекламный пост успешно опубликован в @TrAIner_Life!")
-    except Exception as e:
-        logger.error(f"❌ Ошибка автопостинга в канал: {e}")       
-
-# В конец файла services/scheduler.py
-
-async def auto_post_to_channel(bot: Bot):
-    """Генерирует и отправляет пост с элементами случайности"""
-    
+async def auto_post_to_channel(bot: Bot, session_pool: async_sessionmaker):
+    """
+    Публикует пост в канал с элементами случайности.
+    Время внутри часа размывает jitter планировщика (см. setup_scheduler), текст берется из ночного пула.
+    """
     # 1. Вероятность публикации (30%)
     if random.random() > 0.3: 
         logger.info("🎲 Рандом решил не постить в этом часу.")
         return
 
-    # 2. Случайная задержка от 1 до 50 минут.
-    wait_time = random.randint(1, 50)
-    logger.info(f"⏳ Рандом выбран! Пост выйдет через {wait_time} минут.")
-    await asyncio.sleep(wait_time * 60)
-
-    # 3. Сама генерация и отправка
-    manager = AIManager()
     channel_id = "@TrAIner_Life"
-    bot_username = "@TrAInerFitnessBot"
 
     try:
-        post_text = await manager.generate_marketing_post()
+        # 2. Готовый пост из пула; если пул пуст — генерируем на лету
+        async with session_pool() as session:
+            posts = await ContentPoolCRUD.take(session, "marketing_post")
+        source = "из пула"
+        if posts:
+            post_text = posts[0]
+        else:
+            source = "на лету"
+            post_text = await AIManager(tier="background").generate_marketing_post()
+
         await bot.send_message(chat_id=channel_id, text=post_text, parse_mode="HTML")
-        logger.info(f"✅ Автопост опубликован в @TrAIner_Life!")
+        logger.info(f"✅ Автопост ({source}) опубликован в @TrAIner_Life!")
     except Exception as e:
         logger.error(f"❌ Ошибка автопостинга: {e}")
 
+
+async def refill_content_pool(session_pool: async_sessionmaker):
+    """
+    Ночное пополнение пула: посты для канала и общие мотивашки для Free/Lite.
+    Просроченные тексты удаляются, повторы (за CONTENT_DEDUP_DAYS) отбрасываются.
+    """
+    manager = AIManager(tier="background")
+    started = time.perf_counter()
+
+    async with session_pool() as session:
+        purged = await ContentPoolCRUD.purge(session, Config.CONTENT_DEDUP_DAYS)
+
+        # 1. Мотивация: пачками по 20, пока не наберем запас хотя бы на сутки рассылок (не больше 5 попыток)
+        added_motivations = 0
+        target = max(Config.CONTENT_POOL_MOTIVATIONS, POOL_DAILY_USE)
+        missing = target - await ContentPoolCRUD.count_available(session, "motivation")
+        for _ in range(5):
+            if missing <= 0:
+                break
+            texts = await manager.generate_motivation_pool(min(missing, 20))
+            if not texts:
+                break
+            added = await ContentPoolCRUD.add_items(session, "motivation", texts, Config.CONTENT_TTL_DAYS, Config.CONTENT_DEDUP_DAYS)
+            added_motivations += added
+            missing -= added
+
+        # 2. Посты в канал: недостающие генерируем параллельно
+        missing_posts = Config.CONTENT_POOL_POSTS - await ContentPoolCRUD.count_available(session, "marketing_post")
+        posts = await asyncio.gather(*(manager.generate_marketing_post(fallback=False) for _ in range(max(0, missing_posts))))
+        added_posts = await ContentPoolCRUD.add_items(
+            session, "marketing_post", [p for p in posts if p], Config.CONTENT_TTL_DAYS, Config.CONTENT_DEDUP_DAYS
+        )
+
+    logger.info(
+        f"🗄 Пул контента: +{added_motivations} мотиваций, +{added_posts} постов, "
+        f"удалено {purged} старых ({time.perf_counter() - started:.0f}с)"
+    )
+
 def setup_scheduler(scheduler, bot, session_pool):
     """
     Регистрирует все фоновые задачи бота.
@@ -244,13 +309,23 @@ def setup_scheduler(scheduler, bot, session_pool):
         kwargs={'bot': bot, 'session_pool': session_pool}
     )
     
-    # 3. Наш умный автопостинг в канал (каждый час с рандомом внутри)
+    # 3. Наш умный автопостинг в канал (каждый час, время внутри часа случайное через jitter)
     scheduler.add_job(
         auto_post_to_channel,
         trigger='cron',
         hour='9-21', 
         minute=0,
-        kwargs={'bot': bot}
+        jitter=50 * 60,
+        kwargs={'bot': bot, 'session_pool': session_pool}
+    )
+
+    # 4. Ночное пополнение пула готового контента
+    scheduler.add_job(
+        refill_content_pool,
+        trigger='cron',
+        hour=Config.CONTENT_POOL_HOURS,
+        minute=30,
+        kwargs={'session_pool': session_pool}
     )
     
     logger.info("📅 Все задачи планировщика успешно зарегистрированы!")             
\ No newline at end of file
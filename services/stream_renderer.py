@@ -0,0 +1,111 @@
+import time
+import asyncio
+import logging
+from aiogram.types import Message
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram режет сообщения длиннее 4096 символов, оставляем запас под курсор
+MAX_MESSAGE_LEN = 4000
+# Сколько раз повторить финальную правку после flood control, прежде чем слать текст новым сообщением
+FINAL_EDIT_RETRIES = 1
+
+
+class StreamRenderer:
+    """
+    Показывает ответ ИИ по мере генерации, редактируя одно сообщение.
+    Правки идут не чаще раза в min_interval секунд (лимиты Telegram на edit_message),
+    длинный ответ автоматически продолжается в новом сообщении.
+    """
+    def __init__(self, message: Message, min_interval: float = 1.2, min_chars: int = 30, cursor: str = " ▌"):
+        self.message = message
+        self.min_interval = min_interval
+        self.min_chars = min_chars
+        self.cursor = cursor
+
+        self.full_text = ""
+        self._sent_len = 0          # Сколько символов текущего сообщения уже показано
+        self._offset = 0            # С какого символа full_text начинается текущее сообщение
+        self._last_edit = 0.0
+
+    @property
+    def _current_part(self) -> str:
+        return self.full_text[self._offset:]
+
+    async def _edit(self, text: str, parse_mode: str | None = None, retries: int = 0) -> bool:
+        """retries > 0 — правка обязательна (финальный текст): ждем flood control и пробуем снова"""
+        for attempt in range(retries + 1):
+            try:
+                await self.message.edit_text(text, parse_mode=parse_mode)
+                return True
+            except TelegramRetryAfter as e:
+                logger.warning(f"Стрим: flood control, ждем {e.retry_after}с")
+                self._last_edit = time.monotonic() + e.retry_after
+                if attempt == retries:
+                    # Промежуточную правку просто пропускаем, следующая догонит текст
+                    return False
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                if "not modified" in str(e).lower():
+                    return True
+                raise
+        return False
+
+    async def _roll_over(self):
+        """Текущее сообщение заполнено: фиксируем его и продолжаем ответ в новом"""
+        part = self._current_part
+        cut = part.rfind("\n", 0, MAX_MESSAGE_LEN)
+        if cut < MAX_MESSAGE_LEN // 2:
+            cut = part.rfind(" ", 0, MAX_MESSAGE_LEN)
+        if cut <= 0:
+            cut = MAX_MESSAGE_LEN
+
+        await self._finalize_message(part[:cut].rstrip())
+        self._offset += cut
+        self._sent_len = 0
+        self.message = await self.message.answer("…")
+        self._last_edit = time.monotonic()
+
+    async def _finalize_message(self, text: str):
+        if not text.strip():
+            text = "…"
+        parse_mode = "HTML"
+        try:
+            done = await self._edit(text, parse_mode=parse_mode, retries=FINAL_EDIT_RETRIES)
+        except TelegramBadRequest:
+            # HTML сломался (модель не закрыла тег) — показываем как обычный текст
+            parse_mode = None
+            done = await self._edit(text, retries=FINAL_EDIT_RETRIES)
+        if done:
+            return
+        # Правку так и не пустили — иначе пользователь останется с обрывком и курсором
+        logger.warning("Стрим: финальная правка не прошла, отправляем ответ новым сообщением")
+        try:
+            self.message = await self.message.answer(text, parse_mode=parse_mode)
+        except TelegramBadRequest:
+            self.message = await self.message.answer(text)
+
+    async def push(self, delta: str):
+        self.full_text += delta
+
+        if len(self._current_part) > MAX_MESSAGE_LEN:
+            await self._roll_over()
+            return
+
+        now = time.monotonic()
+        new_chars = len(self._current_part) - self._sent_len
+        if now - self._last_edit < self.min_interval or new_chars < self.min_chars:
+            return
+
+        # Промежуточные правки без разметки: недописанный HTML Telegram не примет
+        if await self._edit(self._current_part + self.cursor):
+            self._sent_len = len(self._current_part)
+        self._last_edit = max(self._last_edit, now)
+
+    async def render(self, chunks) -> str:
+        """Прогоняет асинхронный поток кусков текста и возвращает полный ответ"""
+        async for delta in chunks:
+            await self.push(delta)
+        await self._finalize_message(self._current_part)
+        return self.full_text
@@ -0,0 +1,534 @@
+import io
+import os
+import time
+import zlib
+import asyncio
+import logging
+import itertools
+import multiprocessing
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+# ==========================================
+# РАСПОЗНАВАНИЕ ГОЛОСА (ЛОКАЛЬНЫЙ WHISPER)
+# ==========================================
+# Раньше WhisperModel создавалась при импорте services/ai_manager.py: любой импорт хендлеров
+# (и скрипты, и alembic) ждал загрузки модели несколько секунд и занимал сотни МБ памяти.
+# Теперь модель грузится лениво: в фоне после старта бота (warm_up) или при первом голосовом.
+# Пока модель грузится, запросы на распознавание просто ждут ее готовности.
+# Голосовые стоят в общей очереди: WHISPER_WORKERS распознаются одновременно, еще до WHISPER_QUEUE_LIMIT ждут,
+# остальным сразу отвечаем "попробуй позже" (SpeechBusy), чтобы не копить минуты ожидания.
+
+WHISPER_PROMPT = "Жим лежа, присед, становая тяга, гантели, штанга, КБЖУ, спагетти, углеводы, калории, повторения."
+
+# beam_size выбирает choose_decode_plan
+DECODE_OPTIONS = dict(
+    language="ru",
+    initial_prompt=WHISPER_PROMPT,
+    vad_filter=True, # 🔥 Отрезаем тишину
+    vad_parameters=dict(min_silence_duration_ms=500),
+)
+
+BATCH_MAX_CLIP = 30.0  # Окно Whisper: в пакет берем голосовые не длиннее, сек
+# Пороги отсева галлюцинаций — те же, что faster-whisper применяет по умолчанию в обычном transcribe
+NO_SPEECH_THRESHOLD = 0.6
+LOG_PROB_THRESHOLD = -1.0
+COMPRESSION_RATIO_THRESHOLD = 2.4
+
+BUSY_TEXT = "⚠️ Сейчас очень много голосовых. Попробуй через минуту или напиши текстом."
+
+
+class SpeechBusy(Exception):
+    """Очередь на распознавание заполнена — голосовое не принято"""
+
+
+# ==========================================
+# ПАРАМЕТРЫ РАСПОЗНАВАНИЯ ПОД НАГРУЗКУ
+# ==========================================
+# Лучевой поиск (beam_size=5) точнее, но в 2-3 раза медленнее жадного (beam_size=1).
+# Когда очередь пуста, длинные голосовые распознаем с лучом. Короткие фразы ("жим 80 на 10")
+# жадный поиск распознает почти так же, а когда за голосовым ждут другие, важнее скорость:
+# жадный поиск и (если задана WHISPER_FAST_MODEL) модель поменьше. Сравнение — whisper_bench.py.
+
+@dataclass
+class DecodePlan:
+    policy: str      # full / short / busy
+    model: str
+    beam_size: int
+
+    def options(self) -> dict:
+        return {**DECODE_OPTIONS, "beam_size": self.beam_size}
+
+
+def choose_decode_plan(depth: int, duration: float | None) -> DecodePlan:
+    """depth — сколько голосовых ждут за этим, duration — длина аудио (None — неизвестна)"""
+    if depth >= Config.WHISPER_BUSY_DEPTH:
+        return DecodePlan("busy", Config.WHISPER_FAST_MODEL or Config.WHISPER_MODEL, 1)
+    if duration is not None and duration <= Config.WHISPER_SHORT_CLIP:
+        return DecodePlan("short", Config.WHISPER_MODEL, 1)
+    return DecodePlan("full", Config.WHISPER_MODEL, Config.WHISPER_BEAM_SIZE)
+
+
+# ==========================================
+# РАБОЧИЕ ПРОЦЕССЫ WHISPER
+# ==========================================
+# Распознавание идет в отдельных процессах: в процессе бота оно делило CPU и GIL с event loop,
+# и пока шло несколько голосовых, бот медленно отвечал всем остальным.
+# Функции ниже выполняются внутри рабочего процесса, модель у каждого процесса своя.
+
+_worker_models = {}   # имя модели -> WhisperModel (основная грузится сразу, быстрая — при первом запросе)
+_worker_main: str | None = None
+_worker_settings = {}
+_worker_error: str | None = None
+
+
+def _init_worker(name: str, device: str, compute_type: str, cpu_threads: int):
+    global _worker_main, _worker_error
+    _worker_main = name
+    _worker_settings.update(device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+    try:
+        _worker_model(name)
+    except Exception as e:
+        _worker_error = str(e)
+
+
+def _worker_model(name: str | None = None):
+    name = name or _worker_main
+    if name not in _worker_models:
+        from faster_whisper import WhisperModel
+        _worker_models[name] = WhisperModel(name, **_worker_settings)
+    return _worker_models[name]
+
+
+def _ping() -> int:
+    if _worker_main not in _worker_models:
+        raise RuntimeError(_worker_error or "модель не загружена")
+    return os.getpid()
+
+
+def _transcribe_audio(audio: str | bytes, options: dict, model_name: str | None = None) -> tuple[str, float, float]:
+    """
+    (текст, секунды распознавания, длина аудио). audio — путь к файлу или байты OGG/Opus:
+    байты декодируются в PCM 16 кГц прямо в памяти (PyAV внутри faster-whisper), без временного файла.
+    """
+    started = time.perf_counter()
+    model = _worker_model(model_name)
+    if isinstance(audio, bytes):
+        from faster_whisper import decode_audio
+        audio = decode_audio(io.BytesIO(audio), sampling_rate=model.feature_extractor.sampling_rate)
+    segments, info = model.transcribe(audio, **options)
+    text = "".join([segment.text for segment in segments]).strip()
+    return text, time.perf_counter() - started, info.duration
+
+
+def _transcribe_batch(audios: list[bytes], options: dict, model_name: str | None = None) -> tuple[list[tuple[str, float]], float]:
+    """
+    Несколько коротких голосовых (до 30 с) за один проход модели: mel-спектрограммы складываются в один
+    батч CTranslate2 (encode + generate). ([(текст, длина аудио)], секунды распознавания).
+    BatchedInferencePipeline из faster-whisper батчит куски одного файла, а нам нужны файлы разных людей.
+    Защита от галлюцинаций та же, что в обычном пути: тишину отсекает VAD (такие голосовые в батч не идут),
+    "нет речи" по no_speech_prob дает пустой текст, а неуверенный результат (низкий logprob или повторы)
+    распознается заново обычным transcribe — с его откатом по температуре.
+    """
+    import numpy as np
+    from faster_whisper import decode_audio
+    from faster_whisper.audio import pad_or_trim
+    from faster_whisper.tokenizer import Tokenizer
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    started = time.perf_counter()
+    model = _worker_model(model_name)
+    rate = model.feature_extractor.sampling_rate
+    arrays = [decode_audio(io.BytesIO(a), sampling_rate=rate) for a in audios]
+    texts = [""] * len(arrays)
+
+    speech = list(range(len(arrays)))
+    if options.get("vad_filter"):
+        vad = VadOptions(**options.get("vad_parameters", {}))
+        speech = [i for i in speech if get_speech_timestamps(arrays[i], vad)]
+
+    if speech:
+        features = np.stack([pad_or_trim(model.feature_extractor(arrays[i])) for i in speech])
+        tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=options["language"])
+        prompt = model.get_prompt(
+            tokenizer, previous_tokens=tokenizer.encode(" " + options["initial_prompt"].strip()), without_timestamps=True
+        )
+        results = model.model.generate(
+            model.encode(features), [prompt] * len(speech),
+            beam_size=options["beam_size"], max_length=model.max_length, suppress_blank=True,
+            return_scores=True, return_no_speech_prob=True,
+        )
+        for i, r in zip(speech, results):
+            text = tokenizer.decode(r.sequences_ids[0]).strip()
+            score = r.scores[0] if r.scores else 0.0  # Средний logprob токена (length_penalty=1)
+            if r.no_speech_prob > NO_SPEECH_THRESHOLD and score < LOG_PROB_THRESHOLD:
+                continue  # Шум без речи
+            if score < LOG_PROB_THRESHOLD or _compression_ratio(text) > COMPRESSION_RATIO_THRESHOLD:
+                segments, _ = model.transcribe(arrays[i], **options)
+                text = "".join(segment.text for segment in segments).strip()
+            texts[i] = text
+    return [(text, len(a) / rate) for text, a in zip(texts, arrays)], time.perf_counter() - started
+
+
+def _compression_ratio(text: str) -> float:
+    """Зацикленный текст ("жим жим жим...") сжимается сильно лучше обычной речи"""
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+
+def voice_queue_notifier(status_msg, text: str = "🎧 <i>Слушаю...</i>"):
+    """Колбэк для очереди распознавания: показывает место голосового в очереди"""
+    async def notify(position: int):
+        await status_msg.edit_text(
+            f"{text}\n\n🚦 <i>Голосовых сейчас много, твое в очереди {position}-м...</i>",
+            parse_mode="HTML"
+        )
+    return notify
+
+
+class SpeechRecognizer:
+    def __init__(self):
+        self.pool: ProcessPoolExecutor | None = None
+        self.state = "idle"       # idle -> loading -> ready | failed
+        self.error: str | None = None
+        self.load_seconds: float | None = None
+        self._load_task: asyncio.Task | None = None
+        self._failed_at = 0.0
+
+        # --- ОЧЕРЕДЬ: не больше WHISPER_WORKERS задач в процессах, остальные ждут (FIFO) ---
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._batchable: dict[asyncio.Future, tuple] = {}  # ждущие голосовые, которые можно взять в пакет
+
+        # --- МЕТРИКИ ---
+        self.jobs = 0
+        self.errors = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_depth = 0
+        self._waits = deque(maxlen=200)
+        self._runs = deque(maxlen=200)     # секунды распознавания
+        self._audio = deque(maxlen=200)    # длина аудио, сек
+        self.batches = 0
+        self.batched_clips = 0
+        self.plans = {}                    # full / short / busy -> сколько раз выбрано
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for w in self._waiters if not w.done())
+
+    async def _load(self):
+        started = time.perf_counter()
+        workers = max(1, Config.WHISPER_WORKERS)
+        # spawn, а не fork: копировать процесс бота с event loop и открытыми соединениями нельзя
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(Config.WHISPER_MODEL, Config.WHISPER_DEVICE, Config.WHISPER_COMPUTE_TYPE, Config.WHISPER_CPU_THREADS),
+        )
+        try:
+            loop = asyncio.get_running_loop()
+            # Каждый процесс при запуске грузит модель; ждем, пока все будут готовы
+            await asyncio.gather(*(loop.run_in_executor(self.pool, _ping) for _ in range(workers)))
+            self.state = "ready"
+            self.error = None
+            self.load_seconds = time.perf_counter() - started
+            logger.info(
+                f"🎙 Whisper '{Config.WHISPER_MODEL}' загружен за {self.load_seconds:.1f}с "
+                f"({workers} проц. x {Config.WHISPER_CPU_THREADS} потоков)"
+            )
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            self._failed_at = time.monotonic()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+            logger.error(f"Не удалось загрузить Whisper: {e}")
+
+    def warm_up(self) -> asyncio.Task:
+        """Запускает процессы и загрузку модели в фоне (без ожидания). Повторный вызов возвращает ту же задачу."""
+        if self.state == "failed" and time.monotonic() - self._failed_at >= Config.WHISPER_RETRY_SECONDS:
+            # Модель не загрузилась (нет памяти, сеть при скачивании) — после паузы пробуем снова
+            logger.info("🎙 Повторная загрузка Whisper после ошибки")
+            self._load_task = None
+        if self._load_task is None:
+            self.state = "loading"
+            self._load_task = asyncio.create_task(self._load())
+        return self._load_task
+
+    async def ensure_ready(self) -> bool:
+        """Ждет готовности процессов. False — загрузить модель не удалось."""
+        if self.state != "ready":
+            await asyncio.shield(self.warm_up())
+        return self.ready
+
+    def _reset(self, reason: str):
+        """Процесс упал (например, кончилась память) — следующее голосовое поднимет пул заново"""
+        logger.error(f"🎙 Пул Whisper сломан: {reason}")
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = None
+        self.state = "idle"
+        self._load_task = None
+
+    async def shutdown(self):
+        if self._load_task and not self._load_task.done():
+            self._load_task.cancel()
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    async def _acquire(self, on_queued=None, job: tuple | None = None):
+        """
+        None — получен слот рабочего процесса. Кортеж (future, номер) — голосовое забрал в свой пакет
+        другой запрос (см. _take_batch), результат придет в future. job — (аудио, длина) для пакета.
+        """
+        if self.active < max(1, Config.WHISPER_WORKERS) and not self.depth:
+            self.active += 1
+            self._waits.append(0.0)
+            return None
+        if self.depth >= Config.WHISPER_QUEUE_LIMIT:
+            self.rejected += 1
+            raise SpeechBusy()
+
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        if job is not None:
+            self._batchable[future] = job
+        self.max_depth = max(self.max_depth, self.depth)
+        last_position = None
+        try:
+            while True:
+                position = 1 + sum(1 for w in itertools.takewhile(lambda w: w is not future, self._waiters) if not w.done())
+                if on_queued and position != last_position:
+                    last_position = position
+                    try:
+                        await on_queued(position)
+                    except Exception as e:
+                        logger.debug(f"Не удалось показать место в очереди: {e}")
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), timeout=3.0)
+                    break
+                except asyncio.TimeoutError:
+                    continue
+        except BaseException:
+            if future.done() and not future.cancelled() and future.result() is None:
+                self._release()  # Слот уже передали нам, но ждать перестали — отдаем следующему
+            else:
+                future.cancel()
+            raise
+        finally:
+            if future in self._waiters:
+                self._waiters.remove(future)
+            self._batchable.pop(future, None)
+        self._waits.append(time.monotonic() - started)
+        return future.result()
+
+    def _release(self):
+        # Слот передается первому ждущему напрямую, счетчик active не меняется
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _release_when_done(self, call: asyncio.Future):
+        """Процесс еще считает брошенную задачу — слот занят, пока она не закончится"""
+        def done(f: asyncio.Future):
+            if not f.cancelled():
+                f.exception()  # Результат никому не нужен, но ошибку считаем прочитанной
+            self._release()
+        call.add_done_callback(done)
+
+    def _take_batch(self, limit: int) -> tuple[asyncio.Future | None, list[tuple]]:
+        """Забирает из очереди до limit коротких голосовых: они распознаются одним пакетом вместе с текущим"""
+        taken = [w for w in self._waiters if w in self._batchable and not w.done()][:limit]
+        if not taken:
+            return None, []
+        shared = asyncio.get_running_loop().create_future()
+        jobs = []
+        for number, future in enumerate(taken, start=1):
+            self._waiters.remove(future)
+            jobs.append(self._batchable.pop(future))
+            future.set_result((shared, number))
+        return shared, jobs
+
+    @staticmethod
+    def _batchable_job(audio: str | bytes, duration: float | None) -> tuple | None:
+        """В пакет идут только байты коротких голосовых (одно окно Whisper, 30 секунд)"""
+        if Config.WHISPER_BATCH_SIZE > 1 and isinstance(audio, bytes) and duration and duration <= BATCH_MAX_CLIP:
+            return audio, duration
+        return None
+
+    async def _run(self, audio: str | bytes, on_queued=None, duration: float | None = None) -> tuple[str, float | None, str]:
+        """(текст, длина аудио, модель)"""
+        job = self._batchable_job(audio, duration)
+        batched = await self._acquire(on_queued, job)
+        if batched is not None:
+            shared, number = batched
+            return (await shared)[number]
+
+        shared = None
+        call = None
+        try:
+            if not await self.ensure_ready():
+                return "", None, Config.WHISPER_MODEL
+            # Параметры выбираем в момент запуска: сколько голосовых ждет за этим — видно только сейчас
+            plan = choose_decode_plan(self.depth, duration)
+            jobs = []
+            if job is not None:
+                # Ждать попутчиков имеет смысл, только если есть очередь или все процессы заняты:
+                # иначе следующее голосовое просто займет свободный процесс
+                crowded = self.depth or self.active >= max(1, Config.WHISPER_WORKERS)
+                if Config.WHISPER_BATCH_WINDOW > 0 and crowded:
+                    await asyncio.sleep(Config.WHISPER_BATCH_WINDOW)  # Даем подойти голосовым, отправленным одновременно
+                shared, jobs = self._take_batch(Config.WHISPER_BATCH_SIZE - 1)
+            self.jobs += 1 + len(jobs)
+            self.plans[plan.policy] = self.plans.get(plan.policy, 0) + 1 + len(jobs)
+            loop = asyncio.get_running_loop()
+            if jobs:
+                call = loop.run_in_executor(
+                    self.pool, _transcribe_batch, [audio] + [a for a, _ in jobs], plan.options(), plan.model
+                )
+            else:
+                call = loop.run_in_executor(self.pool, _transcribe_audio, audio, plan.options(), plan.model)
+            try:
+                # shield: по таймауту отменяется только ожидание, задача в процессе остается учтенной
+                result = await asyncio.wait_for(asyncio.shield(call), timeout=Config.WHISPER_TIMEOUT)
+            except asyncio.TimeoutError:
+                # Процесс досчитает задачу впустую, но пользователь ждать не будет (слот освободится после)
+                self.timed_out += 1
+                raise
+            except BrokenProcessPool as e:
+                self._reset(str(e))
+                raise
+
+            if not jobs:
+                text, took, duration = result
+                self._runs.append(took)
+                self._audio.append(duration)
+                return text, duration, plan.model
+
+            items, took = result
+            self.batches += 1
+            self.batched_clips += len(items)
+            self._runs.append(took)
+            self._audio.append(sum(d for _, d in items))
+            results = [(text, d, plan.model) for text, d in items]
+            shared.set_result(results)
+            return results[0]
+        except Exception as e:
+            self.errors += 1
+            if shared is not None and not shared.done():
+                shared.set_exception(e)
+            raise
+        finally:
+            if shared is not None and not shared.done():
+                # Ведущий запрос отменили — пакет не досчитан, остальные получат обычную ошибку распознавания
+                shared.set_exception(RuntimeError("пакет распознавания прерван"))
+            if call is not None and not call.done():
+                self._release_when_done(call)
+            else:
+                self._release()
+
+    def stats(self) -> dict:
+        runs = sorted(self._runs)
+        waits = sorted(self._waits)
+        audio = sum(self._audio)
+        return {
+            "state": self.state,
+            "model": Config.WHISPER_MODEL,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+            "workers": max(1, Config.WHISPER_WORKERS),
+            "active": self.active,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "jobs": self.jobs,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else None,
+            "run_avg": sum(runs) / len(runs) if runs else None,
+            "run_p95": runs[min(len(runs) - 1, int(len(runs) * 0.95))] if runs else None,
+            # Во сколько раз распознавание быстрее длины аудио
+            "realtime_factor": audio / sum(runs) if runs and sum(runs) else None,
+            "plans": dict(self.plans),
+            "batches": self.batches,
+            "batched_clips": self.batched_clips,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+    async def _transcribe(self, file_data, on_queued=None, duration: float | None = None) -> tuple[str, float | None, str]:
+        if isinstance(file_data, io.IOBase):
+            file_data = file_data.read()
+        if not isinstance(file_data, (str, bytes)) or not file_data:
+            return "", None, Config.WHISPER_MODEL
+        try:
+            # В процесс уходят сырые байты (их мало), PCM получается уже там
+            return await self._run(file_data, on_queued, duration)
+        except SpeechBusy:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка распознавания голоса: {e}")
+            return "", None, Config.WHISPER_MODEL
+
+    async def transcribe(self, file_data, on_queued=None, duration: float | None = None) -> str:
+        """
+        Путь к файлу, байты или BytesIO с OGG (как отдает bot.download). Пустая строка — распознать не вышло.
+        duration — длина аудио, если известна заранее (от нее зависит choose_decode_plan).
+        SpeechBusy — очередь заполнена, хендлер отвечает BUSY_TEXT.
+        """
+        text, _, _ = await self._transcribe(file_data, on_queued, duration)
+        return text
+
+    async def transcribe_voice(self, bot, voice, on_queued=None) -> str:
+        """
+        Голосовое из Telegram: сначала ищем текст в кэше по file_unique_id (пересланные копии и повтор
+        после сбоя ИИ отвечают сразу, даже без скачивания), иначе скачиваем в память и распознаем.
+        """
+        # БД импортируем здесь: модуль грузится и в рабочих процессах Whisper, им база не нужна
+        from database.database import async_session
+        from database.crud import VoiceTranscriptCRUD
+
+        key = voice.file_unique_id
+        try:
+            async with async_session() as session:
+                cached = await VoiceTranscriptCRUD.get(session, key)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached.text
+        except Exception as e:
+            logger.error(f"Кэш голосовых недоступен: {e}")
+        self.cache_misses += 1
+
+        audio = await bot.download(voice)
+        text, duration, model = await self._transcribe(audio, on_queued, duration=voice.duration)
+        if text:
+            try:
+                async with async_session() as session:
+                    await VoiceTranscriptCRUD.save(session, key, text, duration=duration, model=model)
+                    await VoiceTranscriptCRUD.evict(session, Config.WHISPER_CACHE_SIZE)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить распознанное голосовое: {e}")
+        return text
+
+
+speech = SpeechRecognizer()
@@ -0,0 +1,156 @@
+import re
+import html
+from dataclasses import dataclass, field
+
+from services.program_schema import WorkoutProgram
+
+
+# ==========================================
+# ПРОВЕРКА НЕДЕЛЬНОЙ ПРОГРАММЫ ПОСЛЕ ГЕНЕРАЦИИ
+# ==========================================
+# Модель иногда присылает 5-6 дней вместо 7, склеивает два дня в одну страницу (пропущен
+# ===PAGE_BREAK===) или забывает советы. Раньше это либо показывалось как есть, либо
+# пользователь тратил еще одну генерацию. Здесь страницы раскладываются по номерам дней,
+# а AIManager.complete_workout_pages досоставляет только недостающие дни коротким запросом.
+
+TOTAL_DAYS = 7
+
+# Заголовок дня: "📅 <b>18.10, День 1 (Суббота) — ...</b>" (иногда без 📅 и без даты)
+DAY_HEADER_RE = re.compile(r"^\s*(?:📅|(?:<b>)?\s*(?:\d{1,2}\.\d{1,2},?\s*)?День\s+\d+)", re.IGNORECASE)
+DAY_NUMBER_RE = re.compile(r"День\s+(\d+)", re.IGNORECASE)
+TIPS_HEADER_RE = re.compile(r"^\s*(?:💡|(?:<b>)?\s*Советы тренера)", re.IGNORECASE)
+REST_RE = re.compile(r"ВОССТАНОВЛЕНИЕ|ОТДЫХ|ВЫХОДНОЙ", re.IGNORECASE)
+EXERCISE_RE = re.compile(r"<code>|<b>\s*\d+\.\s*</b>")
+CODE_RE = re.compile(r"<code>(.*?)</code>", re.DOTALL)
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _split_blocks(pages: list[str]) -> list[str]:
+    """Разрезает склеенные страницы по заголовкам дней и советов"""
+    blocks = []
+    for page in pages:
+        current = []
+        for line in str(page or "").split("\n"):
+            if current and (DAY_HEADER_RE.match(line) or TIPS_HEADER_RE.match(line)):
+                blocks.append("\n".join(current).strip())
+                current = []
+            current.append(line)
+        if current:
+            blocks.append("\n".join(current).strip())
+    return [b for b in blocks if b]
+
+
+def _plain(text: str) -> str:
+    return html.unescape(TAG_RE.sub("", text)).strip()
+
+
+@dataclass
+class WorkoutCheck:
+    workout_days: int = 3
+    days: dict[int, str] = field(default_factory=dict)  # номер дня -> страница
+    rest_days: set[int] = field(default_factory=set)
+    broken: set[int] = field(default_factory=set)        # тренировочный день без упражнений
+    tips: str | None = None
+    dropped: int = 0                                     # куски без заголовка дня (вступления и т.п.)
+
+    @property
+    def missing(self) -> list[int]:
+        """Дни, которые нужно досоставить: отсутствующие и битые"""
+        return [n for n in range(1, TOTAL_DAYS + 1) if n not in self.days or n in self.broken]
+
+    @property
+    def training_needed(self) -> int:
+        """Сколько из недостающих дней должны быть тренировочными, чтобы вышло workout_days"""
+        good_training = len([n for n in self.days if n not in self.rest_days and n not in self.broken])
+        return max(0, min(len(self.missing), self.workout_days - good_training))
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing and self.tips is not None
+
+    def describe(self) -> str:
+        problems = []
+        absent = [n for n in self.missing if n not in self.broken]
+        if absent:
+            problems.append(f"нет дней {', '.join(map(str, absent))}")
+        if self.broken:
+            problems.append(f"дни без упражнений {', '.join(map(str, sorted(self.broken)))}")
+        if self.tips is None:
+            problems.append("нет советов")
+        rest_expected = TOTAL_DAYS - self.workout_days
+        if not self.missing and len(self.rest_days) != rest_expected:
+            problems.append(f"дней отдыха {len(self.rest_days)} вместо {rest_expected}")
+        return "; ".join(problems) or "в порядке"
+
+    def summary(self) -> str:
+        """Готовые дни для промпта досоставления: заголовок и названия упражнений, без техники"""
+        lines = []
+        for number in sorted(self.days):
+            if number in self.broken:
+                continue
+            page = self.days[number]
+            header = _plain(page.split("\n", 1)[0])
+            names = [_plain(n) for n in CODE_RE.findall(page)]
+            lines.append(f"{header}: {', '.join(names)}" if names else header)
+        return "\n".join(lines)
+
+    def merge(self, other: "WorkoutCheck"):
+        """Подставляет досоставленные дни и советы. Уже готовые дни не трогаем."""
+        for number in self.missing:
+            if number in other.days and number not in other.broken:
+                self.days[number] = other.days[number]
+                self.broken.discard(number)
+                if number in other.rest_days:
+                    self.rest_days.add(number)
+                else:
+                    self.rest_days.discard(number)
+        if self.tips is None:
+            self.tips = other.tips
+
+    def pages(self) -> list[str]:
+        pages = [self.days[n] for n in sorted(self.days) if n not in self.broken]
+        if self.tips:
+            pages.append(self.tips)
+        return pages
+
+
+def check_workout_pages(pages: list[str], workout_days: int) -> WorkoutCheck:
+    """Раскладывает текстовые страницы по номерам дней и находит недостающие/битые"""
+    check = WorkoutCheck(workout_days=int(workout_days or 3))
+    last_number = 0
+    for block in _split_blocks(pages):
+        first_line = block.split("\n", 1)[0]
+        if TIPS_HEADER_RE.match(first_line):
+            check.tips = check.tips or block
+            continue
+        if not DAY_HEADER_RE.match(first_line):
+            check.dropped += 1
+            continue
+
+        match = DAY_NUMBER_RE.search(first_line)
+        number = int(match.group(1)) if match else last_number + 1
+        if not 1 <= number <= TOTAL_DAYS or number in check.days:
+            number = last_number + 1  # Сбитая нумерация: считаем по порядку
+        if not 1 <= number <= TOTAL_DAYS or number in check.days:
+            check.dropped += 1
+            continue
+        last_number = number
+
+        check.days[number] = block
+        if REST_RE.search(first_line):
+            check.rest_days.add(number)
+        elif not EXERCISE_RE.search(block):
+            check.broken.add(number)
+    return check
+
+
+def check_workout_program(program: WorkoutProgram, workout_days: int) -> WorkoutCheck:
+    """То же для JSON-режима: дни уже разобраны, проверяем только комплектность"""
+    check = WorkoutCheck(workout_days=int(workout_days or 3))
+    for day in program.days:
+        if 1 <= day.number <= TOTAL_DAYS and day.number not in check.days:
+            check.days[day.number] = day.render()
+            if day.rest:
+                check.rest_days.add(day.number)
+    check.tips = program.render_tips() if program.tips else None
+    return check
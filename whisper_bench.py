@@ -0,0 +1,93 @@
+import os
+import sys
+import glob
+import argparse
+
+from config import Config
+from services.transcription import DecodePlan, BATCH_MAX_CLIP, _init_worker, _transcribe_audio, _transcribe_batch
+
+# ==========================================
+# СРАВНЕНИЕ РЕЖИМОВ РАСПОЗНАВАНИЯ: СКОРОСТЬ ПРОТИВ ТОЧНОСТИ
+# ==========================================
+# Набор: папка с голосовыми (*.ogg / *.oga / *.wav) и эталонными расшифровками рядом (то же имя, .txt).
+# Для каждого режима choose_decode_plan считаем среднее время и WER (доля ошибочных слов),
+# отдельно — пакетное распознавание коротких голосовых (_transcribe_batch) пачками по WHISPER_BATCH_SIZE.
+# Запуск: python whisper_bench.py --fixtures fixtures/voice --fast-model tiny
+
+
+def words(text: str) -> list[str]:
+    text = text.lower().replace("ё", "е")
+    return "".join(ch if ch.isalnum() or ch.isspace() else " " for ch in text).split()
+
+
+def wer(reference: str, hypothesis: str) -> float:
+    """Расстояние Левенштейна по словам, деленное на длину эталона"""
+    ref, hyp = words(reference), words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1] / len(ref)
+
+
+def load_fixtures(folder: str) -> list[tuple[str, bytes, str]]:
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(folder, "*"))):
+        stem, ext = os.path.splitext(path)
+        if ext.lower() not in (".ogg", ".oga", ".wav") or not os.path.exists(stem + ".txt"):
+            continue
+        with open(path, "rb") as f, open(stem + ".txt", encoding="utf-8") as ref:
+            fixtures.append((os.path.basename(path), f.read(), ref.read().strip()))
+    return fixtures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Скорость и точность режимов Whisper на наборе голосовых")
+    parser.add_argument("--fixtures", default="fixtures/voice")
+    parser.add_argument("--fast-model", default=Config.WHISPER_FAST_MODEL, help="Модель для режима под нагрузкой")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"В {args.fixtures} нет пар 'голосовое + .txt с эталоном'")
+        sys.exit(1)
+
+    _init_worker(Config.WHISPER_MODEL, Config.WHISPER_DEVICE, Config.WHISPER_COMPUTE_TYPE, Config.WHISPER_CPU_THREADS)
+    plans = [
+        DecodePlan("full", Config.WHISPER_MODEL, Config.WHISPER_BEAM_SIZE),
+        DecodePlan("short", Config.WHISPER_MODEL, 1),
+    ]
+    if args.fast_model:
+        plans.append(DecodePlan("busy", args.fast_model, 1))
+
+    print(f"--- WHISPER: {len(fixtures)} голосовых, {Config.WHISPER_CPU_THREADS} потоков ---")
+    for plan in plans:
+        _transcribe_audio(fixtures[0][1], plan.options(), plan.model)  # Прогрев (и загрузка быстрой модели)
+        took, audio, errors = 0.0, 0.0, []
+        for name, data, reference in fixtures:
+            text, seconds, duration = _transcribe_audio(data, plan.options(), plan.model)
+            took += seconds
+            audio += duration
+            errors.append(wer(reference, text))
+        print(f"  {plan.policy:<6} {plan.model:<8} beam={plan.beam_size}: "
+              f"ср. {took / len(fixtures):.2f}с, x{audio / took if took else 0:.1f} к реальному времени, "
+              f"WER {sum(errors) / len(errors) * 100:.1f}%")
+
+    # Пакеты: те же голосовые по WHISPER_BATCH_SIZE за проход (жадный поиск, основная модель).
+    # Пачки, где есть голосовое длиннее окна Whisper, пропускаем — в боте они в пакет не попадают.
+    plan = DecodePlan("batch", Config.WHISPER_MODEL, 1)
+    took, audio, errors = 0.0, 0.0, []
+    for start in range(0, len(fixtures), max(2, Config.WHISPER_BATCH_SIZE)):
+        group = fixtures[start:start + max(2, Config.WHISPER_BATCH_SIZE)]
+        items, seconds = _transcribe_batch([data for _, data, _ in group], plan.options(), plan.model)
+        if any(duration > BATCH_MAX_CLIP for _, duration in items):
+            continue
+        took += seconds
+        audio += sum(duration for _, duration in items)
+        errors += [wer(reference, text) for (_, _, reference), (text, _) in zip(group, items)]
+    if errors:
+        print(f"  batch  {plan.model:<8} beam=1: ср. {took / len(errors):.2f}с на голосовое, "
+              f"x{audio / took if took else 0:.1f} к реальному времени, WER {sum(errors) / len(errors) * 100:.1f}%")
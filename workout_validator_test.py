@@ -0,0 +1,79 @@
+from services.workout_validator import check_workout_pages
+
+# Проверка раскладки недельной программы по дням: склейки, сбитая нумерация, пропуски, советы и досоставление.
+# Запуск: python workout_validator_test.py
+
+
+def day(n: int, rest: bool = False, title: str | None = None) -> str:
+    if rest:
+        return f"📅 <b>18.10, День {n} (Суббота) — ВОССТАНОВЛЕНИЕ</b>\nПрогулка 30-40 минут, растяжка."
+    return (
+        f"📅 <b>18.10, День {n} (Суббота) — {title or 'Верх тела'}</b>\n"
+        f"<b>1.</b> <code>Жим гантелей лежа</code> — 3x12\n<b>2.</b> <code>Тяга гантели в наклоне</code> — 3x12"
+    )
+
+
+TIPS = "💡 <b>Советы тренера</b>\nСпи 7-8 часов, пей воду."
+# 3 тренировки: дни 1, 3, 5, остальные — отдых
+WEEK = [day(n, rest=n not in (1, 3, 5)) for n in range(1, 8)]
+
+# (описание, страницы, ожидания: дни, дни отдыха, недостающие, есть ли советы)
+FIXTURES = [
+    ("Полная неделя", WEEK + [TIPS], ([1, 2, 3, 4, 5, 6, 7], [2, 4, 6, 7], [], True)),
+    ("Два дня склеены в одну страницу", [WEEK[0], WEEK[1] + "\n" + WEEK[2]] + WEEK[3:] + [TIPS],
+     ([1, 2, 3, 4, 5, 6, 7], [2, 4, 6, 7], [], True)),
+    ("Советы приклеены к последнему дню", WEEK[:6] + [WEEK[6] + "\n\n" + TIPS],
+     ([1, 2, 3, 4, 5, 6, 7], [2, 4, 6, 7], [], True)),
+    ("Повторный 'День 2' считается следующим по порядку", [WEEK[0], WEEK[1], day(2, title="Низ тела")] + WEEK[3:] + [TIPS],
+     ([1, 2, 3, 4, 5, 6, 7], [2, 4, 6, 7], [], True)),
+    ("Нет дней 6 и 7", WEEK[:5] + [TIPS], ([1, 2, 3, 4, 5], [2, 4], [6, 7], True)),
+    ("Нет советов", WEEK, ([1, 2, 3, 4, 5, 6, 7], [2, 4, 6, 7], [], False)),
+    ("Тренировочный день без упражнений", [WEEK[0], WEEK[1], "📅 <b>День 3 — Ноги</b>\nСегодня ноги."] + WEEK[3:] + [TIPS],
+     ([1, 2, 3, 4, 5, 6, 7], [2, 4, 6, 7], [3], True)),
+    ("Вступление без заголовка дня отбрасывается", ["Вот твоя программа на неделю!"] + WEEK + [TIPS],
+     ([1, 2, 3, 4, 5, 6, 7], [2, 4, 6, 7], [], True)),
+]
+
+
+def check():
+    print("--- ПРОВЕРКА НЕДЕЛЬНОЙ ПРОГРАММЫ ---")
+    failed = 0
+    for name, pages, expected in FIXTURES:
+        result = check_workout_pages(pages, workout_days=3)
+        got = (sorted(result.days), sorted(result.rest_days), result.missing, result.tips is not None)
+        if got != expected:
+            failed += 1
+            print(f"❌ {name}\n   ждали: {expected}\n   вышло: {got} ({result.describe()})")
+
+    # Склеенные дни не должны тянуть за собой чужие упражнения
+    glued = check_workout_pages([WEEK[0] + "\n" + WEEK[1]], workout_days=3)
+    if "ВОССТАНОВЛЕНИЕ" in glued.days.get(1, "") or "<code>" in glued.days.get(2, ""):
+        failed += 1
+        print("❌ Склеенная страница разрезана не по заголовку дня")
+
+    # Досоставление: готовые дни остаются, недостающие и битые подставляются, советы добавляются
+    base = check_workout_pages([WEEK[0], WEEK[1], "📅 <b>День 3 — Ноги</b>\nСегодня ноги.", WEEK[3]], workout_days=3)
+    if base.training_needed != 2:
+        failed += 1
+        print(f"❌ Нужно досоставить 2 тренировочных дня, вышло {base.training_needed}")
+    extra = check_workout_pages(
+        [day(1, title="Чужой день"), day(3, title="Ноги")] + WEEK[4:] + [TIPS], workout_days=3
+    )
+    base.merge(extra)
+    if not base.ok or base.days[1] != WEEK[0] or "Ноги" not in base.days[3]:
+        failed += 1
+        print(f"❌ merge: {base.describe()}, день 1 заменен: {base.days.get(1) != WEEK[0]}")
+    if sorted(base.rest_days) != [2, 4, 6, 7] or len(base.pages()) != 8:
+        failed += 1
+        print(f"❌ merge: дни отдыха {sorted(base.rest_days)}, страниц {len(base.pages())}")
+
+    incomplete = check_workout_pages(WEEK[:5], workout_days=3)
+    print(f"Пример: {incomplete.describe()}")
+    print(f"Проверено случаев: {len(FIXTURES) + 4}, ошибок: {failed}")
+    if failed:
+        raise SystemExit(1)
+    print("✅ Раскладка программы совпадает с ожиданиями.")
+
+
+if __name__ == "__main__":
+    check()